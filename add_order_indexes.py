@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Database Index Migration Script
+Adds the orders, order_items and stock_adjustments indexes declared in models.py
+"""
+
+import sqlite3
+import os
+import sys
+import time
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex
+
+from models import Order, OrderItem, StockAdjustment
+
+def index_statements():
+    """(name, CREATE INDEX IF NOT EXISTS ...) for every index on the indexed tables"""
+    statements = []
+    for model in (Order, OrderItem, StockAdjustment):
+        for index in sorted(model.__table__.indexes, key=lambda index: index.name):
+            ddl = CreateIndex(index, if_not_exists=True).compile(dialect=sqlite.dialect())
+            statements.append((index.name, str(ddl).strip()))
+    return statements
+
+def add_order_indexes(db_path='lanaim_pos_phase1.db'):
+    """Create missing indexes and refresh the planner statistics"""
+    
+    if not os.path.exists(db_path):
+        print(f"Error: Database file {db_path} not found!")
+        return False
+    
+    # Backup database first, through SQLite so pages still in the WAL are included
+    backup_path = f"{db_path}.backup"
+    try:
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(backup_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        print(f"✅ Database backed up to {backup_path}")
+    except Exception as e:
+        print(f"⚠️  Could not create backup: {e}")
+        response = input("Continue without backup? (y/N): ")
+        if response.lower() != 'y':
+            return False
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        
+        print("🔍 Checking existing indexes...")
+        
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        existing = {row[0] for row in cursor.fetchall()}
+        
+        to_create = [(name, ddl) for name, ddl in index_statements() if name not in existing]
+        
+        if to_create:
+            print(f"📝 Creating indexes: {[name for name, _ in to_create]}")
+            
+            for name, ddl in to_create:
+                started = time.perf_counter()
+                cursor.execute(ddl)
+                print(f"✅ Created {name} ({time.perf_counter() - started:.2f}s)")
+            
+            # Row counts per index for the query planner
+            cursor.execute("ANALYZE")
+            
+            conn.commit()
+            print("✅ Indexes created successfully!")
+        
+        else:
+            print("ℹ️  All indexes already exist")
+        
+        # Verify the changes
+        for table in ('orders', 'order_items', 'stock_adjustments', 'feedback'):
+            cursor.execute(f"PRAGMA index_list({table})")
+            print(f"{table}: {[row[1] for row in cursor.fetchall()]}")
+        
+        conn.close()
+        return True
+    
+    except Exception as e:
+        print(f"❌ Index migration failed: {e}")
+        print(f"ℹ️  Database backup kept at {backup_path}")
+        return False
+
+if __name__ == "__main__":
+    print("🛠️  LanAim POS Index Migration")
+    print("=" * 50)
+    
+    success = add_order_indexes(sys.argv[1] if len(sys.argv) > 1 else 'lanaim_pos_phase1.db')
+    
+    if success:
+        print("\n✅ Migration completed successfully!")
+        print("You can now start the application.")
+    else:
+        print("\n❌ Migration failed!")
+        print("Please check the error messages above.")
+        sys.exit(1)
@@ -16,7 +16,8 @@ import os
 from config import config
 
 # Import models and database
-from models import db, init_db, User
+from models import db, init_db, User, Menu, MenuOptionGroup, MenuOptionItem, DeliveryZone
+from caching import invalidate_on_commit
 
 # Initialize extensions
 login_manager = LoginManager()
@@ -73,6 +74,14 @@ def init_extensions(app):
         """Load user for Flask-Login"""
         return db.session.get(User, int(user_id))
     
+    # Drop cached menu payloads whenever catalog rows are committed
+    invalidate_on_commit({
+        Menu: ['menu'],
+        MenuOptionGroup: ['menu'],
+        MenuOptionItem: ['menu'],
+        DeliveryZone: ['menu']
+    })
+    
     # Initialize SocketIO for real-time features (using threading for Python 3.13 compatibility)
     socketio.init_app(
         app, 
@@ -6,7 +6,7 @@ Integrates all production-ready components into the main Flask application
 import os
 import logging
 from datetime import datetime
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, send_from_directory
 from flask_migrate import Migrate
 from flask_login import LoginManager
 
@@ -15,8 +15,11 @@ from config_production import ProductionConfig
 from security import SecurityManager, security_manager, admin_required
 from backup import BackupManager, backup_manager
 from notifications import NotificationManager, notification_manager
-from caching import CacheManager, cache_manager
+from caching import CacheManager, cache_manager, cache_warmer, invalidate_on_commit
 from monitoring import PerformanceMonitor, performance_monitor
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics_exporter
+from shared_metrics import shared_metrics
+from sqlite_profile import sqlite_profile
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +73,9 @@ def create_production_app():
         db.create_all()
         logger.info("Database tables created")
     
+    # Fill menu, zone, option and dashboard caches before traffic needs them
+    cache_warmer.warm_startup()
+    
     return app
 
 def init_production_components(app):
@@ -95,12 +101,26 @@ def init_production_components(app):
     
     # Initialize cache manager
     cache_manager.init_app(app)
+    cache_warmer.init_app(app)
+    from models import Menu, MenuOptionGroup, MenuOptionItem, DeliveryZone
+    invalidate_on_commit({
+        Menu: ['menu'],
+        MenuOptionGroup: ['menu'],
+        MenuOptionItem: ['menu'],
+        DeliveryZone: ['menu']
+    })
     logger.info("Cache manager initialized")
     
     # Initialize performance monitor
     performance_monitor.init_app(app)
+    metrics_exporter.init_app(app)
+    shared_metrics.init_app(app, performance_monitor)
     logger.info("Performance monitor initialized")
     
+    # Apply SQLite pragmas to new connections
+    from models import db
+    sqlite_profile.init_app(app, db)
+    
     # Setup production logging
     setup_production_logging(app)
 
@@ -180,9 +200,20 @@ def register_production_routes(app):
     def health_check():
         """Health check endpoint for load balancers"""
         health_status = performance_monitor.get_health_status()
-        status_code = 200 if health_status['status'] in ['excellent', 'good'] else 503
+        health_status['cache_warmup'] = cache_warmer.get_status()
+        health_status['ready'] = cache_warmer.ready
+        # Not ready while the startup warm-up is still filling caches
+        healthy = health_status['status'] in ['excellent', 'good'] and cache_warmer.ready
+        status_code = 200 if healthy else 503
         return jsonify(health_status), status_code
     
+    @app.route('/metrics')
+    def metrics():
+        """Runtime metrics in Prometheus text format for scraping"""
+        if not metrics_exporter.is_authorized(request):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return app.response_class(metrics_exporter.render(), mimetype=METRICS_CONTENT_TYPE)
+    
     @app.route('/admin/system-status')
     @admin_required
     def system_status():
@@ -194,6 +225,12 @@ def register_production_routes(app):
             
             from models import db
             db_stats = backup_manager._get_database_stats()
+            if sqlite_profile.enabled:
+                db_stats['sqlite'] = sqlite_profile.get_status()
+            
+            if shared_metrics.enabled:
+                # Every worker on this node, not just the one serving this call
+                performance_report['node'] = shared_metrics.get_node_report()
             
             return jsonify({
                 'performance': performance_report,
@@ -207,6 +244,45 @@ def register_production_routes(app):
             logger.error(f"System status error: {e}")
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/admin/slow-requests')
+    @admin_required
+    def slow_requests():
+        """Slowest recent requests with their DB, template, cache and serialization time"""
+        endpoint = request.args.get('endpoint')
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({
+            'requests': performance_monitor.get_slow_requests(endpoint, limit),
+            'default_threshold': performance_monitor.slow_threshold,
+            'thresholds': performance_monitor.slow_thresholds
+        })
+    
+    @app.route('/admin/profiling', methods=['GET', 'POST'])
+    @admin_required
+    def profiling():
+        """Profiling status, or set an endpoint's sample rate and mint a request token"""
+        profiler = performance_monitor.profiler
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            try:
+                if data.get('endpoint'):
+                    profiler.set_sample_rate(data['endpoint'], float(data.get('rate', 0)))
+                token_ttl = int(data.get('token_ttl', 300))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'rate and token_ttl must be numbers'}), 400
+            return jsonify({
+                'token': profiler.make_token(token_ttl),
+                'header': profiler.TOKEN_HEADER,
+                'sample_rates': profiler.sample_rates
+            })
+        return jsonify(profiler.get_status())
+    
+    @app.route('/admin/profiling/<path:filename>')
+    @admin_required
+    def download_profile(filename):
+        """Download a collapsed-stack profile"""
+        profile_dir = os.path.abspath(performance_monitor.profiler.profile_dir)
+        return send_from_directory(profile_dir, filename, as_attachment=True)
+    
     @app.route('/admin/clear-cache', methods=['POST'])
     @admin_required
     def clear_cache():
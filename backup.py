@@ -104,10 +104,17 @@ class BackupManager:
             backup_filename = f"backup_{backup_type}_{timestamp}.db.gz"
             backup_filepath = os.path.join(self.backup_path, backup_filename)
             
-            # Create compressed backup
-            with open(self.db_path, 'rb') as f_in:
-                with gzip.open(backup_filepath, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+            # Create compressed backup from a consistent snapshot, the file
+            # alone misses pages still in the WAL
+            snapshot_path = backup_filepath[:-len('.gz')] + '.tmp'
+            try:
+                self._copy_database(self.db_path, snapshot_path)
+                with open(snapshot_path, 'rb') as f_in:
+                    with gzip.open(backup_filepath, 'wb') as f_out:
+                        shutil.copyfileobj(f_in, f_out)
+            finally:
+                if os.path.exists(snapshot_path):
+                    os.remove(snapshot_path)
                     
             # Create metadata file
             metadata = {
@@ -171,12 +178,19 @@ class BackupManager:
                 
             # Create backup of current database
             current_backup = f"pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-            shutil.copy2(self.db_path, os.path.join(self.backup_path, current_backup))
+            self._copy_database(self.db_path, os.path.join(self.backup_path, current_backup))
             
-            # Restore from compressed backup
-            with gzip.open(backup_filepath, 'rb') as f_in:
-                with open(self.db_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+            # Restore from compressed backup through SQLite, so open
+            # connections and the WAL see the restored pages
+            restore_path = os.path.join(self.backup_path, f"{current_backup}.restore")
+            try:
+                with gzip.open(backup_filepath, 'rb') as f_in:
+                    with open(restore_path, 'wb') as f_out:
+                        shutil.copyfileobj(f_in, f_out)
+                self._copy_database(restore_path, self.db_path)
+            finally:
+                if os.path.exists(restore_path):
+                    os.remove(restore_path)
                     
             logger.info(f"Database restored from: {backup_filename}")
             return True
@@ -184,6 +198,42 @@ class BackupManager:
         except Exception as e:
             logger.error(f"Error restoring database: {str(e)}")
             return False
+    
+    def _copy_database(self, source_path, target_path):
+        """Copy a SQLite database with the online backup API"""
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    
+    def _get_database_stats(self):
+        """Database file size and row count per table, for the system status page"""
+        try:
+            if not self.db_path or not os.path.exists(self.db_path):
+                return {'status': 'unavailable'}
+            
+            conn = sqlite3.connect(self.db_path)
+            try:
+                tables = [row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+                )]
+                row_counts = {
+                    table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                    for table in tables
+                }
+            finally:
+                conn.close()
             
+            return {
+                'status': 'operational',
+                'size': os.path.getsize(self.db_path),
+                'tables': row_counts
+            }
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+
 # Global backup manager instance
 backup_manager = BackupManager()
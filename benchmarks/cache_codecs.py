@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Cache Codec Benchmark
+Compares encode/decode time and stored bytes of the CacheSerializer codecs
+
+Payloads mimic what the application caches: the active menu returned by
+/api/menu and a 30 day sales report with its order rows.
+
+Usage:
+    python benchmarks/cache_codecs.py [--repeat 200]
+"""
+
+import os
+import sys
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from caching import CacheSerializer, msgpack
+
+CATEGORIES = ['อาหารจานเดียว', 'ต้มและแกง', 'ผัดและทอด', 'เครื่องดื่ม', 'ของหวาน']
+DISHES = ['ผัดไทยกุ้ง', 'ต้มยำกุ้ง', 'ข้าวผัดหมู', 'ผัดกะเพราหมู', 'แกงเขียวหวานไก่', 'น้ำมะนาว']
+
+
+def build_menu_payload(items=120):
+    """Shape of the /api/menu response"""
+    rng = random.Random(42)
+    return {
+        'success': True,
+        'menu': [
+            {
+                'id': i,
+                'name': f"{rng.choice(DISHES)} {i}",
+                'description': 'เมนูยอดนิยม รสชาติเข้มข้น ใช้วัตถุดิบสดใหม่ทุกวัน',
+                'price': float(rng.randrange(35, 250)),
+                'category': rng.choice(CATEGORIES),
+                'image_url': f"/static/images/menu/{i:04d}.jpg"
+            }
+            for i in range(items)
+        ]
+    }
+
+
+def build_sales_report_payload(days=30, orders_per_day=60):
+    """Shape of the sales report data handed to the template"""
+    rng = random.Random(7)
+    start = datetime(2025, 7, 1)
+    orders = []
+    daily = []
+    for day in range(days):
+        date = start + timedelta(days=day)
+        revenue = 0.0
+        for n in range(orders_per_day):
+            total = round(rng.uniform(80, 900), 2)
+            revenue += total
+            orders.append({
+                'order_number': f"LA{date:%Y%m%d}-{n + 1:03d}",
+                'customer_name': 'ลูกค้าทั่วไป',
+                'status': rng.choice(['delivered', 'completed', 'cancelled']),
+                'payment_method': rng.choice(['COD', 'TOD']),
+                'total_price': total,
+                'created_at': (date + timedelta(minutes=n * 7)).isoformat()
+            })
+        daily.append({'date': date.strftime('%Y-%m-%d'), 'orders': orders_per_day, 'revenue': round(revenue, 2)})
+
+    return {
+        'summary': {
+            'total_orders': len(orders),
+            'total_revenue': round(sum(o['total_price'] for o in orders), 2),
+            'avg_order_value': round(sum(o['total_price'] for o in orders) / len(orders), 2)
+        },
+        'daily': daily,
+        'hourly': {hour: rng.randrange(0, 40) for hour in range(10, 22)},
+        'top_items': [{'menu_id': i, 'name': DISHES[i % len(DISHES)], 'quantity': 500 - i * 7} for i in range(20)],
+        'orders': orders
+    }
+
+
+def benchmark(serializer, payload, repeat):
+    """Return (encode µs, decode µs, stored bytes) for one payload"""
+    encoded = serializer.dumps(payload)
+    encode_time = min(timeit.repeat(lambda: serializer.dumps(payload), number=repeat, repeat=3)) / repeat
+    decode_time = min(timeit.repeat(lambda: serializer.loads(encoded), number=repeat, repeat=3)) / repeat
+    return encode_time * 1e6, decode_time * 1e6, len(encoded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200, help='iterations per measurement')
+    args = parser.parse_args()
+
+    payloads = {
+        'get_menu': build_menu_payload(),
+        'sales_report': build_sales_report_payload()
+    }
+
+    codecs = ['pickle', 'json'] + (['msgpack'] if msgpack else [])
+    compressions = ['none', 'zlib', 'lz4']
+
+    print("📦 LanAim POS cache codec benchmark")
+    if not msgpack:
+        print("ℹ️  msgpack not installed, skipping msgpack codec")
+
+    for payload_name, payload in payloads.items():
+        print(f"\n{payload_name}")
+        print(f"{'codec':<10}{'compression':<13}{'encode µs':>12}{'decode µs':>12}{'bytes':>10}")
+        print("-" * 57)
+        for codec in codecs:
+            for compression in compressions:
+                serializer = CacheSerializer(codec=codec, compression=compression, compress_threshold=1024)
+                if compression != 'none' and (serializer.compressor is None or serializer.compressor.name != compression):
+                    continue  # Optional compressor not installed
+                encode_us, decode_us, size = benchmark(serializer, payload, args.repeat)
+                print(f"{codec:<10}{compression:<13}{encode_us:>12.1f}{decode_us:>12.1f}{size:>10,}")
+
+
+if __name__ == '__main__':
+    main()
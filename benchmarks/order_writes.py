@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Order Write Benchmark
+Orders per second when inserting items one at a time versus with OrderWriter
+
+"per-line" adds and flushes every item and option like the order routes
+used to, "bulk" sends all items in one INSERT ... RETURNING and all
+options in one executemany. Both number the order from OrderSequence and
+commit once, on a SQLite file database with the production profile.
+
+Usage:
+    python benchmarks/order_writes.py [--orders 300]
+"""
+
+import os
+import sys
+import argparse
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+
+from models import db, Menu, MenuOptionGroup, MenuOptionItem, Order, OrderItem, OrderItemOption
+from order_writer import OrderWriter
+from sqlite_profile import SQLiteProfile, sqlite_engine_options
+
+BASKETS = {
+    'typical': (4, 1),  # lines, options per line
+    'large': (40, 2)
+}
+
+
+def build_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
+    db.init_app(app)
+    SQLiteProfile().init_app(app, db)
+
+    with app.app_context():
+        db.create_all()
+        for i in range(40):
+            db.session.add(Menu(name=f"เมนู {i}", price=50 + i, category='อาหารจานเดียว'))
+        db.session.flush()
+        group = MenuOptionGroup(menu_id=1, name='ระดับความเผ็ด')
+        db.session.add(group)
+        db.session.flush()
+        for i in range(4):
+            db.session.add(MenuOptionItem(group_id=group.id, name=f"ตัวเลือก {i}", additional_price=5 * i))
+        db.session.commit()
+    return app
+
+
+def build_lines(lines, options):
+    return [
+        OrderWriter.item_row(
+            n % 40 + 1, f"เมนู {n % 40}", 50 + n % 40, n % 3 + 1, None,
+            [(o + 1, f"ตัวเลือก {o}", 5 * o) for o in range(options)]
+        )
+        for n in range(lines)
+    ]
+
+
+def new_order(lines):
+    order = Order(
+        customer_name='ลูกค้าทดสอบ',
+        customer_phone='0812345678',
+        delivery_address_details='123 ถนนทดสอบ',
+        total_price=sum(float(line['price_per_item']) * line['quantity'] for line in lines),
+        payment_method='COD'
+    )
+    order.generate_order_number()
+    return order
+
+
+def write_per_line(lines):
+    order = new_order(lines)
+    db.session.add(order)
+    db.session.flush()
+    for line in lines:
+        item = OrderItem(
+            order_id=order.id, menu_id=line['menu_id'], menu_name=line['menu_name'],
+            price_per_item=line['price_per_item'], quantity=line['quantity'],
+            special_requests=line['special_requests']
+        )
+        db.session.add(item)
+        db.session.flush()
+        for option in line['options']:
+            db.session.add(OrderItemOption(order_item_id=item.id, **option))
+    db.session.commit()
+
+
+def write_bulk(lines):
+    OrderWriter.write(new_order(lines), lines)
+
+
+def run(app, writer, lines, orders):
+    """Returns (orders/s, statements per order)"""
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            started = time.perf_counter()
+            for _ in range(orders):
+                writer(lines)
+            elapsed = time.perf_counter() - started
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+            db.session.remove()
+    return orders / elapsed, statements[0] / orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=300, help='orders per measurement')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='lanaim_bench_writes_')
+    try:
+        app = build_app(os.path.join(workdir, 'orders.db'))
+
+        print("🧾 LanAim POS order write benchmark")
+        print(f"{args.orders} orders per measurement\n")
+        print(f"{'basket':<10}{'lines':>7}{'options':>9}{'writer':>10}{'orders/s':>11}{'stmts/order':>13}")
+        print("-" * 60)
+        for basket, (lines, options) in BASKETS.items():
+            order_lines = build_lines(lines, options)
+            for name, writer in (('per-line', write_per_line), ('bulk', write_bulk)):
+                throughput, statements = run(app, writer, order_lines, args.orders)
+                print(f"{basket:<10}{lines:>7}{lines * options:>9}{name:>10}{throughput:>11.1f}{statements:>13.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+SQLite Order Placement Benchmark
+Concurrent order throughput with the old engine options and with the SQLite profile
+
+Each worker thread places orders the way POST /api/order does: take the
+next order number from the day's OrderSequence, insert the order and its
+items, commit.
+
+"baseline" uses the previous pool_size=20 options with SQLite's default
+rollback journal, "profile" uses sqlite_engine_options, the connection
+pragmas and the 'database is locked' retries.
+
+Usage:
+    python benchmarks/sqlite_orders.py [--threads 8] [--orders 50] [--items 3]
+"""
+
+import os
+import sys
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from models import db, Menu, Order, OrderItem
+from sqlite_profile import SQLiteProfile, sqlite_engine_options
+
+BASELINE_ENGINE_OPTIONS = {
+    'pool_size': 20,
+    'pool_recycle': 300,
+    'pool_pre_ping': True,
+    'pool_timeout': 30
+}
+
+
+def build_app(db_path, mode):
+    """App on a fresh database file, returns (app, profile or None)"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = (
+        sqlite_engine_options() if mode == 'profile' else dict(BASELINE_ENGINE_OPTIONS)
+    )
+    db.init_app(app)
+
+    profile = None
+    if mode == 'profile':
+        profile = SQLiteProfile()
+        profile.init_app(app, db)
+
+    with app.app_context():
+        db.create_all()
+        for i in range(10):
+            db.session.add(Menu(name=f"เมนู {i}", price=50 + i * 10, category='อาหารจานเดียว'))
+        db.session.commit()
+    return app, profile
+
+
+def place_order(items):
+    order = Order(
+        customer_name='ลูกค้าทดสอบ',
+        customer_phone='0812345678',
+        delivery_address_details='123 ถนนทดสอบ',
+        total_price=sum(60 * (n + 1) for n in range(items)),
+        payment_method='COD'
+    )
+    order.generate_order_number()
+    db.session.add(order)
+    db.session.flush()
+    for n in range(items):
+        db.session.add(OrderItem(
+            order_id=order.id, menu_id=n % 10 + 1, menu_name=f"เมนู {n % 10}",
+            price_per_item=60, quantity=n + 1
+        ))
+    db.session.commit()
+    return order
+
+
+def run(mode, threads, orders, items):
+    """Returns (orders/s, p50 ms, p99 ms, placed, failures Counter, retries)"""
+    workdir = tempfile.mkdtemp(prefix=f'lanaim_bench_{mode}_')
+    try:
+        app, profile = build_app(os.path.join(workdir, 'orders.db'), mode)
+        place = profile.retry_on_locked(place_order) if profile else place_order
+        latencies = []
+        failures = Counter()
+        lock = threading.Lock()
+        start_gate = threading.Barrier(threads)
+
+        def worker():
+            with app.app_context():
+                start_gate.wait()
+                for _ in range(orders):
+                    started = time.perf_counter()
+                    try:
+                        place(items)
+                    except Exception as e:
+                        db.session.rollback()
+                        with lock:
+                            failures[type(e).__name__] += 1
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+                db.session.remove()
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            db.engine.dispose()
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0
+        retries = profile.stats['retries'] if profile else 0
+        return len(latencies) / elapsed, p50, p99, len(latencies), failures, retries
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent order writers')
+    parser.add_argument('--orders', type=int, default=50, help='orders per thread')
+    parser.add_argument('--items', type=int, default=3, help='items per order')
+    args = parser.parse_args()
+
+    print("🗄️  LanAim POS SQLite order placement benchmark")
+    print(f"{args.threads} threads x {args.orders} orders, {args.items} items each\n")
+    print(f"{'mode':<10}{'orders/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'placed':>8}{'retries':>9}  failures")
+    print("-" * 72)
+    for mode in ('baseline', 'profile'):
+        throughput, p50, p99, placed, failures, retries = run(mode, args.threads, args.orders, args.items)
+        failed = ', '.join(f"{name} x{count}" for name, count in failures.most_common()) or '-'
+        print(f"{mode:<10}{throughput:>10.1f}{p50:>10.1f}{p99:>10.1f}{placed:>8}{retries:>9}  {failed}")
+
+
+if __name__ == '__main__':
+    main()
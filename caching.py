@@ -6,148 +6,1399 @@ Redis-based caching with fallback to in-memory caching
 import json
 import pickle
 import hashlib
-from datetime import datetime, timedelta
+import heapq
+import itertools
+import sys
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for_futures
+from contextlib import contextmanager
+from datetime import datetime
 from functools import wraps
 import logging
 
 try:
-    import redis
+    import msgpack
 except ImportError:
-    redis = None
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+from monitoring import add_request_timing
+from redis_connection import REDIS_OUTAGE_ERRORS, CircuitBreaker, RedisConnection
 
 logger = logging.getLogger(__name__)
 
+class _CacheEntry:
+    """Single value held by the in-process backend"""
+    
+    __slots__ = ('value', 'expires_at', 'size', 'tags')
+    
+    def __init__(self, value, expires_at, size, tags=()):
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+
+class MemoryBackend:
+    """Bounded in-process cache with O(1) LRU eviction and lazy TTL expiry"""
+    
+    # Expired heap entries reclaimed per write, keeps set() O(log n) amortised
+    EXPIRE_BATCH = 64
+    
+    def __init__(self, max_entries=5000, max_bytes=64 * 1024 * 1024, on_store=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Optional callbacks (key, size), run under the backend lock
+        self.on_store = on_store
+        self.on_evict = on_evict
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> _CacheEntry, least recently used first
+        self._expiry_heap = []  # (expires_at, key), may hold superseded items
+        self._tags = {}  # tag -> set of keys carrying it
+        self._lock = threading.RLock()
+    
+    @staticmethod
+    def _estimate_size(key, value):
+        """Approximate the memory held by a cached value"""
+        try:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            size = sys.getsizeof(value)
+        return size + len(key)
+    
+    def get(self, key):
+        """Return a live value and mark it as recently used, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            return entry.value
+    
+    def get_many(self, keys):
+        """Return {key: value} for the live keys, under a single lock acquisition"""
+        found = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry.expires_at <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry.value
+        return found
+    
+    def set(self, key, value, timeout, tags=None):
+        """Store a value, evicting expired and least recently used entries"""
+        return self.set_many({key: value}, timeout, tags=tags) == 1
+    
+    def set_many(self, mapping, timeout, tags=None):
+        """Store several values under a single lock acquisition, returns the number stored"""
+        sized = []
+        for key, value in mapping.items():
+            size = self._estimate_size(key, value)
+            if size > self.max_bytes:
+                logger.warning(f"Cache value for {key} exceeds memory budget ({size} bytes), not cached")
+                self.delete(key)
+                continue
+            sized.append((key, value, size))
+        
+        if not sized:
+            return 0
+        
+        now = time.monotonic()
+        expires_at = now + timeout
+        tags = tuple(tags) if tags else ()
+        
+        with self._lock:
+            for key, value, size in sized:
+                if key in self._entries:
+                    self._remove(key)
+                
+                self._entries[key] = _CacheEntry(value, expires_at, size, tags)
+                self.current_bytes += size
+                for tag in tags:
+                    self._tags.setdefault(tag, set()).add(key)
+                heapq.heappush(self._expiry_heap, (expires_at, key))
+                if self.on_store:
+                    self.on_store(key, size)
+            
+            self._expire_due(now)
+            
+            while self._entries and (
+                len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes
+            ):
+                oldest_key = next(iter(self._entries))
+                evicted = self._remove(oldest_key)
+                self.evictions += 1
+                if self.on_evict:
+                    self.on_evict(oldest_key, evicted.size)
+            
+            # Superseded heap items pile up when hot keys are rewritten
+            if len(self._expiry_heap) > 2 * len(self._entries) + self.EXPIRE_BATCH:
+                self._expiry_heap = [(e.expires_at, k) for k, e in self._entries.items()]
+                heapq.heapify(self._expiry_heap)
+        
+        return len(sized)
+    
+    def delete(self, key):
+        """Remove a key, returns True if it was present"""
+        return bool(self.delete_many([key]))
+    
+    def delete_many(self, keys):
+        """Remove several keys, returns the keys that were present"""
+        deleted = []
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                    deleted.append(key)
+        return deleted
+    
+    def invalidate_tag(self, tag):
+        """Remove every entry carrying a tag, returns the number removed"""
+        with self._lock:
+            keys = self._tags.pop(tag, ())
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+            return len(keys)
+    
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap = []
+            self._tags.clear()
+            self.current_bytes = 0
+    
+    def keys(self):
+        """Snapshot of the cached keys"""
+        with self._lock:
+            return list(self._entries.keys())
+    
+    def __contains__(self, key):
+        return key in self._entries
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.size
+        for tag in entry.tags:
+            tagged = self._tags.get(tag)
+            if tagged is not None:
+                tagged.discard(key)
+                if not tagged:
+                    del self._tags[tag]
+        return entry
+    
+    def _expire_due(self, now):
+        """Reclaim a bounded number of expired entries from the heap"""
+        heap = self._expiry_heap
+        for _ in range(self.EXPIRE_BATCH):
+            if not heap or heap[0][0] > now:
+                break
+            expires_at, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                self._remove(key)
+                self.expirations += 1
+    
+    def get_stats(self):
+        """Get backend size and eviction counters"""
+        return {
+            'entries': len(self._entries),
+            'tags': len(self._tags),
+            'max_entries': self.max_entries,
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+class _Flight:
+    """An in-progress recomputation that other callers can wait on"""
+    
+    __slots__ = ('event', 'result', 'waiters')
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.waiters = 0
+
+class SoftEntry:
+    """Cached value with a soft expiry, served stale while it is refreshed"""
+    
+    __slots__ = ('value', 'fresh_until')
+    
+    def __init__(self, value, fresh_until):
+        self.value = value
+        self.fresh_until = fresh_until
+    
+    def __getstate__(self):
+        return (self.value, self.fresh_until)
+    
+    def __setstate__(self, state):
+        self.value, self.fresh_until = state
+    
+    def is_stale(self):
+        # Wall clock, entries are shared between processes through Redis
+        return time.time() >= self.fresh_until
+
+class PickleCodec:
+    """Handles any picklable value, the fallback for everything else"""
+    
+    name = 'pickle'
+    tag = b'p'
+    
+    def encode(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    
+    def decode(self, data):
+        return pickle.loads(data)
+
+class JSONCodec:
+    """Plain JSON data; tuples come back as lists and dict keys as strings"""
+    
+    name = 'json'
+    tag = b'j'
+    
+    def encode(self, value):
+        # No default hook: Decimal, datetime etc. raise TypeError and fall back
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    
+    def decode(self, data):
+        return json.loads(data.decode('utf-8'))
+
+class MsgpackCodec:
+    """Plain data via msgpack, round-trips like pickle for the types it accepts
+    
+    strict_types sends tuples and subclasses of the builtin types to the
+    default hook. Tuples get their own ext type, so they come back as
+    tuples rather than lists. Subclasses (OrderedDict, IntEnum, ...) raise
+    TypeError and fall back to pickle, keeping their type.
+    """
+    
+    name = 'msgpack'
+    tag = b'm'
+    SOFT_ENTRY_EXT = 1
+    TUPLE_EXT = 2
+    
+    def encode(self, value):
+        return msgpack.packb(value, use_bin_type=True, strict_types=True, default=self._encode_ext)
+    
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False, ext_hook=self._decode_ext)
+    
+    def _encode_ext(self, obj):
+        if isinstance(obj, SoftEntry):
+            return msgpack.ExtType(self.SOFT_ENTRY_EXT, self.encode([obj.value, obj.fresh_until]))
+        if type(obj) is tuple:
+            return msgpack.ExtType(self.TUPLE_EXT, self.encode(list(obj)))
+        raise TypeError(f"Cannot msgpack {type(obj).__name__}")
+    
+    def _decode_ext(self, code, data):
+        if code == self.SOFT_ENTRY_EXT:
+            value, fresh_until = self.decode(data)
+            return SoftEntry(value, fresh_until)
+        if code == self.TUPLE_EXT:
+            return tuple(self.decode(data))
+        return msgpack.ExtType(code, data)
+
+class ZlibCompressor:
+    name = 'zlib'
+    tag = b'z'
+    
+    def compress(self, data):
+        return zlib.compress(data, 3)
+    
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+class LZ4Compressor:
+    name = 'lz4'
+    tag = b'4'
+    
+    def compress(self, data):
+        return lz4_frame.compress(data)
+    
+    def decompress(self, data):
+        return lz4_frame.decompress(data)
+
+class CacheSerializer:
+    """Encodes cached values for Redis with a pluggable codec and compression
+    
+    Every payload starts with a codec tag byte and a compression tag byte
+    so entries written with different settings can coexist while a
+    deployment migrates. Values the preferred codec cannot represent fall
+    back to pickle, and untagged legacy pickles are still readable.
+    
+    pickle is the default: on the menu and report payloads it decodes about
+    twice as fast as msgpack and is a third of the size before compression
+    (see benchmarks/cache_codecs.py). msgpack and json are opt-in.
+    """
+    
+    NO_COMPRESSION = b'-'
+    LEGACY_PICKLE = 0x80  # First byte of a protocol 2+ pickle
+    
+    def __init__(self, codec='pickle', compression='zlib', compress_threshold=1024):
+        self.codecs = {codec_cls.tag: codec_cls() for codec_cls in (PickleCodec, JSONCodec, MsgpackCodec)}
+        self.compressors = {compressor.tag: compressor for compressor in (ZlibCompressor(), LZ4Compressor())}
+        self.fallback = self.codecs[PickleCodec.tag]
+        self.codec = self._resolve_codec(codec)
+        self.compressor = self._resolve_compressor(compression)
+        self.compress_threshold = compress_threshold
+        self.stats = {
+            'encoded': {},
+            'fallbacks': 0,
+            'compressed': 0,
+            'raw_bytes': 0,
+            'stored_bytes': 0
+        }
+        self._stats_lock = threading.Lock()  # dumps() runs on request and refresh threads
+    
+    def _resolve_codec(self, name):
+        if name == 'msgpack' and not msgpack:
+            logger.warning("msgpack not installed, caching with pickle")
+            name = 'pickle'
+        for codec in self.codecs.values():
+            if codec.name == name:
+                return codec
+        raise ValueError(f"Unknown cache codec: {name}")
+    
+    def _resolve_compressor(self, name):
+        if not name or name == 'none':
+            return None
+        if name == 'lz4' and not lz4_frame:
+            logger.warning("lz4 not installed, compressing cache values with zlib")
+            name = 'zlib'
+        for compressor in self.compressors.values():
+            if compressor.name == name:
+                return compressor
+        raise ValueError(f"Unknown cache compression: {name}")
+    
+    def dumps(self, value):
+        """Encode a value into a tagged payload"""
+        codec = self.codec
+        fallback = False
+        try:
+            data = codec.encode(value)
+        except (TypeError, ValueError, OverflowError):
+            codec = self.fallback
+            data = codec.encode(value)
+            fallback = True
+        
+        raw_size = len(data)
+        compression_tag = self.NO_COMPRESSION
+        if self.compressor and raw_size >= self.compress_threshold:
+            compressed = self.compressor.compress(data)
+            if len(compressed) < raw_size:
+                data = compressed
+                compression_tag = self.compressor.tag
+        
+        with self._stats_lock:
+            encoded = self.stats['encoded']
+            encoded[codec.name] = encoded.get(codec.name, 0) + 1
+            if fallback:
+                self.stats['fallbacks'] += 1
+            if compression_tag != self.NO_COMPRESSION:
+                self.stats['compressed'] += 1
+            self.stats['raw_bytes'] += raw_size
+            self.stats['stored_bytes'] += len(data) + 2
+        return codec.tag + compression_tag + data
+    
+    def loads(self, payload):
+        """Decode a tagged payload, or an untagged legacy pickle"""
+        if payload[0] == self.LEGACY_PICKLE:
+            return pickle.loads(payload)
+        
+        codec = self.codecs[payload[0:1]]
+        data = payload[2:]
+        compression_tag = payload[1:2]
+        if compression_tag != self.NO_COMPRESSION:
+            data = self.compressors[compression_tag].decompress(data)
+        return codec.decode(data)
+    
+    def get_stats(self):
+        """Get codec usage and compression ratio"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+            stats['encoded'] = dict(self.stats['encoded'])
+        stats['codec'] = self.codec.name
+        stats['compression'] = self.compressor.name if self.compressor else None
+        stats['compression_ratio'] = round(
+            stats['stored_bytes'] / stats['raw_bytes'], 3
+        ) if stats['raw_bytes'] > 0 else 1.0
+        return stats
+
+class BackgroundRefresher:
+    """Runs stale-while-revalidate refreshes on a small bounded thread pool"""
+    
+    def __init__(self, max_workers=2, max_pending=32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            'scheduled': 0,
+            'completed': 0,
+            'failures': 0,
+            'dropped': 0,
+            'duplicates': 0,
+            'total_duration': 0.0,
+            'max_duration': 0.0,
+            'last_error': None
+        }
+    
+    def schedule(self, key, refresh):
+        """Queue refresh() for key unless it is already queued or the queue is full"""
+        with self._lock:
+            if key in self._pending:
+                self.stats['duplicates'] += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.stats['dropped'] += 1
+                return False
+            self._pending.add(key)
+            self.stats['scheduled'] += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='cache-refresh'
+                )
+        
+        # Refresh functions usually query the database, keep the app context
+        app = None
+        try:
+            from flask import current_app, has_app_context
+            if has_app_context():
+                app = current_app._get_current_object()
+        except ImportError:
+            pass
+        
+        self._executor.submit(self._run, key, refresh, app)
+        return True
+    
+    def _run(self, key, refresh, app):
+        started = time.monotonic()
+        try:
+            if app is not None:
+                with app.app_context():
+                    refresh()
+            else:
+                refresh()
+            succeeded = True
+        except Exception as e:
+            logger.error(f"Background cache refresh failed for {key}: {e}")
+            succeeded = False
+            error = str(e)
+        
+        duration = time.monotonic() - started
+        with self._lock:
+            self._pending.discard(key)
+            self.stats['total_duration'] += duration
+            self.stats['max_duration'] = max(self.stats['max_duration'], duration)
+            if succeeded:
+                self.stats['completed'] += 1
+            else:
+                self.stats['failures'] += 1
+                self.stats['last_error'] = error
+    
+    def shutdown(self, wait=True):
+        """Stop the worker threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+    
+    def get_stats(self):
+        """Get refresh counters and durations"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['queued'] = len(self._pending)
+        finished = stats['completed'] + stats['failures']
+        stats['avg_duration'] = round(stats['total_duration'] / finished, 4) if finished > 0 else 0
+        stats['max_pending'] = self.max_pending
+        return stats
+
+class CacheStats:
+    """Cache counters kept in striped shards and per key namespace, summed when read
+    
+    A thread records into the shard picked by its ident, under that shard's
+    lock, so increments are never lost and threads rarely wait on each
+    other. The number of shards is fixed, so short-lived threads and
+    greenlets leave nothing behind. The namespace is the part of the key
+    before the first colon ('menu_items', 'analytics', ...).
+    """
+    
+    COUNTERS = ('hits', 'misses', 'sets', 'deletes', 'evictions', 'l1_hits', 'l1_evictions', 'bytes_written')
+    # Latency histogram upper bounds in seconds, the last bucket catches the rest
+    LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, float('inf'))
+    
+    def __init__(self, stripes=16):
+        self._shards = [
+            {'lock': threading.Lock(), 'counters': {}, 'latency': {}, 'events': {}}
+            for _ in range(stripes)
+        ]
+    
+    @staticmethod
+    def namespace(key):
+        """Namespace of a caller-facing key"""
+        if isinstance(key, str):
+            return key.split(':', 1)[0]
+        return 'hashed'
+    
+    def _shard(self):
+        return self._shards[threading.get_ident() % len(self._shards)]
+    
+    def incr(self, namespace, counter, amount=1):
+        """Add to a per-namespace counter"""
+        shard = self._shard()
+        with shard['lock']:
+            counters = shard['counters']
+            namespace_counters = counters.get(namespace)
+            if namespace_counters is None:
+                namespace_counters = counters[namespace] = dict.fromkeys(self.COUNTERS, 0)
+            namespace_counters[counter] += amount
+    
+    def event(self, name, amount=1):
+        """Add to a counter that has no namespace (tag invalidations, ...)"""
+        shard = self._shard()
+        with shard['lock']:
+            events = shard['events']
+            events[name] = events.get(name, 0) + amount
+    
+    def observe(self, namespace, operation, seconds):
+        """Record the latency of one cache operation"""
+        bucket = bisect_left(self.LATENCY_BUCKETS, seconds)
+        shard = self._shard()
+        with shard['lock']:
+            latency = shard['latency']
+            histogram = latency.get((namespace, operation))
+            if histogram is None:
+                histogram = latency[(namespace, operation)] = {
+                    'buckets': [0] * len(self.LATENCY_BUCKETS), 'count': 0, 'total': 0.0
+                }
+            histogram['buckets'][bucket] += 1
+            histogram['count'] += 1
+            histogram['total'] += seconds
+    
+    def _percentile_ms(self, buckets, count, quantile):
+        """Upper bound of the bucket holding the quantile, in milliseconds"""
+        target = quantile * count
+        seen = 0
+        for bound, bucket_count in zip(self.LATENCY_BUCKETS, buckets):
+            seen += bucket_count
+            if seen >= target:
+                break
+        if bound == float('inf'):
+            bound = self.LATENCY_BUCKETS[-2]
+        return round(bound * 1000, 2)
+    
+    def get_stats(self):
+        """Sum every shard into totals, events and per-namespace stats"""
+        namespaces = {}
+        latency = {}
+        events = {}
+        for shard in self._shards:
+            with shard['lock']:
+                for namespace, counters in shard['counters'].items():
+                    merged = namespaces.setdefault(namespace, dict.fromkeys(self.COUNTERS, 0))
+                    for counter, value in counters.items():
+                        merged[counter] += value
+                for (namespace, operation), histogram in shard['latency'].items():
+                    merged = latency.setdefault((namespace, operation), {
+                        'buckets': [0] * len(self.LATENCY_BUCKETS), 'count': 0, 'total': 0.0
+                    })
+                    for i, bucket_count in enumerate(histogram['buckets']):
+                        merged['buckets'][i] += bucket_count
+                    merged['count'] += histogram['count']
+                    merged['total'] += histogram['total']
+                for name, value in shard['events'].items():
+                    events[name] = events.get(name, 0) + value
+        
+        for (namespace, operation), histogram in latency.items():
+            count = histogram['count']
+            if not count:
+                continue
+            namespace_stats = namespaces.setdefault(namespace, dict.fromkeys(self.COUNTERS, 0))
+            namespace_stats.setdefault('latency_ms', {})[operation] = {
+                'count': count,
+                'avg': round(histogram['total'] / count * 1000, 3),
+                'p50': self._percentile_ms(histogram['buckets'], count, 0.50),
+                'p95': self._percentile_ms(histogram['buckets'], count, 0.95),
+                'p99': self._percentile_ms(histogram['buckets'], count, 0.99),
+                'histogram': {
+                    ('+Inf' if bound == float('inf') else f"{bound * 1000:g}"): bucket_count
+                    for bound, bucket_count in zip(self.LATENCY_BUCKETS, histogram['buckets'])
+                }
+            }
+        
+        totals = dict.fromkeys(self.COUNTERS, 0)
+        for namespace_stats in namespaces.values():
+            for counter in self.COUNTERS:
+                totals[counter] += namespace_stats[counter]
+            lookups = namespace_stats['hits'] + namespace_stats['misses']
+            namespace_stats['hit_rate'] = round(namespace_stats['hits'] / lookups * 100, 2) if lookups else 0
+        
+        return {'totals': totals, 'events': events, 'namespaces': namespaces}
+
 class CacheManager:
-    """Handles caching operations with Redis fallback to memory"""
+    """Handles caching operations with Redis fallback to memory
+    
+    With Redis available, hot keys (CACHE_L1_KEYS prefixes) are also kept
+    in a small per-process L1 in front of Redis. Every write publishes an
+    invalidation on CACHE_INVALIDATION_CHANNEL so other workers drop their
+    L1 copy.
+    
+    Without Redis (or while it is down) entries live in each worker's own
+    memory and an invalidation only reaches the worker that made it. Keys
+    tagged in CACHE_LOCAL_TAG_TTLS are then kept for at most that many
+    seconds, so a price or zone edit shows up in every worker shortly after.
+    """
+    
+    KEY_PREFIX = 'lanaim_cache:'
+    TAG_PREFIX = 'lanaim_cache_tag:'
+    LOCK_PREFIX = 'lanaim_cache_lock:'
+    # Release a recompute lease only if this worker still holds it
+    RELEASE_LEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+    # Redis set listing every key we wrote, lets clear() avoid KEYS scans
+    ALL_KEYS_TAG = '__all__'
+    # Drop tag set members whose keys have expired. Atomic, so a key being
+    # re-set between the check and the SREM keeps its membership
+    PRUNE_TAG_SCRIPT = """
+        local removed = 0
+        for _, member in ipairs(ARGV) do
+            if redis.call('exists', member) == 0 then
+                removed = removed + redis.call('srem', KEYS[1], member)
+            end
+        end
+        return removed
+    """
+    DEFAULT_L1_KEYS = ('menu_items', 'delivery_zones', 'menu_options')
+    DEFAULT_LOCAL_TAG_TTLS = {'menu': 10, 'zones': 10}
+    OUTAGE_KEYS_LIMIT = 10000
     
     def __init__(self, app=None):
         self.app = app
         self.redis_client = None
-        self.memory_cache = {}
-        self.cache_stats = {
-            'hits': 0,
-            'misses': 0,
-            'sets': 0,
-            'deletes': 0
+        self.connection = None
+        self.breaker = CircuitBreaker('Redis')
+        self.memory_cache = MemoryBackend()
+        # Writes served from memory while Redis was down, replayed on recovery
+        self._outage_writes = {'keys': set(), 'tags': set(), 'clear': False}
+        self._outage_lock = threading.Lock()
+        self.stats = CacheStats()
+        self.tag_ttl = 86400
+        # Tag sets outlive their members, prune them every tag_prune_every writes
+        self.tag_prune_every = 1000
+        self._tag_keys = set()
+        self._tag_writes = itertools.count(1)
+        self.local_tag_ttls = dict(self.DEFAULT_LOCAL_TAG_TTLS)
+        
+        self.refresher = BackgroundRefresher()
+        self.serializer = CacheSerializer()
+        
+        # Single-flight recomputation, see get_or_set()
+        self.lock_timeout = 30
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self.single_flight_stats = {
+            'leaders': 0,
+            'coalesced': 0,
+            'lease_waits': 0,
+            'wait_timeouts': 0,
+            'lock_wait_seconds': 0.0,
+            'max_lock_wait_seconds': 0.0
         }
         
+        # Per-process L1 tier, only used in front of Redis
+        self.l1_cache = None
+        self.l1_ttl = 60
+        self.l1_prefixes = ()
+        self.invalidation_channel = 'lanaim_cache:invalidate'
+        self.instance_id = uuid.uuid4().hex
+        self._invalidation_seq = 0
+        self._listener_thread = None
+        self._listener_connected = False
+        
     def init_app(self, app):
         """Initialize cache manager with Flask app"""
         self.app = app
+        self.memory_cache = MemoryBackend(
+            max_entries=app.config.get('CACHE_MEMORY_MAX_ENTRIES', 5000),
+            max_bytes=app.config.get('CACHE_MEMORY_MAX_BYTES', 64 * 1024 * 1024),
+            on_store=lambda cache_key, size: self.stats.incr(self._key_namespace(cache_key), 'bytes_written', size),
+            on_evict=lambda cache_key, size: self.stats.incr(self._key_namespace(cache_key), 'evictions')
+        )
+        self.tag_ttl = app.config.get('CACHE_TAG_TTL', 86400)
+        self.tag_prune_every = app.config.get('CACHE_TAG_PRUNE_EVERY', 1000)
+        self.local_tag_ttls = dict(app.config.get('CACHE_LOCAL_TAG_TTLS', self.DEFAULT_LOCAL_TAG_TTLS))
+        self.serializer = CacheSerializer(
+            codec=app.config.get('CACHE_CODEC', 'pickle'),
+            compression=app.config.get('CACHE_COMPRESSION', 'zlib'),
+            compress_threshold=app.config.get('CACHE_COMPRESS_THRESHOLD', 1024)
+        )
+        self.lock_timeout = app.config.get('CACHE_LOCK_TIMEOUT', 30)
+        self.refresher.shutdown(wait=False)
+        self.refresher = BackgroundRefresher(
+            max_workers=app.config.get('CACHE_REFRESH_WORKERS', 2),
+            max_pending=app.config.get('CACHE_REFRESH_QUEUE_SIZE', 32)
+        )
         
-        # Try to connect to Redis
-        redis_url = app.config.get('REDIS_URL')
-        if redis_url and redis_url != 'memory://' and redis:
-            try:
-                self.redis_client = redis.from_url(redis_url)
-                self.redis_client.ping()
+        # Shared pooled Redis client, the breaker falls back to memory while it is down
+        self.redis_client = None
+        self.connection = RedisConnection.from_app(app)
+        if self.connection:
+            self.redis_client = self.connection.client
+            self.breaker = self.connection.breaker
+            self.breaker.add_recovery_listener(self._replay_outage_writes)
+            if self.connection.check():
                 logger.info("Redis connected for caching")
-            except Exception as e:
-                logger.warning(f"Redis connection failed, using memory cache: {e}")
-                self.redis_client = None
+            else:
+                logger.warning("Redis connection failed, using memory cache until it recovers")
         else:
+            self.breaker = CircuitBreaker('Redis')
             logger.info("Using in-memory cache")
+        
+        if self.redis_client and app.config.get('CACHE_L1_ENABLED', True):
+            self.init_l1(app)
+    
+    def init_l1(self, app):
+        """Enable the per-process L1 tier and its invalidation listener"""
+        self.l1_cache = MemoryBackend(
+            max_entries=app.config.get('CACHE_L1_MAX_ENTRIES', 256),
+            max_bytes=app.config.get('CACHE_L1_MAX_BYTES', 8 * 1024 * 1024),
+            on_evict=lambda cache_key, size: self.stats.incr(self._key_namespace(cache_key), 'l1_evictions')
+        )
+        self.l1_ttl = app.config.get('CACHE_L1_TTL', 60)
+        self.l1_prefixes = tuple(
+            self.KEY_PREFIX + prefix
+            for prefix in app.config.get('CACHE_L1_KEYS', self.DEFAULT_L1_KEYS)
+        )
+        self.invalidation_channel = app.config.get('CACHE_INVALIDATION_CHANNEL', self.invalidation_channel)
+        
+        if self._listener_thread is None or not self._listener_thread.is_alive():
+            self._listener_thread = threading.Thread(
+                target=self._listen_for_invalidations,
+                daemon=True
+            )
+            self._listener_thread.start()
+        logger.info("L1 cache enabled in front of Redis")
+    
+    def _redis_available(self):
+        """True when Redis is configured and its circuit breaker allows calls"""
+        return self.redis_client is not None and self.breaker.allow_request()
+    
+    def _redis_error(self, error):
+        """Feed connection-level Redis failures to the circuit breaker"""
+        if self.redis_client is not None and isinstance(error, REDIS_OUTAGE_ERRORS):
+            self.breaker.record_failure(error)
+    
+    def _local_timeout(self, timeout, tags):
+        """Timeout for a process-local entry, capped for tags other workers must see change"""
+        caps = [self.local_tag_ttls[tag] for tag in tags or () if tag in self.local_tag_ttls]
+        return min([timeout] + caps)
+    
+    def _note_outage_write(self, keys=(), tags=(), clear=False):
+        """Remember a write served from memory so Redis can be corrected on recovery"""
+        if self.redis_client is None:
+            return
+        with self._outage_lock:
+            self._outage_writes['keys'].update(keys)
+            self._outage_writes['tags'].update(tags)
+            self._outage_writes['clear'] = self._outage_writes['clear'] or clear
+            if len(self._outage_writes['keys']) > self.OUTAGE_KEYS_LIMIT:
+                # Long outage, cheaper to drop everything than to track each key
+                self._outage_writes['keys'].clear()
+                self._outage_writes['clear'] = True
+    
+    def _replay_outage_writes(self):
+        """Drop Redis entries made stale by writes that happened during an outage"""
+        with self._outage_lock:
+            writes = self._outage_writes
+            self._outage_writes = {'keys': set(), 'tags': set(), 'clear': False}
+        
+        try:
+            if writes['clear']:
+                self._delete_tagged_keys(self._make_tag_key(self.ALL_KEYS_TAG), clear=True)
+            else:
+                for tag in writes['tags']:
+                    self._delete_tagged_keys(self._make_tag_key(tag), tags=[tag])
+                if writes['keys']:
+                    self.redis_client.delete(*writes['keys'])
+        except Exception as e:
+            logger.error(f"Cache outage replay error: {e}")
+            self._redis_error(e)
+        
+        # Anything cached while Redis was down now lives in Redis again
+        self.memory_cache.clear()
+        logger.info(f"Cache back on Redis, replayed {len(writes['keys'])} keys and {len(writes['tags'])} tags")
+    
+    def _use_l1(self, cache_key):
+        """L1 serves only hot keys, and only while invalidations are flowing"""
+        return (
+            self.l1_cache is not None
+            and self._listener_connected
+            and cache_key.startswith(self.l1_prefixes)
+        )
+    
+    def _publish_invalidation(self, pipe, **message):
+        """Queue an L1 invalidation for other workers on a Redis pipeline"""
+        if self.l1_cache is not None:
+            message['origin'] = self.instance_id
+            pipe.publish(self.invalidation_channel, json.dumps(message))
+    
+    def _listen_for_invalidations(self):
+        """Background thread applying invalidations published by other workers"""
+        retry_delay = 1
+        while self.redis_client is not None and self.l1_cache is not None:
+            pubsub = None
+            try:
+                client = self.connection.pubsub_client if self.connection else self.redis_client
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.invalidation_channel)
+                # Anything cached while we were disconnected may have missed an invalidation
+                self.l1_cache.clear()
+                self._listener_connected = True
+                retry_delay = 1
+                
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self._handle_invalidation(message['data'])
+                        
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener disconnected: {e}")
+            finally:
+                self._listener_connected = False
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 30)
+    
+    def _handle_invalidation(self, data):
+        """Drop L1 entries named in an invalidation message"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring malformed cache invalidation: {data!r}")
+            return
+        
+        if message.get('origin') == self.instance_id or self.l1_cache is None:
+            return
+        
+        self._invalidation_seq += 1
+        self.stats.event('invalidations_received')
+        
+        if message.get('clear') or message.get('tags'):
+            # L1 entries filled from Redis do not know their tags, and L1 is small
+            self.l1_cache.clear()
+        for cache_key in message.get('keys', []):
+            self.l1_cache.delete(cache_key)
     
     def _make_key(self, key):
         """Create a consistent cache key"""
         if isinstance(key, str):
-            return f"lanaim_cache:{key}"
+            return f"{self.KEY_PREFIX}{key}"
         else:
             # Hash complex keys
             key_str = json.dumps(key, sort_keys=True)
             key_hash = hashlib.md5(key_str.encode()).hexdigest()
-            return f"lanaim_cache:{key_hash}"
+            return f"{self.KEY_PREFIX}{key_hash}"
+    
+    def _key_namespace(self, cache_key):
+        """Namespace of a prefixed cache key, see CacheStats"""
+        key = cache_key[len(self.KEY_PREFIX):]
+        if len(key) == 32 and ':' not in key and all(c in '0123456789abcdef' for c in key):
+            return 'hashed'  # Non-string key, see _make_key()
+        return CacheStats.namespace(key)
+    
+    def _make_tag_key(self, tag):
+        """Redis set holding the cache keys that carry a tag"""
+        return f"{self.TAG_PREFIX}{tag}"
+    
+    def _add_to_tag_sets(self, pipe, cache_keys, tags, timeout):
+        """Queue SADDs of cache_keys to the all-keys set and each tag's set"""
+        tag_ttl = max(timeout, self.tag_ttl)
+        for tag in [self.ALL_KEYS_TAG] + list(tags or []):
+            tag_key = self._make_tag_key(tag)
+            self._tag_keys.add(tag_key)
+            pipe.sadd(tag_key, *cache_keys)
+            pipe.expire(tag_key, tag_ttl)
+        
+        # Every tag_prune_every writes, prune expired members in the background
+        if self.tag_prune_every and next(self._tag_writes) % self.tag_prune_every == 0:
+            self.refresher.schedule('__prune_tag_sets__', self.prune_tag_sets)
+    
+    def prune_tag_sets(self, batch_size=500):
+        """Remove members of the Redis tag sets whose keys no longer exist
+        
+        Keys expire on their own but stay listed in their tag sets, so sets
+        written continuously would otherwise grow without bound and make
+        clear() and invalidate_tag() delete every key ever written. Returns
+        the number of members removed.
+        """
+        if not self._redis_available():
+            return 0
+        
+        removed = 0
+        for tag_key in list(self._tag_keys):
+            batch = []
+            for member in self.redis_client.sscan_iter(tag_key, count=batch_size):
+                batch.append(member)
+                if len(batch) >= batch_size:
+                    removed += self.redis_client.eval(self.PRUNE_TAG_SCRIPT, 1, tag_key, *batch)
+                    batch = []
+            if batch:
+                removed += self.redis_client.eval(self.PRUNE_TAG_SCRIPT, 1, tag_key, *batch)
+        
+        self.stats.event('tag_members_pruned', removed)
+        return removed
     
     def get(self, key):
         """Get value from cache"""
         cache_key = self._make_key(key)
+        namespace = CacheStats.namespace(key)
+        started = time.perf_counter()
         
         try:
-            if self.redis_client:
-                # Try Redis first
-                value = self.redis_client.get(cache_key)
-                if value:
-                    self.cache_stats['hits'] += 1
-                    return pickle.loads(value)
+            if self._redis_available():
+                use_l1 = self._use_l1(cache_key)
+                if use_l1:
+                    value = self.l1_cache.get(cache_key)
+                    if value is not None:
+                        self.stats.incr(namespace, 'hits')
+                        self.stats.incr(namespace, 'l1_hits')
+                        return value
+                    
+                    # Fetch the remaining TTL alongside so L1 never outlives Redis
+                    seq = self._invalidation_seq
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    pipe.get(cache_key)
+                    pipe.pttl(cache_key)
+                    raw_value, ttl_ms = pipe.execute()
+                else:
+                    raw_value = self.redis_client.get(cache_key)
+                
+                if raw_value:
+                    value = self.serializer.loads(raw_value)
+                    # Skip the L1 fill if an invalidation raced with the Redis read
+                    if use_l1 and ttl_ms and ttl_ms > 0 and seq == self._invalidation_seq:
+                        self.l1_cache.set(cache_key, value, min(self.l1_ttl, ttl_ms / 1000.0))
+                    self.stats.incr(namespace, 'hits')
+                    return value
             else:
                 # Use memory cache
-                if cache_key in self.memory_cache:
-                    cached_item = self.memory_cache[cache_key]
-                    
-                    # Check expiration
-                    if cached_item['expires_at'] > datetime.now():
-                        self.cache_stats['hits'] += 1
-                        return cached_item['value']
-                    else:
-                        # Remove expired item
-                        del self.memory_cache[cache_key]
+                value = self.memory_cache.get(cache_key)
+                if value is not None:
+                    self.stats.incr(namespace, 'hits')
+                    return value
             
-            self.cache_stats['misses'] += 1
+            self.stats.incr(namespace, 'misses')
             return None
             
         except Exception as e:
             logger.error(f"Cache get error: {e}")
-            self.cache_stats['misses'] += 1
+            self._redis_error(e)
+            self.stats.incr(namespace, 'misses')
             return None
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats.observe(namespace, 'get', elapsed)
+            add_request_timing('cache', elapsed)
     
-    def set(self, key, value, timeout=3600):
-        """Set value in cache with timeout in seconds"""
+    def set(self, key, value, timeout=3600, tags=None):
+        """Set value in cache with timeout in seconds
+        
+        Tags group related keys so they can be dropped together with
+        invalidate_tag() instead of scanning the keyspace.
+        """
         cache_key = self._make_key(key)
+        namespace = CacheStats.namespace(key)
+        started = time.perf_counter()
         
         try:
-            if self.redis_client:
-                # Use Redis
-                pickled_value = pickle.dumps(value)
-                self.redis_client.setex(cache_key, timeout, pickled_value)
-            else:
-                # Use memory cache
-                expires_at = datetime.now() + timedelta(seconds=timeout)
-                self.memory_cache[cache_key] = {
-                    'value': value,
-                    'expires_at': expires_at
-                }
+            if self._redis_available():
+                # Use Redis, registering the key in its tag sets in the same round trip
+                encoded_value = self.serializer.dumps(value)
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.setex(cache_key, timeout, encoded_value)
+                self._add_to_tag_sets(pipe, [cache_key], tags, timeout)
+                self._publish_invalidation(pipe, keys=[cache_key])
+                self._invalidation_seq += 1
+                pipe.execute()
+                self.stats.incr(namespace, 'bytes_written', len(encoded_value))
                 
-                # Clean old items from memory cache
-                self._cleanup_memory_cache()
+                if self._use_l1(cache_key):
+                    self.l1_cache.set(cache_key, value, min(timeout, self.l1_ttl))
+            else:
+                # Use memory cache, bytes are counted by the backend's on_store hook
+                self._note_outage_write(keys=[cache_key])
+                if not self.memory_cache.set(cache_key, value, self._local_timeout(timeout, tags), tags=tags):
+                    return False
             
-            self.cache_stats['sets'] += 1
+            self.stats.incr(namespace, 'sets')
             return True
             
         except Exception as e:
             logger.error(f"Cache set error: {e}")
+            self._redis_error(e)
             return False
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stats.observe(namespace, 'set', elapsed)
+            add_request_timing('cache', elapsed)
     
     def delete(self, key):
         """Delete value from cache"""
         cache_key = self._make_key(key)
         
         try:
-            if self.redis_client:
-                result = self.redis_client.delete(cache_key)
-                deleted = result > 0
+            if self._redis_available():
+                if self.l1_cache is not None:
+                    self._invalidation_seq += 1
+                    self.l1_cache.delete(cache_key)
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.delete(cache_key)
+                pipe.srem(self._make_tag_key(self.ALL_KEYS_TAG), cache_key)  # Tag sets are left to prune_tag_sets()
+                self._publish_invalidation(pipe, keys=[cache_key])
+                deleted = pipe.execute()[0] > 0
             else:
-                deleted = cache_key in self.memory_cache
-                if deleted:
-                    del self.memory_cache[cache_key]
+                self._note_outage_write(keys=[cache_key])
+                deleted = self.memory_cache.delete(cache_key)
             
             if deleted:
-                self.cache_stats['deletes'] += 1
+                self.stats.incr(CacheStats.namespace(key), 'deletes')
             
             return deleted
             
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
+            self._redis_error(e)
             return False
     
+    def get_many(self, keys):
+        """Get several values in one round trip, returns {key: value} for the hits
+        
+        Redis lookups go out as a single pipelined MGET (plus PTTLs for L1
+        keys), memory lookups take the backend lock once.
+        """
+        cache_keys = {self._make_key(key): key for key in keys}
+        found = {}
+        started = time.perf_counter()
+        
+        try:
+            if self._redis_available():
+                pending = []
+                for cache_key, key in cache_keys.items():
+                    if self._use_l1(cache_key):
+                        value = self.l1_cache.get(cache_key)
+                        if value is not None:
+                            found[key] = value
+                            self.stats.incr(CacheStats.namespace(key), 'l1_hits')
+                            continue
+                    pending.append(cache_key)
+                
+                if pending:
+                    l1_keys = [cache_key for cache_key in pending if self._use_l1(cache_key)]
+                    seq = self._invalidation_seq
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    pipe.mget(pending)
+                    for cache_key in l1_keys:
+                        pipe.pttl(cache_key)
+                    results = pipe.execute()
+                    ttls = dict(zip(l1_keys, results[1:]))
+                    
+                    for cache_key, raw_value in zip(pending, results[0]):
+                        if not raw_value:
+                            continue
+                        value = self.serializer.loads(raw_value)
+                        ttl_ms = ttls.get(cache_key)
+                        # Skip the L1 fill if an invalidation raced with the Redis read
+                        if ttl_ms and ttl_ms > 0 and seq == self._invalidation_seq:
+                            self.l1_cache.set(cache_key, value, min(self.l1_ttl, ttl_ms / 1000.0))
+                        found[cache_keys[cache_key]] = value
+            else:
+                for cache_key, value in self.memory_cache.get_many(cache_keys).items():
+                    found[cache_keys[cache_key]] = value
+        
+        except Exception as e:
+            logger.error(f"Cache get_many error: {e}")
+            self._redis_error(e)
+        
+        elapsed = time.perf_counter() - started
+        namespaces = set()
+        for key in cache_keys.values():
+            namespace = CacheStats.namespace(key)
+            namespaces.add(namespace)
+            self.stats.incr(namespace, 'hits' if key in found else 'misses')
+        for namespace in namespaces:
+            self.stats.observe(namespace, 'get_many', elapsed)
+        add_request_timing('cache', elapsed)
+        return found
+    
+    def set_many(self, mapping, timeout=3600, tags=None):
+        """Set several values with the same timeout and tags in one round trip"""
+        if not mapping:
+            return True
+        
+        items = {self._make_key(key): value for key, value in mapping.items()}
+        namespaces = {cache_key: CacheStats.namespace(key) for cache_key, key in zip(items, mapping)}
+        started = time.perf_counter()
+        
+        try:
+            if self._redis_available():
+                pipe = self.redis_client.pipeline(transaction=False)
+                for cache_key, value in items.items():
+                    encoded_value = self.serializer.dumps(value)
+                    pipe.setex(cache_key, timeout, encoded_value)
+                    self.stats.incr(namespaces[cache_key], 'bytes_written', len(encoded_value))
+                self._add_to_tag_sets(pipe, list(items), tags, timeout)
+                self._publish_invalidation(pipe, keys=list(items))
+                self._invalidation_seq += 1
+                pipe.execute()
+                
+                for cache_key, value in items.items():
+                    if self._use_l1(cache_key):
+                        self.l1_cache.set(cache_key, value, min(timeout, self.l1_ttl))
+                stored = len(items)
+            else:
+                self._note_outage_write(keys=items)
+                stored = self.memory_cache.set_many(items, self._local_timeout(timeout, tags), tags=tags)
+            
+            if stored == len(items):
+                for namespace in namespaces.values():
+                    self.stats.incr(namespace, 'sets')
+            return stored == len(items)
+        
+        except Exception as e:
+            logger.error(f"Cache set_many error: {e}")
+            self._redis_error(e)
+            return False
+        finally:
+            elapsed = time.perf_counter() - started
+            for namespace in set(namespaces.values()):
+                self.stats.observe(namespace, 'set_many', elapsed)
+            add_request_timing('cache', elapsed)
+    
+    def delete_many(self, keys):
+        """Delete several keys in one round trip, returns the number deleted"""
+        cache_keys = {self._make_key(key): key for key in keys}
+        if not cache_keys:
+            return 0
+        
+        try:
+            if self._redis_available():
+                if self.l1_cache is not None:
+                    self._invalidation_seq += 1
+                    self.l1_cache.delete_many(cache_keys)
+                # One DEL per key so deletions can be attributed to namespaces
+                pipe = self.redis_client.pipeline(transaction=False)
+                for cache_key in cache_keys:
+                    pipe.delete(cache_key)
+                pipe.srem(self._make_tag_key(self.ALL_KEYS_TAG), *cache_keys)
+                self._publish_invalidation(pipe, keys=list(cache_keys))
+                results = pipe.execute()
+                deleted = [cache_key for cache_key, removed in zip(cache_keys, results) if removed]
+            else:
+                self._note_outage_write(keys=cache_keys)
+                deleted = self.memory_cache.delete_many(cache_keys)
+            
+            for cache_key in deleted:
+                self.stats.incr(CacheStats.namespace(cache_keys[cache_key]), 'deletes')
+            return len(deleted)
+        
+        except Exception as e:
+            logger.error(f"Cache delete_many error: {e}")
+            self._redis_error(e)
+            return 0
+    
+    def get_or_set(self, key, producer, timeout=3600, tags=None, single_flight=False):
+        """Return the cached value for key, computing it with producer() on a miss
+        
+        With single_flight, concurrent misses for the same key are coalesced:
+        one caller runs producer() while the others wait for its result. In
+        Redis mode the recomputing worker also holds a SET NX lease so other
+        workers poll for the value instead of recomputing it.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        
+        if not single_flight:
+            value = producer()
+            self.set(key, value, timeout, tags=tags)
+            return value
+        
+        cache_key = self._make_key(key)
+        with self._flights_lock:
+            flight = self._flights.get(cache_key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[cache_key] = _Flight()
+                self.single_flight_stats['leaders'] += 1
+            else:
+                flight.waiters += 1
+        
+        if not is_leader:
+            started = time.monotonic()
+            finished = flight.event.wait(self.lock_timeout)
+            self._record_lock_wait(time.monotonic() - started, coalesced=finished)
+            if finished and flight.result is not None:
+                return flight.result
+            # The leader failed or is too slow, compute for ourselves
+            return producer()
+        
+        try:
+            flight.result = self._compute_with_lease(key, cache_key, producer, timeout, tags)
+            return flight.result
+        finally:
+            with self._flights_lock:
+                self._flights.pop(cache_key, None)
+            flight.event.set()
+    
+    def _compute_with_lease(self, key, cache_key, producer, timeout, tags):
+        """Recompute a value, holding a Redis lease so other workers wait"""
+        if not self._redis_available():
+            value = producer()
+            self.set(key, value, timeout, tags=tags)
+            return value
+        
+        lease_key = f"{self.LOCK_PREFIX}{cache_key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis_client.set(lease_key, token, nx=True, px=int(self.lock_timeout * 1000))
+        except Exception as e:
+            logger.error(f"Cache lease error: {e}")
+            self._redis_error(e)
+            acquired = True  # Redis trouble, fall back to local coalescing only
+            lease_key = None
+        
+        if not acquired:
+            value = self._wait_for_lease(key, lease_key)
+            if value is not None:
+                return value
+        
+        try:
+            value = producer()
+            self.set(key, value, timeout, tags=tags)
+            return value
+        finally:
+            if acquired and lease_key:
+                try:
+                    self.redis_client.eval(self.RELEASE_LEASE_SCRIPT, 1, lease_key, token)
+                except Exception as e:
+                    logger.error(f"Cache lease release error: {e}")
+    
+    def _wait_for_lease(self, key, lease_key, poll_interval=0.05):
+        """Poll for the value another worker is computing under its lease"""
+        started = time.monotonic()
+        deadline = started + self.lock_timeout
+        value = None
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(poll_interval)
+                value = self.get(key)
+                if value is not None or not self.redis_client.exists(lease_key):
+                    break
+        except Exception as e:
+            logger.error(f"Cache lease wait error: {e}")
+        
+        with self._flights_lock:
+            self.single_flight_stats['lease_waits'] += 1
+        self._record_lock_wait(time.monotonic() - started, coalesced=value is not None)
+        return value
+    
+    def _record_lock_wait(self, waited, coalesced):
+        with self._flights_lock:
+            stats = self.single_flight_stats
+            stats['lock_wait_seconds'] += waited
+            stats['max_lock_wait_seconds'] = max(stats['max_lock_wait_seconds'], waited)
+            if coalesced:
+                stats['coalesced'] += 1
+            else:
+                stats['wait_timeouts'] += 1
+    
+    def invalidate_tag(self, tag):
+        """Delete every key stored with a tag
+        
+        Costs O(keys in tag): the tag's member set is read and removed
+        atomically, then its members are deleted in batches.
+        """
+        try:
+            if self._redis_available():
+                removed = self._delete_tagged_keys(self._make_tag_key(tag), tags=[tag])
+            else:
+                self._note_outage_write(tags=[tag])
+                removed = self.memory_cache.invalidate_tag(tag)
+            
+            self.stats.event('tag_invalidations')
+            logger.info(f"Cache tag '{tag}' invalidated ({removed} keys)")
+            return removed
+            
+        except Exception as e:
+            logger.error(f"Cache tag invalidation error: {e}")
+            self._redis_error(e)
+            return 0
+    
+    def _delete_tagged_keys(self, tag_key, batch_size=500, **invalidation):
+        """Atomically take a Redis tag set and delete the keys it lists"""
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.smembers(tag_key)
+        pipe.delete(tag_key)
+        members = list(pipe.execute()[0])
+        
+        for start in range(0, len(members), batch_size):
+            self.redis_client.delete(*members[start:start + batch_size])
+        
+        if self.l1_cache is not None:
+            self._invalidation_seq += 1
+            self.l1_cache.clear()
+            pipe = self.redis_client.pipeline(transaction=False)
+            self._publish_invalidation(pipe, **invalidation)
+            pipe.execute()
+        
+        return len(members)
+    
     def clear(self):
         """Clear all cache"""
         try:
-            if self.redis_client:
-                # Delete all keys with our prefix
-                keys = self.redis_client.keys("lanaim_cache:*")
-                if keys:
-                    self.redis_client.delete(*keys)
+            if self._redis_available():
+                # Every key we wrote is listed in the all-keys set, no KEYS scan needed
+                self._delete_tagged_keys(self._make_tag_key(self.ALL_KEYS_TAG), clear=True)
             else:
+                self._note_outage_write(clear=True)
                 self.memory_cache.clear()
             
             logger.info("Cache cleared")
@@ -155,36 +1406,64 @@ class CacheManager:
             
         except Exception as e:
             logger.error(f"Cache clear error: {e}")
+            self._redis_error(e)
             return False
     
-    def _cleanup_memory_cache(self):
-        """Remove expired items from memory cache"""
-        if len(self.memory_cache) > 1000:  # Cleanup when cache gets large
-            now = datetime.now()
-            expired_keys = [
-                key for key, item in self.memory_cache.items()
-                if item['expires_at'] <= now
-            ]
-            
-            for key in expired_keys:
-                del self.memory_cache[key]
-    
     def get_stats(self):
         """Get cache statistics"""
-        total_requests = self.cache_stats['hits'] + self.cache_stats['misses']
-        hit_rate = (self.cache_stats['hits'] / total_requests * 100) if total_requests > 0 else 0
+        counters = self.stats.get_stats()
+        totals = counters['totals']
+        events = counters['events']
+        total_requests = totals['hits'] + totals['misses']
+        hit_rate = (totals['hits'] / total_requests * 100) if total_requests > 0 else 0
+        redis_up = self.redis_client is not None and self.breaker.state == CircuitBreaker.CLOSED
         
         stats = {
-            'hits': self.cache_stats['hits'],
-            'misses': self.cache_stats['misses'],
-            'sets': self.cache_stats['sets'],
-            'deletes': self.cache_stats['deletes'],
+            'hits': totals['hits'],
+            'misses': totals['misses'],
+            'sets': totals['sets'],
+            'deletes': totals['deletes'],
+            'bytes_written': totals['bytes_written'],
+            'tag_invalidations': events.get('tag_invalidations', 0),
+            'tag_members_pruned': events.get('tag_members_pruned', 0),
             'hit_rate': round(hit_rate, 2),
-            'backend': 'Redis' if self.redis_client else 'Memory',
-            'memory_cache_size': len(self.memory_cache)
+            'backend': 'Redis' if redis_up else 'Memory',
+            'memory_cache_size': len(self.memory_cache),
+            'namespaces': counters['namespaces']
         }
         
-        if self.redis_client:
+        single_flight = dict(self.single_flight_stats)
+        waits = single_flight['coalesced'] + single_flight['wait_timeouts']
+        single_flight['avg_lock_wait_seconds'] = round(
+            single_flight['lock_wait_seconds'] / waits, 4
+        ) if waits > 0 else 0
+        single_flight['in_flight'] = len(self._flights)
+        stats['single_flight'] = single_flight
+        stats['background_refresh'] = self.refresher.get_stats()
+        
+        if self.l1_cache is not None:
+            if redis_up:
+                stats['backend'] = 'Redis+L1'
+            stats['l1_hits'] = totals['l1_hits']
+            stats['l1_connected'] = self._listener_connected
+            stats['l1_invalidations_received'] = events.get('invalidations_received', 0)
+            stats['l1'] = self.l1_cache.get_stats()
+        
+        memory_stats = self.memory_cache.get_stats()
+        stats['memory_cache_bytes'] = memory_stats['bytes']
+        stats['memory_cache_max_bytes'] = memory_stats['max_bytes']
+        stats['memory_cache_max_entries'] = memory_stats['max_entries']
+        stats['evictions'] = memory_stats['evictions']
+        stats['expirations'] = memory_stats['expirations']
+        
+        if self.connection:
+            stats['redis_pool'] = self.connection.get_stats()
+        
+        if self.redis_client is not None:
+            stats['redis_breaker'] = self.breaker.get_stats()
+        
+        if redis_up:
+            stats['serializer'] = self.serializer.get_stats()
             try:
                 info = self.redis_client.info()
                 stats['redis_memory'] = info.get('used_memory_human', 'Unknown')
@@ -197,45 +1476,130 @@ class CacheManager:
 # Global cache manager instance
 cache_manager = CacheManager()
 
-def cached(timeout=3600, key_func=None):
-    """Decorator for caching function results"""
+def cached(timeout=3600, key_func=None, tags=None, single_flight=False,
+           soft_ttl=None, hard_ttl=None):
+    """Decorator for caching function results
+    
+    With single_flight, concurrent misses on the same key run the function
+    once and share its result (see CacheManager.get_or_set).
+    
+    With soft_ttl, results older than soft_ttl seconds are still returned
+    immediately while a background refresh recomputes them; entries are
+    dropped after hard_ttl seconds (defaults to timeout).
+    """
+    if soft_ttl is not None:
+        hard_ttl = hard_ttl or timeout
+        if soft_ttl > hard_ttl:
+            raise ValueError("soft_ttl must not exceed hard_ttl")
+    
     def decorator(func):
+        def make_cache_key(*args, **kwargs):
+            if key_func:
+                return key_func(*args, **kwargs)
+            # Use function name and arguments as key
+            key_parts = [func.__name__]
+            key_parts.extend(str(arg) for arg in args)
+            key_parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()))
+            return ":".join(key_parts)
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generate cache key
-            if key_func:
-                cache_key = key_func(*args, **kwargs)
-            else:
-                # Use function name and arguments as key
-                key_parts = [func.__name__]
-                key_parts.extend(str(arg) for arg in args)
-                key_parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()))
-                cache_key = ":".join(key_parts)
+            cache_key = make_cache_key(*args, **kwargs)
+            prefetched = _take_prefetched(cache_key)
+            
+            if soft_ttl is None:
+                if prefetched is not None:
+                    return prefetched
+                # Serve from cache, executing the function on a miss
+                return cache_manager.get_or_set(
+                    cache_key,
+                    lambda: func(*args, **kwargs),
+                    timeout,
+                    tags=tags,
+                    single_flight=single_flight
+                )
+            
+            def compute():
+                return SoftEntry(func(*args, **kwargs), time.time() + soft_ttl)
             
-            # Try to get from cache
-            cached_result = cache_manager.get(cache_key)
-            if cached_result is not None:
-                return cached_result
+            def refresh():
+                cache_manager.set(cache_key, compute(), hard_ttl, tags=tags)
             
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache_manager.set(cache_key, result, timeout)
+            entry = prefetched
+            if entry is None:
+                entry = cache_manager.get_or_set(
+                    cache_key, compute, hard_ttl, tags=tags, single_flight=single_flight
+                )
+            if not isinstance(entry, SoftEntry):
+                # Written by a caller without soft_ttl, treat it as fresh
+                return entry
             
-            return result
+            if entry.is_stale():
+                cache_manager.refresher.schedule(cache_key, refresh)
+            return entry.value
         
+        wrapper.make_cache_key = make_cache_key
         return wrapper
     return decorator
 
+# Values loaded by cache_prefetch(), consumed by the matching cached() call
+_prefetch_state = threading.local()
+
+def _take_prefetched(cache_key):
+    """Pop a value loaded by an enclosing cache_prefetch() block, or None"""
+    prefetched = getattr(_prefetch_state, 'values', None)
+    if not prefetched:
+        return None
+    return prefetched.pop(cache_key, None)
+
+@contextmanager
+def cache_prefetch(*calls):
+    """Load the cache entries of several cached() calls in one round trip
+    
+    Each call is a cached function, or a (function, args) / (function, args,
+    kwargs) tuple. Calls made inside the block are served from the batch;
+    misses fall through to the normal cached() path.
+    
+        with cache_prefetch(get_menu, get_zones, (sales_summary, (7,))):
+            menu = get_menu()
+            ...
+    """
+    keys = []
+    for call in calls:
+        if not isinstance(call, tuple):
+            call = (call,)
+        func, args, kwargs = call + ((), {})[len(call) - 1:]
+        keys.append(func.make_cache_key(*args, **kwargs))
+    
+    previous = getattr(_prefetch_state, 'values', None)
+    values = dict(previous or {})
+    values.update(cache_manager.get_many(keys))
+    _prefetch_state.values = values
+    try:
+        yield values
+    finally:
+        _prefetch_state.values = previous
+
 def cache_menu_items(timeout=1800):  # 30 minutes
     """Cache decorator specifically for menu items"""
-    return cached(timeout=timeout, key_func=lambda *args, **kwargs: "menu_items")
+    return cached(
+        timeout=timeout,
+        key_func=lambda *args, **kwargs: "menu_items",
+        tags=['menu'],
+        single_flight=True
+    )
 
 def cache_delivery_zones(timeout=3600):  # 1 hour
     """Cache decorator for delivery zones"""
-    return cached(timeout=timeout, key_func=lambda *args, **kwargs: "delivery_zones")
+    return cached(
+        timeout=timeout,
+        key_func=lambda *args, **kwargs: "delivery_zones",
+        tags=['menu', 'zones'],
+        single_flight=True
+    )
 
-def cache_analytics_data(timeout=300):  # 5 minutes
-    """Cache decorator for analytics data"""
+def cache_analytics_data(timeout=300, soft_ttl=60):  # 5 minutes, refreshed after 1
+    """Cache decorator for analytics data, served stale while refreshing"""
     def key_func(*args, **kwargs):
         # Include parameters in cache key for analytics
         parts = ["analytics"]
@@ -243,31 +1607,203 @@ def cache_analytics_data(timeout=300):  # 5 minutes
         parts.extend(f"{k}={v}" for k, v in sorted(kwargs.items()))
         return ":".join(parts)
     
-    return cached(timeout=timeout, key_func=key_func)
+    return cached(
+        timeout=timeout,
+        key_func=key_func,
+        tags=['analytics'],
+        single_flight=True,
+        soft_ttl=soft_ttl
+    )
+
+def cache_menu_options(timeout=1800):  # 30 minutes
+    """Cache decorator for the option groups of one menu item"""
+    return cached(
+        timeout=timeout,
+        key_func=lambda menu_id, *args, **kwargs: f"menu_options:{menu_id}",
+        tags=['menu'],
+        single_flight=True
+    )
+
+class CacheWarmer:
+    """Registry of producers that fill cache entries before traffic needs them
+    
+    Producers run on a small thread pool at startup and again, for the
+    matching tag, right after an invalidation. The startup pass is bounded
+    by a time budget; the app reports ready once it has finished or the
+    budget has run out.
+    """
+    
+    def __init__(self, max_workers=4, budget=10):
+        self.app = None
+        self.enabled = True
+        self.max_workers = max_workers
+        self.budget = budget
+        self.ready = False
+        self.producers = {}  # name -> (producer, tags)
+        self.results = {}  # name -> outcome of the latest run
+        self.last_warmup = None
+        self._running = set()
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Configure the pool and time budget from the Flask app"""
+        self.app = app
+        self.enabled = app.config.get('CACHE_WARMUP_ENABLED', True)
+        self.max_workers = app.config.get('CACHE_WARMUP_WORKERS', 4)
+        self.budget = app.config.get('CACHE_WARMUP_BUDGET', 10)
+        self.ready = not self.enabled
+    
+    def register(self, name, tags=()):
+        """Decorator registering a zero-argument warm-up producer"""
+        def decorator(producer):
+            self.producers[name] = (producer, tuple(tags))
+            return producer
+        return decorator
+    
+    def warm(self, names=None, wait=True):
+        """Run producers concurrently, waiting at most the time budget
+        
+        Returns the names that finished within the budget. Producers still
+        running when it expires are reported as 'running' and left to finish.
+        """
+        if not self.enabled or self.app is None:
+            return []
+        
+        names = list(self.producers) if names is None else [n for n in names if n in self.producers]
+        futures = {}
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='cache-warmup'
+                )
+            for name in names:
+                if name in self._running:
+                    continue  # Already warming, its result will be just as fresh
+                self._running.add(name)
+                self.results[name] = {'status': 'running', 'duration': None, 'error': None}
+                futures[self._executor.submit(self._run, name)] = name
+        
+        self.last_warmup = datetime.now().isoformat()
+        if not wait:
+            return []
+        
+        done, not_done = wait_for_futures(futures, timeout=self.budget)
+        if not_done:
+            logger.warning(
+                f"Cache warm-up budget of {self.budget}s exceeded, still running: "
+                f"{', '.join(sorted(futures[f] for f in not_done))}"
+            )
+        return [futures[f] for f in done]
+    
+    def warm_startup(self):
+        """Warm every producer in the background, marking the app ready when done"""
+        if not self.enabled:
+            self.ready = True
+            return None
+        
+        def run():
+            try:
+                finished = self.warm()
+                logger.info(f"Cache warm-up finished {len(finished)}/{len(self.producers)} producers")
+            finally:
+                self.ready = True
+        
+        thread = threading.Thread(target=run, name='cache-warmup-startup', daemon=True)
+        thread.start()
+        return thread
+    
+    def warm_tag(self, tag):
+        """Re-run, without waiting, the producers that fill entries carrying tag"""
+        names = [name for name, (_, tags) in self.producers.items() if tag in tags]
+        self.warm(names, wait=False)
+        return names
+    
+    def _run(self, name):
+        producer = self.producers[name][0]
+        started = time.monotonic()
+        try:
+            with self.app.app_context():
+                producer()
+            outcome = {'status': 'ok', 'error': None}
+        except Exception as e:
+            logger.error(f"Cache warm-up producer {name} failed: {e}")
+            outcome = {'status': 'failed', 'error': str(e)}
+        
+        outcome['duration'] = round(time.monotonic() - started, 4)
+        with self._lock:
+            self._running.discard(name)
+            self.results[name] = outcome
+    
+    def shutdown(self, wait=True):
+        """Stop the worker threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+    
+    def get_status(self):
+        """Readiness and the outcome of each producer, for /health"""
+        with self._lock:
+            results = {name: dict(result) for name, result in self.results.items()}
+        return {
+            'ready': self.ready,
+            'enabled': self.enabled,
+            'budget_seconds': self.budget,
+            'last_warmup': self.last_warmup,
+            'producers': results
+        }
+
+# Global cache warmer instance
+cache_warmer = CacheWarmer()
 
 def invalidate_menu_cache():
-    """Invalidate menu-related cache"""
-    cache_manager.delete("menu_items")
-    cache_manager.delete("delivery_zones")
+    """Invalidate menu-related cache and rebuild it in the background"""
+    cache_manager.invalidate_tag('menu')
+    cache_warmer.warm_tag('menu')
     logger.info("Menu cache invalidated")
 
 def invalidate_analytics_cache():
-    """Invalidate analytics cache"""
-    # Delete all analytics cache keys
-    if cache_manager.redis_client:
-        try:
-            keys = cache_manager.redis_client.keys("lanaim_cache:analytics*")
-            if keys:
-                cache_manager.redis_client.delete(*keys)
-        except:
-            pass
-    else:
-        # For memory cache, we need to find and delete analytics keys
-        analytics_keys = [
-            key for key in cache_manager.memory_cache.keys()
-            if 'analytics' in key
-        ]
-        for key in analytics_keys:
-            del cache_manager.memory_cache[key]
-    
+    """Invalidate analytics cache and rebuild it in the background"""
+    cache_manager.invalidate_tag('analytics')
+    cache_warmer.warm_tag('analytics')
     logger.info("Analytics cache invalidated")
+
+# Model class -> cache tags its rows feed, see invalidate_on_commit()
+_invalidation_tags_by_model = {}
+
+def _collect_invalidation_tags(session, flush_context):
+    tags = session.info.setdefault('cache_invalidate_tags', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        tags.update(_invalidation_tags_by_model.get(type(instance), ()))
+
+def _invalidate_committed_tags(session):
+    for tag in session.info.pop('cache_invalidate_tags', None) or ():
+        if tag == 'menu':
+            invalidate_menu_cache()
+        elif tag == 'analytics':
+            invalidate_analytics_cache()
+        else:
+            cache_manager.invalidate_tag(tag)
+            cache_warmer.warm_tag(tag)
+
+def _discard_invalidation_tags(session):
+    session.info.pop('cache_invalidate_tags', None)
+
+def invalidate_on_commit(tags_by_model):
+    """Invalidate cache tags after a commit that touched the given models
+    
+    tags_by_model maps model classes to the tags whose entries they feed,
+    e.g. {Menu: ['menu']}. Tags are collected at flush and only invalidated
+    once the transaction commits, so readers never re-cache old rows.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    
+    for model, tags in tags_by_model.items():
+        _invalidation_tags_by_model.setdefault(model, set()).update(tags)
+    
+    if not event.contains(Session, 'after_flush', _collect_invalidation_tags):
+        event.listen(Session, 'after_flush', _collect_invalidation_tags)
+        event.listen(Session, 'after_commit', _invalidate_committed_tags)
+        event.listen(Session, 'after_rollback', _discard_invalidation_tags)
@@ -6,6 +6,8 @@ Security and performance optimized for production deployment
 import os
 from datetime import timedelta
 
+from sqlite_profile import sqlite_engine_options
+
 class ProductionConfig:
     """Production configuration with security enhancements"""
     
@@ -18,12 +20,22 @@ class ProductionConfig:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'lanaim_pos_phase1.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_size': 20,
-        'pool_recycle': 300,
-        'pool_pre_ping': True,
-        'pool_timeout': 30
-    }
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # One writer at a time, see sqlite_profile for the pragmas applied per connection
+        SQLALCHEMY_ENGINE_OPTIONS = sqlite_engine_options(
+            pool_size=int(os.environ.get('SQLITE_POOL_SIZE') or 5)
+        )
+    else:
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': 20,
+            'pool_recycle': 300,
+            'pool_pre_ping': True,
+            'pool_timeout': 30
+        }
+    SQLITE_PRAGMAS = {}  # Overrides for sqlite_profile.DEFAULT_PRAGMAS, e.g. {'mmap_size': 0}
+    SQLITE_LOCK_RETRIES = 5  # Retries of a locked order write before giving up
+    SQLITE_RETRY_BASE_DELAY = 0.05  # Seconds, doubled per retry with jitter
+    SQLITE_RETRY_MAX_DELAY = 1.0
     
     # Session
     SESSION_COOKIE_SECURE = True
@@ -55,7 +67,67 @@ class ProductionConfig:
     BACKUP_RETENTION_DAYS = 30
     BACKUP_PATH = os.environ.get('BACKUP_PATH') or 'backups'
     
+    # Redis (shared by caching and notifications)
+    REDIS_URL = os.environ.get('REDIS_URL') or 'memory://'
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS') or 50)
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT') or 0.5)  # Seconds per command
+    REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT') or 0.25)
+    REDIS_HEALTH_CHECK_INTERVAL = 30
+    REDIS_BREAKER_FAILURES = 3  # Connection errors within the window that open the breaker
+    REDIS_BREAKER_WINDOW = 30
+    REDIS_BREAKER_RESET = 10  # Seconds on the memory fallback before probing Redis again
+    
+    # Caching
+    CACHE_MEMORY_MAX_ENTRIES = int(os.environ.get('CACHE_MEMORY_MAX_ENTRIES') or 5000)
+    CACHE_MEMORY_MAX_BYTES = int(os.environ.get('CACHE_MEMORY_MAX_BYTES') or 64 * 1024 * 1024)
+    CACHE_TAG_TTL = 86400  # Lifetime of Redis tag membership sets
+    CACHE_TAG_PRUNE_EVERY = 1000  # Writes between background prunes of expired tag set members
+    # Without Redis each worker caches on its own, catalog entries expire within seconds
+    CACHE_LOCAL_TAG_TTLS = {'menu': 10, 'zones': 10}
+    CACHE_L1_ENABLED = True  # Per-worker L1 in front of Redis for hot catalog keys
+    CACHE_L1_KEYS = ('menu_items', 'delivery_zones', 'menu_options')
+    CACHE_L1_MAX_ENTRIES = 256
+    CACHE_L1_TTL = 60
+    CACHE_INVALIDATION_CHANNEL = 'lanaim_cache:invalidate'
+    CACHE_LOCK_TIMEOUT = 30  # Max seconds callers wait on a single-flight recompute
+    CACHE_REFRESH_WORKERS = 2  # Stale-while-revalidate refresh threads
+    CACHE_REFRESH_QUEUE_SIZE = 32  # Refreshes beyond this are dropped, stale value still served
+    CACHE_WARMUP_ENABLED = True  # Pre-fill menu, zone, option and dashboard caches
+    CACHE_WARMUP_WORKERS = 4
+    CACHE_WARMUP_BUDGET = 10  # Seconds before /health reports ready regardless
+    CACHE_CODEC = os.environ.get('CACHE_CODEC') or 'pickle'  # pickle, msgpack or json. pickle decodes the menu and reports fastest
+    CACHE_COMPRESSION = os.environ.get('CACHE_COMPRESSION') or 'zlib'  # zlib, lz4 or none
+    CACHE_COMPRESS_THRESHOLD = 1024  # Only compress encoded values at least this many bytes
+    
     # Performance
+    SYSTEM_SAMPLE_INTERVAL = 5  # Seconds between host/process snapshots read by /health
+    LATENCY_SLOT_SECONDS = 10  # Resolution of the 1m/5m/1h latency windows
+    SQL_MONITORING_ENABLED = True  # Per-request query counts and N+1 detection
+    SQL_REPEAT_THRESHOLD = 5  # Flag a statement run more than this many times in one request
+    TEMPLATE_MONITORING_ENABLED = True  # Render time per template, block and macro
+    POOL_MONITORING_ENABLED = True  # Pool checkout wait and transaction durations
+    SLOW_TRANSACTION_THRESHOLD = 0.5  # Seconds, longer transactions are kept in a recent list
+    GC_MONITORING_ENABLED = True  # GC pause time per generation and endpoint
+    GC_LONG_PAUSE_THRESHOLD = 0.01  # Seconds, longer collections are kept in a recent list
+    TRACEMALLOC_SAMPLE_RATE = 0  # Fraction of requests to trace allocations for, adds overhead while tracing
+    SLOW_REQUEST_THRESHOLD = 1.0  # Seconds, default for endpoints not listed below
+    SLOW_REQUEST_THRESHOLDS = {
+        'customer.menu': 0.3,
+        'api.get_menu': 0.3,
+        'admin.operations_report': 3.0,
+        'admin.sales_report': 3.0
+    }
+    SLOW_REQUEST_RING_SIZE = 20  # Slow requests kept per endpoint
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or 'profiles'  # Collapsed-stack request profiles
+    PROFILE_MAX_FILES = 50  # Oldest profiles are deleted beyond this
+    PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+    PROFILE_MAX_SECONDS = 30
+    PROFILE_SAMPLE_RATES = {}  # e.g. {'admin.operations_report': 0.05}
+    METRICS_SHARED_PATH = os.environ.get('METRICS_SHARED_PATH')  # e.g. /dev/shm/lanaim_metrics, merges gunicorn workers
+    METRICS_SHARED_SLOTS = 2 * int(os.environ.get('WORKERS') or 4)  # Workers per node, doubled for rolling restarts
+    METRICS_SHARED_KEYS = 256  # Endpoint/status and error keys per worker
+    METRICS_SHARED_INTERVAL = 5  # Seconds between each worker's writes
+    METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN')  # Bearer token for /metrics, loopback-only when unset
     SEND_FILE_MAX_AGE_DEFAULT = 31536000  # 1 year for static files
     COMPRESS_MIMETYPES = [
         'text/html', 'text/css', 'text/xml', 'application/json',
@@ -5,6 +5,7 @@ Real-time order management for kitchen staff with status tracking
 
 from flask import Blueprint, render_template, request, jsonify
 from models import db, Order, OrderItem, Menu, User, get_thai_now
+from time_windows import TimeWindow
 from datetime import datetime, timedelta
 from routes.staff import staff_required
 from order_system import OrderManager
@@ -78,11 +79,9 @@ class KitchenManager:
     @staticmethod
     def get_kitchen_stats():
         """Get kitchen performance statistics"""
-        today = get_thai_now().date()
-        
         # Today's orders
         today_orders = Order.query.filter(
-            db.func.date(Order.created_at) == today
+            TimeWindow.today().filter(Order.created_at)
         ).all()
         
         # Calculate stats
@@ -0,0 +1,237 @@
+"""
+Prometheus Metrics Exposition
+Render runtime metrics in the Prometheus text format for /metrics
+"""
+
+import hmac
+import time
+import logging
+from datetime import datetime
+
+from redis_connection import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Peers allowed to scrape when METRICS_AUTH_TOKEN is unset
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+# Request latency bucket bounds in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+class MetricsWriter:
+    """Accumulates metric families and renders them as exposition text"""
+    
+    def __init__(self):
+        self.lines = []
+    
+    def family(self, name, metric_type, help_text):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+    
+    def sample(self, name, value, **labels):
+        if labels:
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            self.lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+        else:
+            self.lines.append(f"{name} {_format_value(value)}")
+    
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+class MetricsExporter:
+    """Collects metrics from the production components for scraping
+    
+    Only reads counters the components already keep, using copies of
+    their dicts, so a scrape never holds a lock that requests need.
+    """
+    
+    def __init__(self, app=None):
+        self.app = app
+        self.auth_token = None
+        self.scrape_stats = {'scrapes': 0, 'errors': 0, 'last_duration': 0.0}
+    
+    def init_app(self, app):
+        """Initialize metrics exporter with Flask app"""
+        self.app = app
+        self.auth_token = app.config.get('METRICS_AUTH_TOKEN')
+    
+    def is_authorized(self, request):
+        """Bearer token when METRICS_AUTH_TOKEN is set, otherwise direct loopback requests only
+        
+        Requests relayed by nginx also arrive from 127.0.0.1, but carry its
+        X-Forwarded-For / X-Real-IP headers, so they are refused.
+        """
+        if self.auth_token:
+            supplied = request.headers.get('Authorization', '').encode('utf-8', 'replace')
+            return hmac.compare_digest(supplied, f"Bearer {self.auth_token}".encode())
+        forwarded = any(request.headers.get(header) for header in ('X-Forwarded-For', 'X-Real-IP', 'Forwarded'))
+        return request.remote_addr in LOCAL_ADDRESSES and not forwarded
+    
+    def render(self):
+        """Full exposition text, a failing collector only drops its own families
+        
+        Each collector renders into its own buffer, appended only when it
+        finishes, so a scrape never contains half a metric family.
+        """
+        from monitoring import performance_monitor
+        from caching import cache_manager
+        from notifications import notification_manager
+        from backup import backup_manager
+        
+        started = time.perf_counter()
+        writer = MetricsWriter()
+        collectors = [
+            (self._collect_requests, performance_monitor),
+            (self._collect_cache, cache_manager),
+            (self._collect_sockets, notification_manager),
+            (self._collect_backups, backup_manager),
+            (self._collect_db_pool, performance_monitor)
+        ]
+        for collector, source in collectors:
+            buffer = MetricsWriter()
+            try:
+                collector(buffer, source)
+                writer.lines.extend(buffer.lines)
+            except Exception as e:
+                self.scrape_stats['errors'] += 1
+                logger.error(f"Metrics collector {collector.__name__} failed: {e}")
+        
+        self.scrape_stats['scrapes'] += 1
+        self.scrape_stats['last_duration'] = time.perf_counter() - started
+        writer.family('lanaim_metrics_scrape_duration_seconds', 'gauge', 'Time taken by the previous scrape')
+        writer.sample('lanaim_metrics_scrape_duration_seconds', round(self.scrape_stats['last_duration'], 6))
+        writer.family('lanaim_metrics_collector_errors_total', 'counter', 'Collectors that raised during a scrape')
+        writer.sample('lanaim_metrics_collector_errors_total', self.scrape_stats['errors'])
+        return writer.render()
+    
+    def _collect_requests(self, writer, monitor):
+        latency = list(monitor.metrics['latency'].items())
+        
+        writer.family('lanaim_http_request_duration_seconds', 'histogram', 'Request latency by endpoint and status class')
+        totals = []
+        for (endpoint, status_class), histogram in latency:
+            lifetime = histogram.lifetime
+            counts = lifetime.cumulative_counts(REQUEST_BUCKETS)
+            for bound, count in zip(REQUEST_BUCKETS, counts):
+                writer.sample('lanaim_http_request_duration_seconds_bucket', count,
+                              endpoint=endpoint, status=status_class, le=_format_value(float(bound)))
+            writer.sample('lanaim_http_request_duration_seconds_sum', float(lifetime.total),
+                          endpoint=endpoint, status=status_class)
+            writer.sample('lanaim_http_request_duration_seconds_count', counts[-1],
+                          endpoint=endpoint, status=status_class)
+            totals.append((endpoint, status_class, counts[-1]))
+        
+        writer.family('lanaim_http_requests_total', 'counter', 'Requests handled by endpoint and status class')
+        for endpoint, status_class, count in totals:
+            writer.sample('lanaim_http_requests_total', count, endpoint=endpoint, status=status_class)
+        
+        writer.family('lanaim_http_errors_total', 'counter', 'Unhandled exceptions by type')
+        for error_type, count in list(monitor.metrics['error_counts'].items()):
+            writer.sample('lanaim_http_errors_total', count, type=error_type)
+        
+        writer.family('lanaim_http_active_requests', 'gauge', 'Requests currently being handled')
+        writer.sample('lanaim_http_active_requests', monitor.metrics['active_connections'])
+        
+        writer.family('lanaim_uptime_seconds', 'gauge', 'Seconds since the performance monitor started')
+        writer.sample('lanaim_uptime_seconds', round((datetime.now() - monitor.start_time).total_seconds(), 3))
+    
+    def _collect_cache(self, writer, cache):
+        # The counters from CacheManager.get_stats, without its Redis INFO round trip
+        counters = cache.stats.get_stats()
+        namespaces = counters['namespaces']
+        
+        for counter in cache.stats.COUNTERS:
+            name = f"lanaim_cache_{counter}_total"
+            writer.family(name, 'counter', f"Cache {counter.replace('_', ' ')} by key namespace")
+            for namespace, stats in namespaces.items():
+                writer.sample(name, stats[counter], namespace=namespace)
+        
+        writer.family('lanaim_cache_events_total', 'counter', 'Cache events without a namespace')
+        for event, count in counters['events'].items():
+            writer.sample('lanaim_cache_events_total', count, event=event)
+        
+        bounds = cache.stats.LATENCY_BUCKETS
+        writer.family('lanaim_cache_operation_duration_seconds', 'histogram', 'Cache operation latency')
+        for namespace, stats in namespaces.items():
+            for operation, latency in stats.get('latency_ms', {}).items():
+                cumulative = 0
+                for bound, count in zip(bounds, latency['histogram'].values()):
+                    cumulative += count
+                    writer.sample('lanaim_cache_operation_duration_seconds_bucket', cumulative,
+                                  namespace=namespace, operation=operation, le=_format_value(float(bound)))
+                writer.sample('lanaim_cache_operation_duration_seconds_sum', latency['avg'] * latency['count'] / 1000,
+                              namespace=namespace, operation=operation)
+                writer.sample('lanaim_cache_operation_duration_seconds_count', latency['count'],
+                              namespace=namespace, operation=operation)
+        
+        writer.family('lanaim_cache_memory_entries', 'gauge', 'Entries in the in-process memory cache')
+        writer.sample('lanaim_cache_memory_entries', len(cache.memory_cache))
+        
+        if cache.redis_client is not None:
+            writer.family('lanaim_redis_up', 'gauge', '1 while the Redis circuit breaker is closed')
+            writer.sample('lanaim_redis_up', 1 if cache.breaker.state == CircuitBreaker.CLOSED else 0)
+            writer.family('lanaim_redis_breaker_trips_total', 'counter', 'Times the Redis circuit breaker opened')
+            writer.sample('lanaim_redis_breaker_trips_total', cache.breaker.stats['trips'])
+            if cache.connection:
+                pool = cache.connection.get_stats()
+                writer.family('lanaim_redis_pool_connections', 'gauge', 'Redis pool connections by state')
+                writer.sample('lanaim_redis_pool_connections', pool['in_use_connections'], state='in_use')
+                writer.sample('lanaim_redis_pool_connections', pool['idle_connections'], state='idle')
+    
+    def _collect_sockets(self, writer, notifications):
+        stats = notifications.get_connected_users_stats()
+        writer.family('lanaim_socket_connections', 'gauge', 'Connected Socket.IO users by role')
+        writer.sample('lanaim_socket_connections', stats['total_connected'], role='all')
+        for role, count in stats['by_role'].items():
+            writer.sample('lanaim_socket_connections', count, role=role)
+    
+    def _collect_backups(self, writer, backups):
+        status = backups.get_backup_status()
+        writer.family('lanaim_backup_count', 'gauge', 'Backup files on disk')
+        writer.sample('lanaim_backup_count', status['backup_count'])
+        latest = status.get('latest_backup')
+        if latest:
+            writer.family('lanaim_backup_age_seconds', 'gauge', 'Seconds since the newest backup was written')
+            writer.sample('lanaim_backup_age_seconds', round((datetime.now() - latest['modified']).total_seconds(), 3))
+    
+    def _collect_db_pool(self, writer, monitor):
+        from models import db
+        pool = db.engine.pool
+        writer.family('lanaim_db_pool_info', 'gauge', 'SQLAlchemy pool class in use')
+        writer.sample('lanaim_db_pool_info', 1, pool_class=type(pool).__name__)
+        # Only QueuePool tracks sizes, SQLite's single-thread pools do not
+        writer.family('lanaim_db_pool_connections', 'gauge', 'SQLAlchemy pool connections by state')
+        for state, method in [('checked_out', 'checkedout'), ('checked_in', 'checkedin'),
+                              ('overflow', 'overflow'), ('size', 'size')]:
+            if hasattr(pool, method):
+                writer.sample('lanaim_db_pool_connections', getattr(pool, method)(), state=state)
+        
+        connections = monitor.connections
+        wait = connections.checkout_wait
+        counts = wait.cumulative_counts(REQUEST_BUCKETS)
+        writer.family('lanaim_db_checkout_wait_seconds', 'histogram', 'Time spent waiting for a pooled connection')
+        for bound, count in zip(REQUEST_BUCKETS, counts):
+            writer.sample('lanaim_db_checkout_wait_seconds_bucket', count, le=_format_value(float(bound)))
+        writer.sample('lanaim_db_checkout_wait_seconds_sum', float(wait.total))
+        writer.sample('lanaim_db_checkout_wait_seconds_count', counts[-1])
+        
+        writer.family('lanaim_db_checkout_timeouts_total', 'counter', 'Pool checkouts that timed out')
+        writer.sample('lanaim_db_checkout_timeouts_total', connections.pool_stats['checkout_timeouts'])
+        writer.family('lanaim_db_locked_errors_total', 'counter', "'database is locked' errors by endpoint")
+        for endpoint, count in list(connections.lock_errors.items()):
+            writer.sample('lanaim_db_locked_errors_total', count, endpoint=endpoint)
+
+# Global metrics exporter instance
+metrics_exporter = MetricsExporter()
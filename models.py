@@ -195,6 +195,13 @@ class Order(db.Model):
     accepted_by = db.relationship('User', foreign_keys=[accepted_by_user_id], backref='accepted_orders')
     delivered_by = db.relationship('User', foreign_keys=[delivered_by_user_id], backref='delivered_orders')
     
+    # Indexes for the staff queues, reports and customer order history
+    __table_args__ = (
+        db.Index('ix_orders_status_created_at', 'status', 'created_at'),
+        db.Index('ix_orders_created_at', 'created_at'),
+        db.Index('ix_orders_customer_phone_created_at', 'customer_phone', 'created_at'),
+    )
+    
     def generate_order_number(self):
         """Generate unique order number with Thai date format"""
         now = get_thai_now()
@@ -202,12 +209,15 @@ class Order(db.Model):
         # Format: LA20250711-001
         base_number = f"LA{date_str}-"
         
-        # Find the highest number for today
-        today_orders = Order.query.filter(
-            Order.order_number.like(f"{base_number}%")
-        ).count()
+        # Highest number already issued today, only read when the day's counter row is created.
+        # Not a count, deleted orders leave gaps below the highest number
+        suffix = db.cast(db.func.substr(Order.order_number, len(base_number) + 1), db.Integer)
+        existing = db.select(db.func.coalesce(db.func.max(suffix), 0)).where(
+            Order.order_number >= base_number,
+            Order.order_number < f"LA{date_str}."  # '.' sorts right after '-'
+        ).scalar_subquery()
         
-        sequence = str(today_orders + 1).zfill(3)
+        sequence = str(OrderSequence.next_value(date_str, start=existing)).zfill(3)
         self.order_number = f"{base_number}{sequence}"
     
     def get_total_price(self):
@@ -258,6 +268,81 @@ class Order(db.Model):
     def __repr__(self):
         return f'<Order {self.order_number} - {self.customer_name}>'
 
+class OrderSequence(db.Model):
+    """
+    Per-day order number counter
+    One row per Thai calendar day, incremented atomically for every order
+    """
+    __tablename__ = 'order_sequences'
+    
+    day = db.Column(db.String(8), primary_key=True)  # YYYYMMDD
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def next_value(cls, day, start=0):
+        """
+        Allocate the next value for a day in the caller's transaction
+        
+        The counter row stays write-locked until the order commits, so
+        concurrent orders queue on one row instead of counting today's
+        orders and colliding. A rolled back order releases its number.
+        start seeds a new day's row, as a number or SQL expression.
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in ('sqlite', 'postgresql'):
+            return cls._locked_next_value(day, start)
+        
+        table = cls.__table__
+        bump = table.c.last_value + 1
+        value = db.session.execute(
+            db.update(table).where(table.c.day == day).values(last_value=bump).returning(table.c.last_value)
+        ).scalar()
+        if value is not None:
+            return value
+        
+        # First order of the day, another writer may create the row at the same time
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        return db.session.execute(
+            insert(table).values(day=day, last_value=start + 1).on_conflict_do_update(
+                index_elements=[table.c.day], set_={'last_value': bump}
+            ).returning(table.c.last_value)
+        ).scalar()
+    
+    @classmethod
+    def _locked_next_value(cls, day, start):
+        """
+        next_value() for databases without RETURNING or ON CONFLICT
+        
+        Locks the day's row with SELECT ... FOR UPDATE and increments it.
+        When the row is missing it is inserted in a savepoint, and a
+        concurrent insert of the same day sends us back to the locked read.
+        """
+        from sqlalchemy.exc import IntegrityError
+        
+        table = cls.__table__
+        while True:
+            current = db.session.execute(
+                db.select(table.c.last_value).where(table.c.day == day).with_for_update()
+            ).scalar()
+            if current is not None:
+                db.session.execute(db.update(table).where(table.c.day == day).values(last_value=current + 1))
+                return current + 1
+            
+            if not isinstance(start, int):
+                start = db.session.execute(db.select(start)).scalar() or 0
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(table).values(day=day, last_value=start + 1))
+                return start + 1
+            except IntegrityError:
+                continue
+    
+    def __repr__(self):
+        return f'<OrderSequence {self.day}: {self.last_value}>'
+
 class OrderItem(db.Model):
     """
     Individual items within an order
@@ -283,6 +368,12 @@ class OrderItem(db.Model):
     options = db.relationship('OrderItemOption', backref='order_item', lazy=True, cascade='all, delete-orphan')
     menu_ref = db.relationship('Menu', backref='order_items')
     
+    # Items of an order, and an order's items per menu for popularity reports
+    __table_args__ = (
+        db.Index('ix_order_items_order_id', 'order_id'),
+        db.Index('ix_order_items_menu_id_order_id', 'menu_id', 'order_id'),
+    )
+    
     def get_total_price(self):
         """Calculate total price including options"""
         base_total = float(self.price_per_item) * self.quantity
@@ -478,6 +569,12 @@ class StockAdjustment(db.Model):
     # Relationships
     adjusted_by_user = db.relationship('User', backref='stock_adjustments', lazy=True)
     
+    # Per-ingredient history and the recent movements report
+    __table_args__ = (
+        db.Index('ix_stock_adjustments_ingredient_id_created_at', 'ingredient_id', 'created_at'),
+        db.Index('ix_stock_adjustments_created_at', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<StockAdjustment {self.type}: {self.quantity} of {self.ingredient.name}>'
 
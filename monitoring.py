@@ -3,25 +3,820 @@ Performance Monitoring System
 Track system performance and generate optimization reports
 """
 
+import gc
+import re
 import time
+import tracemalloc
+import weakref
 import psutil
 import sqlite3
 from datetime import datetime, timedelta
-from functools import wraps
-from collections import defaultdict, deque
+from functools import lru_cache, wraps
+from types import MappingProxyType
+from collections import Counter, defaultdict, deque
+import random
 import threading
 import logging
+from flask import before_render_template, g, has_request_context, template_rendered
+from jinja2 import Template
+from jinja2.runtime import Macro
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from profiler import RequestProfiler
 
 logger = logging.getLogger(__name__)
 
+class LatencyHistogram:
+    """Log-linear (HDR-style) latency histogram in microseconds
+    
+    Each power of two is split into SUB_BUCKETS linear buckets, so a
+    recorded value lands in its bucket in O(1) and quantiles are within
+    ~3% of the true value. Histograms merge by adding bucket counts,
+    which makes them safe to combine across time slots and workers.
+    """
+    
+    SUB_BUCKETS = 32
+    
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+    
+    @classmethod
+    def _bucket_index(cls, micros):
+        if micros < cls.SUB_BUCKETS * 2:
+            return micros
+        shift = micros.bit_length() - 6
+        return shift * cls.SUB_BUCKETS + (micros >> shift)
+    
+    @classmethod
+    def _bucket_value(cls, index):
+        """Midpoint of a bucket, in microseconds"""
+        if index < cls.SUB_BUCKETS * 2:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        lower = (index - shift * cls.SUB_BUCKETS) << shift
+        return lower + ((1 << shift) - 1) / 2
+    
+    def record(self, seconds):
+        """Add one observation"""
+        self.buckets[self._bucket_index(max(0, int(seconds * 1e6)))] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+    
+    def merge(self, other):
+        """Add another histogram's observations into this one"""
+        for index, count in other.buckets.items():
+            self.buckets[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+    
+    def quantile(self, q):
+        """Approximate q-quantile in seconds, 0 when empty"""
+        if not self.count:
+            return 0
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Never report beyond the observed range
+                return min(max(self._bucket_value(index) / 1e6, self.min), self.max)
+        return self.max
+    
+    def summary(self, quantiles=(0.5, 0.9, 0.99, 0.999)):
+        """Count, mean, max and the requested quantiles in seconds"""
+        summary = {
+            'count': self.count,
+            'avg': round(self.total / self.count, 6) if self.count else 0,
+            'max': round(self.max or 0, 6)
+        }
+        for q in quantiles:
+            summary[f"p{q * 100:g}".replace('.', '')] = round(self.quantile(q), 6)
+        return summary
+    
+    def cumulative_counts(self, bounds):
+        """Observations at or below each bound in seconds, Prometheus style
+        
+        Reads a copy of the buckets, so it is safe while other threads record.
+        """
+        counts = [0] * len(bounds)
+        for index, count in dict(self.buckets).items():
+            value = self._bucket_value(index) / 1e6
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[i] += count
+                    break
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        return counts
+    
+    def to_dict(self):
+        """Plain representation for shipping to another worker"""
+        return {
+            'buckets': dict(self.buckets),
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.buckets.update({int(index): count for index, count in data['buckets'].items()})
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+class WindowedHistogram:
+    """Lifetime histogram plus one histogram per time slot
+    
+    Slots are aligned to wall-clock time, so slot N means the same
+    interval in every worker and windows can be merged slot by slot.
+    A window's boundary is accurate to one slot.
+    """
+    
+    def __init__(self, slot_seconds=10, retention=3600):
+        self.slot_seconds = slot_seconds
+        self.lifetime = LatencyHistogram()
+        self.slots = deque(maxlen=max(1, int(retention // slot_seconds)))  # (slot, histogram)
+    
+    def record(self, seconds, now=None):
+        slot = int((now if now is not None else time.time()) // self.slot_seconds)
+        if not self.slots or self.slots[-1][0] != slot:
+            self.slots.append((slot, LatencyHistogram()))
+        self.slots[-1][1].record(seconds)
+        self.lifetime.record(seconds)
+    
+    def window(self, seconds, now=None):
+        """Merged histogram of the slots inside the last `seconds`"""
+        oldest = int((now if now is not None else time.time()) // self.slot_seconds) - int(seconds // self.slot_seconds) + 1
+        merged = LatencyHistogram()
+        for slot, histogram in reversed(self.slots):
+            if slot < oldest:
+                break
+            merged.merge(histogram)
+        return merged
+
+_SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SQL_WHITESPACE_RE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def sql_fingerprint(statement):
+    """Statement with literals and IN lists collapsed, so repeats compare equal"""
+    fingerprint = _SQL_WHITESPACE_RE.sub(' ', statement.strip())
+    fingerprint = _SQL_LITERAL_RE.sub('?', fingerprint)
+    return _SQL_IN_LIST_RE.sub('(?)', fingerprint)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, a statement that raises never reaches
+    # after_cursor_execute and must not leave a start time behind
+    if has_request_context() and context is not None:
+        context._lanaim_query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    started = getattr(context, '_lanaim_query_start', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    queries = g.get('sql_queries')
+    if queries is None:
+        queries = g.sql_queries = {'count': 0, 'time': 0.0, 'fingerprints': Counter(), 'fingerprint_time': defaultdict(float)}
+    fingerprint = sql_fingerprint(statement)
+    queries['count'] += 1
+    queries['time'] += elapsed
+    queries['fingerprints'][fingerprint] += 1
+    queries['fingerprint_time'][fingerprint] += elapsed
+
+def add_request_timing(component, seconds):
+    """Charge time spent in a component (cache, template, ...) to the current request"""
+    if has_request_context():
+        timings = g.get('request_timings')
+        if timings is not None:
+            timings[component] = timings.get(component, 0.0) + seconds
+
+def _template_render_started(sender, template, context, **extra):
+    g.template_render_started = time.perf_counter()
+
+def _template_render_finished(sender, template, context, **extra):
+    started = g.pop('template_render_started', None)
+    if started is not None:
+        add_request_timing('template', time.perf_counter() - started)
+
+def _timed_json_dumps(dumps):
+    @wraps(dumps)
+    def wrapper(obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return dumps(obj, **kwargs)
+        finally:
+            add_request_timing('serialization', time.perf_counter() - started)
+    wrapper._request_timed = True
+    return wrapper
+
+def _record_template_part(template_name, part, seconds):
+    if has_request_context():
+        parts = g.get('template_parts')
+        if parts is None:
+            parts = g.template_parts = {}
+        timing = parts.get((template_name, part))
+        if timing is None:
+            parts[(template_name, part)] = [1, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+
+def _timed_render_func(template_name, part, render_func):
+    """Wrap a root or block render generator, timing it inclusive of what it includes"""
+    @wraps(render_func)
+    def timed(context):
+        started = time.perf_counter()
+        try:
+            yield from render_func(context)
+        finally:
+            _record_template_part(template_name, part, time.perf_counter() - started)
+    return timed
+
+class _TimedMacro(Macro):
+    template_name = None
+    
+    def _invoke(self, arguments, autoescape):
+        started = time.perf_counter()
+        try:
+            return super()._invoke(arguments, autoescape)
+        finally:
+            _record_template_part(self.template_name, f"macro:{self.name}", time.perf_counter() - started)
+
+class TimedTemplate(Template):
+    """Jinja template whose root, blocks and macros record their render time"""
+    
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        template = super()._from_namespace(environment, namespace, globals)
+        name = template.name or '<string>'
+        template.root_render_func = _timed_render_func(name, 'template', template.root_render_func)
+        template.blocks = {
+            block: _timed_render_func(name, f"block:{block}", render_func)
+            for block, render_func in template.blocks.items()
+        }
+        # Compiled code looks Macro up in its module globals when a macro is defined
+        namespace['Macro'] = type('TimedMacro', (_TimedMacro,), {'template_name': name})
+        return template
+
+class TemplateMonitor:
+    """Render time per template, block and macro, overall and per endpoint
+    
+    Times are inclusive: a template's time contains the blocks, includes
+    and macros it renders.
+    """
+    
+    MAX_PARTS = 500
+    
+    def __init__(self):
+        self.parts = {}  # (template, part) -> stats
+        self.endpoints = defaultdict(lambda: {'requests': 0, 'template_time': 0.0})
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Compile the app's templates with render timing"""
+        app.jinja_env.template_class = TimedTemplate
+        # Templates loaded before this point were built without timing
+        if app.jinja_env.cache is not None:
+            app.jinja_env.cache.clear()
+    
+    def finish_request(self, endpoint):
+        """Fold this request's template timings into the stats, returns the slowest parts"""
+        parts = g.pop('template_parts', None)
+        if not parts:
+            return []
+        
+        with self._lock:
+            stats = self.endpoints[endpoint]
+            stats['requests'] += 1
+            stats['template_time'] += sum(
+                seconds for (_, part), (_, seconds) in parts.items() if part == 'template'
+            )
+            for key, (count, seconds) in parts.items():
+                part_stats = self.parts.get(key)
+                if part_stats is None:
+                    if len(self.parts) >= self.MAX_PARTS:
+                        continue
+                    part_stats = self.parts[key] = {'count': 0, 'total_time': 0.0, 'max_time': 0.0}
+                part_stats['count'] += count
+                part_stats['total_time'] += seconds
+                part_stats['max_time'] = max(part_stats['max_time'], seconds)
+        
+        slowest = sorted(parts.items(), key=lambda x: x[1][1], reverse=True)[:5]
+        return [
+            {'template': template, 'part': part, 'count': count, 'time': round(seconds, 6)}
+            for (template, part), (count, seconds) in slowest
+        ]
+    
+    def get_report(self, limit=10):
+        """Endpoints by template time and the slowest templates, blocks and macros"""
+        with self._lock:
+            endpoints = {endpoint: dict(stats) for endpoint, stats in self.endpoints.items()}
+            parts = [
+                dict(stats, template=template, part=part)
+                for (template, part), stats in self.parts.items()
+            ]
+        
+        parts.sort(key=lambda x: x['total_time'], reverse=True)
+        busiest = sorted(endpoints.items(), key=lambda x: x[1]['template_time'], reverse=True)[:limit]
+        return {
+            'endpoints': [
+                {
+                    'endpoint': endpoint,
+                    'requests': stats['requests'],
+                    'avg_template_time': round(stats['template_time'] / stats['requests'], 4)
+                }
+                for endpoint, stats in busiest
+            ],
+            'slowest_parts': [
+                {
+                    'template': part['template'],
+                    'part': part['part'],
+                    'count': part['count'],
+                    'avg_time': round(part['total_time'] / part['count'], 4),
+                    'max_time': round(part['max_time'], 4)
+                }
+                for part in parts[:limit]
+            ]
+        }
+
+class QueryMonitor:
+    """Per-request SQL count, DB time and repeated-statement (N+1) detection
+    
+    Cursor events on every Engine are tallied into flask.g; at the end of
+    the request the totals are folded into per-endpoint stats, and any
+    fingerprint run more than SQL_REPEAT_THRESHOLD times is recorded as a
+    likely N+1 for that endpoint.
+    """
+    
+    MAX_OFFENDERS = 200
+    
+    def __init__(self):
+        self.repeat_threshold = 5
+        self.endpoints = defaultdict(lambda: {'requests': 0, 'queries': 0, 'db_time': 0.0, 'max_queries': 0})
+        self.offenders = {}  # (endpoint, fingerprint) -> stats
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Start listening to cursor events"""
+        self.repeat_threshold = app.config.get('SQL_REPEAT_THRESHOLD', 5)
+        # Module-level listeners, so repeated init_app calls do not stack them
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    
+    def finish_request(self, endpoint):
+        """Fold this request's queries into the stats, returns its summary"""
+        queries = g.pop('sql_queries', None)
+        if queries is None:
+            return None
+        
+        repeated = [
+            (fingerprint, count) for fingerprint, count in queries['fingerprints'].items()
+            if count > self.repeat_threshold
+        ]
+        with self._lock:
+            stats = self.endpoints[endpoint]
+            stats['requests'] += 1
+            stats['queries'] += queries['count']
+            stats['db_time'] += queries['time']
+            stats['max_queries'] = max(stats['max_queries'], queries['count'])
+            
+            for fingerprint, count in repeated:
+                offender = self.offenders.get((endpoint, fingerprint))
+                if offender is None:
+                    if len(self.offenders) >= self.MAX_OFFENDERS:
+                        continue
+                    offender = self.offenders[(endpoint, fingerprint)] = {
+                        'flagged_requests': 0, 'total_repeats': 0, 'max_repeats': 0
+                    }
+                offender['flagged_requests'] += 1
+                offender['total_repeats'] += count
+                offender['max_repeats'] = max(offender['max_repeats'], count)
+                offender['last_seen'] = datetime.now()
+        
+        for fingerprint, count in repeated:
+            logger.warning(f"Possible N+1 in {endpoint}: {count} x {fingerprint[:200]}")
+        
+        top_statements = sorted(queries['fingerprint_time'].items(), key=lambda x: x[1], reverse=True)[:5]
+        return {
+            'count': queries['count'],
+            'time': queries['time'],
+            'repeated': repeated,
+            'top_statements': [
+                {'fingerprint': fingerprint, 'count': queries['fingerprints'][fingerprint], 'time': round(seconds, 6)}
+                for fingerprint, seconds in top_statements
+            ]
+        }
+    
+    def get_report(self, limit=10):
+        """Endpoints by DB time and the worst repeated statements"""
+        with self._lock:
+            endpoints = {endpoint: dict(stats) for endpoint, stats in self.endpoints.items()}
+            offenders = [
+                dict(stats, endpoint=endpoint, fingerprint=fingerprint)
+                for (endpoint, fingerprint), stats in self.offenders.items()
+            ]
+        
+        busiest = sorted(endpoints.items(), key=lambda x: x[1]['db_time'], reverse=True)[:limit]
+        offenders.sort(key=lambda x: (x['max_repeats'], x['flagged_requests']), reverse=True)
+        
+        return {
+            'total_queries': sum(stats['queries'] for stats in endpoints.values()),
+            'total_db_time': round(sum(stats['db_time'] for stats in endpoints.values()), 3),
+            'repeat_threshold': self.repeat_threshold,
+            'endpoints': [
+                {
+                    'endpoint': endpoint,
+                    'requests': stats['requests'],
+                    'avg_queries': round(stats['queries'] / stats['requests'], 1),
+                    'max_queries': stats['max_queries'],
+                    'avg_db_time': round(stats['db_time'] / stats['requests'], 4)
+                }
+                for endpoint, stats in busiest
+            ],
+            'n_plus_one': [
+                dict(offender, last_seen=offender['last_seen'].isoformat())
+                for offender in offenders[:limit]
+            ]
+        }
+
+class ConnectionMonitor:
+    """Pool checkout latency, connections in use and transaction durations
+    
+    Checkout wait is the time spent in engine.raw_connection(), including
+    opening a new connection. No pool event fires before a checkout starts
+    waiting, so that one method is wrapped on the engine, which outlives
+    the pools dispose() recreates. Counters use the pool events, which
+    recreated pools inherit. A transaction is timed from BEGIN to COMMIT/ROLLBACK
+    and, from its first write statement, as write-lock time, since SQLite
+    holds the database write lock from the first write until the end of
+    the transaction. 'database is locked' errors are counted per endpoint.
+    """
+    
+    WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+    
+    def __init__(self):
+        self.slow_transaction_threshold = 0.5
+        self.checkout_wait = LatencyHistogram()
+        self.pool_stats = {
+            'checkouts': 0, 'checkout_timeouts': 0, 'connects': 0,
+            'in_use': 0, 'max_in_use': 0, 'saturated_checkouts': 0
+        }
+        self.transactions = defaultdict(lambda: {'count': 0, 'total_time': 0.0, 'max_time': 0.0, 'max_write_lock': 0.0})
+        self.slow_transactions = deque(maxlen=50)
+        self.lock_errors = defaultdict(int)
+        self.lock_retries = defaultdict(int)
+        self._open = {}  # id(connection) -> open transaction info
+        self._engines = []
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Attach to the app's engines and their pools"""
+        from models import db
+        self.slow_transaction_threshold = app.config.get('SLOW_TRANSACTION_THRESHOLD', 0.5)
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            self.watch_engine(engine)
+    
+    def watch_engine(self, engine):
+        if any(watched is engine for watched in self._engines):
+            return
+        self._engines.append(engine)
+        engine.raw_connection = self._timed_connect(engine.raw_connection)
+        event.listen(engine.pool, 'connect', self._on_connect)
+        event.listen(engine.pool, 'checkout', self._on_checkout)
+        event.listen(engine.pool, 'checkin', self._on_checkin)
+        event.listen(engine, 'begin', self._on_begin)
+        event.listen(engine, 'commit', self._on_end)
+        event.listen(engine, 'rollback', self._on_end)
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+        event.listen(engine, 'handle_error', self._on_error)
+    
+    @property
+    def _pools(self):
+        """Current pool of each engine, dispose() replaces them"""
+        return [engine.pool for engine in self._engines]
+    
+    def _capacity(self, pool):
+        if hasattr(pool, 'size') and hasattr(pool, '_max_overflow'):
+            return pool.size() + max(0, pool._max_overflow)
+        return None
+    
+    def _timed_connect(self, connect):
+        @wraps(connect)
+        def timed_connect():
+            started = time.perf_counter()
+            timed_out = False
+            try:
+                return connect()
+            except Exception as e:
+                timed_out = type(e).__name__ == 'TimeoutError'
+                raise
+            finally:
+                with self._lock:
+                    self.checkout_wait.record(time.perf_counter() - started)
+                    if timed_out:
+                        self.pool_stats['checkout_timeouts'] += 1
+        return timed_connect
+    
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.pool_stats['connects'] += 1
+    
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            stats = self.pool_stats
+            stats['checkouts'] += 1
+            stats['in_use'] += 1
+            stats['max_in_use'] = max(stats['max_in_use'], stats['in_use'])
+            capacities = [capacity for capacity in map(self._capacity, self._pools) if capacity]
+            if capacities and stats['in_use'] >= sum(capacities):
+                stats['saturated_checkouts'] += 1
+    
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.pool_stats['in_use'] = max(0, self.pool_stats['in_use'] - 1)
+    
+    @staticmethod
+    def _endpoint():
+        if has_request_context():
+            from flask import request
+            return request.endpoint or 'unknown'
+        return 'background'
+    
+    def _on_begin(self, conn):
+        self._open[id(conn)] = {'started': time.perf_counter(), 'write_started': None, 'endpoint': self._endpoint()}
+    
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        transaction = self._open.get(id(conn))
+        if transaction is not None and transaction['write_started'] is None:
+            if statement.lstrip()[:7].upper().startswith(self.WRITE_PREFIXES):
+                transaction['write_started'] = time.perf_counter()
+    
+    def _on_end(self, conn):
+        transaction = self._open.pop(id(conn), None)
+        if transaction is None:
+            return
+        now = time.perf_counter()
+        duration = now - transaction['started']
+        write_lock = now - transaction['write_started'] if transaction['write_started'] else 0.0
+        endpoint = transaction['endpoint']
+        with self._lock:
+            stats = self.transactions[endpoint]
+            stats['count'] += 1
+            stats['total_time'] += duration
+            stats['max_time'] = max(stats['max_time'], duration)
+            stats['max_write_lock'] = max(stats['max_write_lock'], write_lock)
+            if duration >= self.slow_transaction_threshold:
+                self.slow_transactions.append({
+                    'endpoint': endpoint,
+                    'duration': round(duration, 6),
+                    'write_lock': round(write_lock, 6),
+                    'finished_at': datetime.now().isoformat()
+                })
+    
+    def _on_error(self, exception_context):
+        if 'database is locked' in str(exception_context.original_exception):
+            with self._lock:
+                self.lock_errors[self._endpoint()] += 1
+    
+    def record_lock_retry(self, endpoint=None):
+        """Count a retry after 'database is locked'"""
+        with self._lock:
+            self.lock_retries[endpoint or self._endpoint()] += 1
+    
+    def get_report(self, limit=10):
+        """Pool usage, checkout wait, and the longest transactions by endpoint"""
+        now = time.perf_counter()
+        with self._lock:
+            pool_stats = dict(self.pool_stats)
+            checkout_wait = self.checkout_wait.summary()
+            transactions = {endpoint: dict(stats) for endpoint, stats in self.transactions.items()}
+            slow_transactions = list(self.slow_transactions)
+            lock_errors = dict(self.lock_errors)
+            lock_retries = dict(self.lock_retries)
+        open_transactions = sorted(
+            (dict(info) for info in list(self._open.values())), key=lambda x: x['started']
+        )[:limit]
+        
+        pools = []
+        for pool in self._pools:
+            pool_info = {'class': type(pool).__name__}
+            for name, method in [('size', 'size'), ('checked_out', 'checkedout'), ('overflow', 'overflow')]:
+                if hasattr(pool, method):
+                    pool_info[name] = getattr(pool, method)()
+            capacity = self._capacity(pool)
+            if capacity:
+                pool_info['capacity'] = capacity
+                pool_info['saturation'] = round(pool_info.get('checked_out', 0) / capacity * 100, 1)
+            pools.append(pool_info)
+        
+        longest = sorted(transactions.items(), key=lambda x: x[1]['max_time'], reverse=True)[:limit]
+        return {
+            'pool': dict(pool_stats, pools=pools),
+            'checkout_wait': checkout_wait,
+            'transactions': [
+                {
+                    'endpoint': endpoint,
+                    'count': stats['count'],
+                    'avg_time': round(stats['total_time'] / stats['count'], 4),
+                    'max_time': round(stats['max_time'], 4),
+                    'max_write_lock': round(stats['max_write_lock'], 4)
+                }
+                for endpoint, stats in longest
+            ],
+            'open_transactions': [
+                {
+                    'endpoint': info['endpoint'],
+                    'open_for': round(now - info['started'], 3),
+                    'holding_write_lock': info['write_started'] is not None
+                }
+                for info in open_transactions
+            ],
+            'slow_transactions': slow_transactions[::-1][:limit],
+            'lock_errors': lock_errors,
+            'lock_retries': lock_retries
+        }
+
+_gc_monitors = weakref.WeakSet()
+_gc_started = None
+
+def _on_gc(phase, info):
+    """gc.callbacks hook: time each collection and charge it to the running request"""
+    global _gc_started
+    if phase == 'start':
+        _gc_started = time.perf_counter()
+        return
+    if _gc_started is None:
+        return
+    pause = time.perf_counter() - _gc_started
+    _gc_started = None
+    
+    endpoint = None
+    if has_request_context():
+        from flask import request
+        endpoint = request.endpoint or 'unknown'
+        g.gc_pause = g.get('gc_pause', 0.0) + pause
+    for monitor in list(_gc_monitors):
+        monitor.record_pause(info['generation'], pause, info['collected'], info['uncollectable'], endpoint)
+
+class MemoryMonitor:
+    """GC pauses per generation and endpoint, plus optional tracemalloc sampling
+    
+    A collection pauses every thread, but it is charged to the request
+    whose allocation triggered it. With TRACEMALLOC_SAMPLE_RATE set, that
+    fraction of requests is traced one at a time, and the bytes still
+    allocated at the end and the peak during the request are recorded
+    for the endpoint. Concurrent requests' allocations in the same window
+    are counted too, so treat the numbers as per-endpoint trends.
+    """
+    
+    def __init__(self):
+        self.long_pause_threshold = 0.01
+        self.generations = {
+            generation: {'collections': 0, 'total_pause': 0.0, 'max_pause': 0.0, 'collected': 0, 'uncollectable': 0}
+            for generation in range(3)
+        }
+        self.pauses = LatencyHistogram()
+        self.endpoints = defaultdict(lambda: {'collections': 0, 'total_pause': 0.0, 'max_pause': 0.0})
+        self.long_pauses = deque(maxlen=50)
+        self.sample_rate = 0
+        self.allocations = defaultdict(lambda: {'samples': 0, 'net_bytes': 0, 'peak_bytes': 0, 'max_peak_bytes': 0})
+        self._pending_pauses = deque(maxlen=10000)  # Written by the gc callback without locking
+        self._sampling = threading.Lock()  # One traced request at a time
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Register the GC callback and the tracemalloc sample rate"""
+        self.long_pause_threshold = app.config.get('GC_LONG_PAUSE_THRESHOLD', 0.01)
+        self.sample_rate = app.config.get('TRACEMALLOC_SAMPLE_RATE', 0)
+        _gc_monitors.add(self)
+        if _on_gc not in gc.callbacks:
+            gc.callbacks.append(_on_gc)
+    
+    def record_pause(self, generation, pause, collected, uncollectable, endpoint=None):
+        """Queue a collection for the aggregates, called from the gc callback
+        
+        A collection can start while this thread holds self._lock, so the
+        callback must never take it. deque.append is atomic under the GIL,
+        the queue is folded in by _drain_pauses under the lock.
+        """
+        self._pending_pauses.append((generation, pause, collected, uncollectable, endpoint, datetime.now()))
+    
+    def _drain_pauses(self):
+        """Fold queued collections into the aggregates, caller holds self._lock"""
+        while True:
+            try:
+                generation, pause, collected, uncollectable, endpoint, timestamp = self._pending_pauses.popleft()
+            except IndexError:
+                return
+            stats = self.generations[generation]
+            stats['collections'] += 1
+            stats['total_pause'] += pause
+            stats['max_pause'] = max(stats['max_pause'], pause)
+            stats['collected'] += collected
+            stats['uncollectable'] += uncollectable
+            self.pauses.record(pause)
+            if endpoint is not None:
+                endpoint_stats = self.endpoints[endpoint]
+                endpoint_stats['collections'] += 1
+                endpoint_stats['total_pause'] += pause
+                endpoint_stats['max_pause'] = max(endpoint_stats['max_pause'], pause)
+            if pause >= self.long_pause_threshold:
+                self.long_pauses.append({
+                    'timestamp': timestamp.isoformat(),
+                    'generation': generation,
+                    'pause': round(pause, 6),
+                    'collected': collected,
+                    'endpoint': endpoint
+                })
+    
+    def start_request(self):
+        """Begin tracing allocations if this request is sampled, returns True if it is"""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return False
+        # Never stop tracing someone else started (PYTHONTRACEMALLOC, a debugger, ...)
+        if tracemalloc.is_tracing() or not self._sampling.acquire(blocking=False):
+            return False
+        tracemalloc.start()
+        return True
+    
+    def finish_request(self, endpoint):
+        """Stop tracing and charge the traced bytes to the endpoint"""
+        net_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self._sampling.release()
+        with self._lock:
+            self._drain_pauses()
+            stats = self.allocations[endpoint]
+            stats['samples'] += 1
+            stats['net_bytes'] += net_bytes
+            stats['peak_bytes'] += peak_bytes
+            stats['max_peak_bytes'] = max(stats['max_peak_bytes'], peak_bytes)
+    
+    def get_report(self, limit=10):
+        """GC pauses by generation and endpoint, long pauses and sampled allocations"""
+        with self._lock:
+            self._drain_pauses()
+            generations = {generation: dict(stats) for generation, stats in self.generations.items()}
+            endpoints = {endpoint: dict(stats) for endpoint, stats in self.endpoints.items()}
+            allocations = {endpoint: dict(stats) for endpoint, stats in self.allocations.items()}
+            pauses = self.pauses.summary()
+            long_pauses = list(self.long_pauses)
+        
+        for stats in list(generations.values()) + list(endpoints.values()):
+            stats['total_pause'] = round(stats['total_pause'], 6)
+            stats['max_pause'] = round(stats['max_pause'], 6)
+        
+        return {
+            'generations': generations,
+            'pauses': pauses,
+            'endpoints': dict(sorted(endpoints.items(), key=lambda x: x[1]['total_pause'], reverse=True)[:limit]),
+            'long_pauses': long_pauses[::-1],
+            'allocations': {
+                endpoint: {
+                    'samples': stats['samples'],
+                    'avg_net_bytes': stats['net_bytes'] // stats['samples'],
+                    'avg_peak_bytes': stats['peak_bytes'] // stats['samples'],
+                    'max_peak_bytes': stats['max_peak_bytes']
+                }
+                for endpoint, stats in sorted(
+                    allocations.items(), key=lambda x: x[1]['peak_bytes'] / x[1]['samples'], reverse=True
+                )[:limit]
+            }
+        }
+
 class PerformanceMonitor:
     """Monitor system performance and track metrics"""
     
     def __init__(self, app=None):
         self.app = app
         self.metrics = {
-            'request_times': deque(maxlen=1000),
-            'endpoint_stats': defaultdict(lambda: {'count': 0, 'total_time': 0}),
+            'latency': {},  # (endpoint, status class) -> WindowedHistogram
+            'total_requests': 0,
             'error_counts': defaultdict(int),
             'memory_usage': deque(maxlen=100),
             'cpu_usage': deque(maxlen=100),
@@ -30,10 +825,50 @@ class PerformanceMonitor:
         self.start_time = datetime.now()
         self.monitoring_active = False
         self.monitoring_thread = None
-        
+        self.latency_windows = {'1m': 60, '5m': 300, '1h': 3600}
+        self.slot_seconds = 10
+        self._latency_lock = threading.Lock()
+        self.queries = QueryMonitor()
+        self.templates = TemplateMonitor()
+        self.memory = MemoryMonitor()
+        self.connections = ConnectionMonitor()
+        self.profiler = RequestProfiler()
+        self.slow_threshold = 5.0
+        self.slow_thresholds = {}  # endpoint -> seconds, overrides slow_threshold
+        self.slow_requests = defaultdict(lambda: deque(maxlen=20))
+        self.sample_interval = 5
+        self.system_snapshot = None  # Read-only mapping, replaced whole by the sampler thread
+        self._process = psutil.Process()
+        self._stop_event = threading.Event()
+    
     def init_app(self, app):
         """Initialize performance monitor with Flask app"""
         self.app = app
+        self.slot_seconds = app.config.get('LATENCY_SLOT_SECONDS', 10)
+        self.sample_interval = app.config.get('SYSTEM_SAMPLE_INTERVAL', 5)
+        # Enough readings for the 10 minute averages
+        readings = max(100, int(600 // self.sample_interval) + 1)
+        self.metrics['memory_usage'] = deque(self.metrics['memory_usage'], maxlen=readings)
+        self.metrics['cpu_usage'] = deque(self.metrics['cpu_usage'], maxlen=readings)
+        if app.config.get('SQL_MONITORING_ENABLED', True):
+            self.queries.init_app(app)
+        self.profiler.init_app(app)
+        if app.config.get('TEMPLATE_MONITORING_ENABLED', True):
+            self.templates.init_app(app)
+        if app.config.get('GC_MONITORING_ENABLED', True):
+            self.memory.init_app(app)
+        if app.config.get('POOL_MONITORING_ENABLED', True):
+            self.connections.init_app(app)
+        self.slow_threshold = app.config.get('SLOW_REQUEST_THRESHOLD', 5.0)
+        self.slow_thresholds = dict(app.config.get('SLOW_REQUEST_THRESHOLDS', {}))
+        ring_size = app.config.get('SLOW_REQUEST_RING_SIZE', 20)
+        self.slow_requests = defaultdict(lambda: deque(maxlen=ring_size))
+        
+        # Time spent rendering templates and serializing JSON, per request
+        template_rendered.connect(_template_render_finished, app)
+        before_render_template.connect(_template_render_started, app)
+        if not getattr(app.json.dumps, '_request_timed', False):
+            app.json.dumps = _timed_json_dumps(app.json.dumps)
         
         # Register request hooks
         app.before_request(self.before_request)
@@ -42,11 +877,12 @@ class PerformanceMonitor:
         
         # Start background monitoring
         self.start_monitoring()
-        
+    
     def start_monitoring(self):
         """Start background system monitoring"""
         if not self.monitoring_active:
             self.monitoring_active = True
+            self._stop_event.clear()
             self.monitoring_thread = threading.Thread(
                 target=self._monitor_system,
                 daemon=True
@@ -57,14 +893,18 @@ class PerformanceMonitor:
     def stop_monitoring(self):
         """Stop background monitoring"""
         self.monitoring_active = False
+        self._stop_event.set()
         if self.monitoring_thread:
             self.monitoring_thread.join(timeout=5)
         logger.info("Performance monitoring stopped")
     
     def before_request(self):
         """Record request start time"""
-        from flask import g
-        g.start_time = time.time()
+        from flask import g, request
+        g.start_time = time.perf_counter()
+        g.request_timings = {}
+        g.profile_sampler = self.profiler.start(request)
+        g.tracing_allocations = self.memory.start_request()
         self.metrics['active_connections'] += 1
     
     def after_request(self, response):
@@ -72,58 +912,172 @@ class PerformanceMonitor:
         from flask import g, request
         
         if hasattr(g, 'start_time'):
-            request_time = time.time() - g.start_time
-            self.metrics['request_times'].append(request_time)
-            
-            # Track endpoint statistics
+            request_time = time.perf_counter() - g.start_time
             endpoint = request.endpoint or 'unknown'
-            self.metrics['endpoint_stats'][endpoint]['count'] += 1
-            self.metrics['endpoint_stats'][endpoint]['total_time'] += request_time
+            self.record_request(endpoint, response.status_code, request_time)
+            queries = self.queries.finish_request(endpoint)
+            templates = self.templates.finish_request(endpoint)
+            if g.pop('tracing_allocations', False):
+                self.memory.finish_request(endpoint)
+            
+            sampler = g.pop('profile_sampler', None)
+            if sampler is not None:
+                profile = self.profiler.finish(sampler, endpoint, request_time)
+                if profile:
+                    response.headers['X-Profile-Id'] = profile
             
-            # Log slow requests
-            if request_time > 5.0:  # Slow request threshold
+            # Keep slow requests with their time breakdown
+            if request_time > self.slow_thresholds.get(endpoint, self.slow_threshold):
+                self.record_slow_request(endpoint, request, response, request_time, queries, templates)
                 logger.warning(f"Slow request: {endpoint} took {request_time:.2f}s")
         
         return response
     
+    def record_request(self, endpoint, status_code, seconds, now=None):
+        """Add one request to its endpoint and status class histogram"""
+        key = (endpoint, f"{status_code // 100}xx")
+        with self._latency_lock:
+            histogram = self.metrics['latency'].get(key)
+            if histogram is None:
+                histogram = self.metrics['latency'][key] = WindowedHistogram(
+                    self.slot_seconds, max(self.latency_windows.values())
+                )
+            histogram.record(seconds, now)
+            self.metrics['total_requests'] += 1
+    
+    def record_slow_request(self, endpoint, request, response, seconds, queries=None, templates=None):
+        """Add a request to its endpoint's slow request ring"""
+        from flask import g
+        timings = g.get('request_timings') or {}
+        breakdown = {
+            'db': round(queries['time'], 6) if queries else 0,
+            'template': round(timings.get('template', 0), 6),
+            'cache': round(timings.get('cache', 0), 6),
+            'serialization': round(timings.get('serialization', 0), 6)
+        }
+        breakdown['other'] = round(max(0, seconds - sum(breakdown.values())), 6)
+        self.slow_requests[endpoint].append({
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'timestamp': datetime.now().isoformat(),
+            'duration': round(seconds, 6),
+            'threshold': self.slow_thresholds.get(endpoint, self.slow_threshold),
+            'breakdown': breakdown,
+            'queries': queries['count'] if queries else 0,
+            'gc_pause': round(g.get('gc_pause', 0.0), 6),  # Overlaps the components above
+            'top_sql': queries['top_statements'] if queries else [],
+            'top_templates': templates or []
+        })
+    
+    def get_slow_requests(self, endpoint=None, limit=50):
+        """Slow requests, slowest first, optionally for one endpoint"""
+        if endpoint is not None:
+            entries = list(self.slow_requests.get(endpoint, ()))
+        else:
+            entries = [entry for ring in list(self.slow_requests.values()) for entry in list(ring)]
+        entries.sort(key=lambda x: x['duration'], reverse=True)
+        return entries[:limit]
+    
+    def get_latency_stats(self, now=None):
+        """p50/p90/p99/p99.9 per endpoint and status class for each window"""
+        stats = {}
+        with self._latency_lock:
+            for (endpoint, status_class), histogram in self.metrics['latency'].items():
+                windows = {
+                    name: histogram.window(seconds, now).summary()
+                    for name, seconds in self.latency_windows.items()
+                }
+                windows['lifetime'] = histogram.lifetime.summary()
+                stats.setdefault(endpoint, {})[status_class] = windows
+        return stats
+    
+    def _endpoint_totals(self):
+        """Lifetime histogram per endpoint, all status classes merged"""
+        totals = defaultdict(LatencyHistogram)
+        with self._latency_lock:
+            for (endpoint, _), histogram in self.metrics['latency'].items():
+                totals[endpoint].merge(histogram.lifetime)
+        return totals
+    
     def teardown_request(self, exception):
         """Handle request teardown"""
+        from flask import request
         self.metrics['active_connections'] = max(0, self.metrics['active_connections'] - 1)
         
+        # Requests that never reached after_request must not leave a sampler running
+        sampler = g.pop('profile_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+        if g.pop('tracing_allocations', False):
+            self.memory.finish_request(request.endpoint or 'unknown')
+        
         if exception:
             error_type = type(exception).__name__
             self.metrics['error_counts'][error_type] += 1
     
+    def _sample_system(self):
+        """Take one host and process sample and publish it as the current snapshot"""
+        now = datetime.now()
+        memory = psutil.virtual_memory()
+        process = self._process
+        with process.oneshot():
+            process_memory = process.memory_info()
+            process_stats = {
+                'pid': process.pid,
+                'rss_bytes': process_memory.rss,
+                'vms_bytes': process_memory.vms,
+                'cpu_percent': process.cpu_percent(interval=None),
+                'threads': process.num_threads(),
+                'open_fds': process.num_fds() if hasattr(process, 'num_fds') else None
+            }
+        
+        snapshot = MappingProxyType({
+            'timestamp': now,
+            # Non-blocking: CPU use since the previous sample
+            'cpu_percent': psutil.cpu_percent(interval=None),
+            'memory_percent': memory.percent,
+            'memory_available_bytes': memory.available,
+            'disk_percent': psutil.disk_usage('/').percent,
+            'process': MappingProxyType(process_stats),
+            'gc': MappingProxyType({
+                'counts': gc.get_count(),
+                'collections': tuple(generation['collections'] for generation in gc.get_stats()),
+                'uncollectable': tuple(generation['uncollectable'] for generation in gc.get_stats())
+            })
+        })
+        self.system_snapshot = snapshot
+        
+        self.metrics['memory_usage'].append({'timestamp': now, 'percent': snapshot['memory_percent']})
+        self.metrics['cpu_usage'].append({'timestamp': now, 'percent': snapshot['cpu_percent']})
+        return snapshot
+    
+    def get_system_snapshot(self):
+        """Latest published sample, taking one only if the sampler has not run yet"""
+        snapshot = self.system_snapshot
+        if snapshot is None:
+            snapshot = self._sample_system()
+        return snapshot
+    
     def _monitor_system(self):
         """Background thread to monitor system resources"""
         while self.monitoring_active:
             try:
-                # Monitor memory usage
-                memory_percent = psutil.virtual_memory().percent
-                self.metrics['memory_usage'].append({
-                    'timestamp': datetime.now(),
-                    'percent': memory_percent
-                })
-                
-                # Monitor CPU usage
-                cpu_percent = psutil.cpu_percent(interval=1)
-                self.metrics['cpu_usage'].append({
-                    'timestamp': datetime.now(),
-                    'percent': cpu_percent
-                })
+                snapshot = self._sample_system()
                 
                 # Log warnings for high resource usage
-                if memory_percent > 85:
-                    logger.warning(f"High memory usage: {memory_percent}%")
+                if snapshot['memory_percent'] > 85:
+                    logger.warning(f"High memory usage: {snapshot['memory_percent']}%")
                 
-                if cpu_percent > 80:
-                    logger.warning(f"High CPU usage: {cpu_percent}%")
-                
-                time.sleep(30)  # Monitor every 30 seconds
+                if snapshot['cpu_percent'] > 80:
+                    logger.warning(f"High CPU usage: {snapshot['cpu_percent']}%")
                 
+                self._stop_event.wait(self.sample_interval)
+            
             except Exception as e:
                 logger.error(f"System monitoring error: {e}")
-                time.sleep(60)  # Wait longer on error
+                self._stop_event.wait(60)  # Wait longer on error
     
     def get_performance_report(self):
         """Generate comprehensive performance report"""
@@ -131,40 +1085,43 @@ class PerformanceMonitor:
         uptime = now - self.start_time
         
         # Calculate request statistics
-        request_times = list(self.metrics['request_times'])
-        if request_times:
-            avg_response_time = sum(request_times) / len(request_times)
-            max_response_time = max(request_times)
-            min_response_time = min(request_times)
-            # Calculate 95th percentile
-            sorted_times = sorted(request_times)
-            p95_index = int(len(sorted_times) * 0.95)
-            p95_response_time = sorted_times[p95_index] if sorted_times else 0
+        endpoint_totals = self._endpoint_totals()
+        overall = LatencyHistogram()
+        for histogram in endpoint_totals.values():
+            overall.merge(histogram)
+        
+        if overall.count:
+            avg_response_time = overall.total / overall.count
+            max_response_time = overall.max
+            min_response_time = overall.min
+            p95_response_time = overall.quantile(0.95)
         else:
             avg_response_time = max_response_time = min_response_time = p95_response_time = 0
         
         # Top slow endpoints
         slow_endpoints = sorted(
-            self.metrics['endpoint_stats'].items(),
-            key=lambda x: x[1]['total_time'] / x[1]['count'] if x[1]['count'] > 0 else 0,
+            endpoint_totals.items(),
+            key=lambda x: x[1].quantile(0.99),
             reverse=True
         )[:5]
         
         # Most popular endpoints
         popular_endpoints = sorted(
-            self.metrics['endpoint_stats'].items(),
-            key=lambda x: x[1]['count'],
+            endpoint_totals.items(),
+            key=lambda x: x[1].count,
             reverse=True
         )[:5]
         
         # Current system resources
-        current_memory = psutil.virtual_memory().percent
-        current_cpu = psutil.cpu_percent()
-        disk_usage = psutil.disk_usage('/').percent
+        snapshot = self.get_system_snapshot()
+        current_memory = snapshot['memory_percent']
+        current_cpu = snapshot['cpu_percent']
+        disk_usage = snapshot['disk_percent']
         
         # Recent averages
-        recent_memory = list(self.metrics['memory_usage'])[-10:]  # Last 10 readings
-        recent_cpu = list(self.metrics['cpu_usage'])[-10:]
+        ten_minutes_ago = now - timedelta(minutes=10)
+        recent_memory = [m for m in list(self.metrics['memory_usage']) if m['timestamp'] >= ten_minutes_ago]
+        recent_cpu = [c for c in list(self.metrics['cpu_usage']) if c['timestamp'] >= ten_minutes_ago]
         
         avg_memory = sum(m['percent'] for m in recent_memory) / len(recent_memory) if recent_memory else 0
         avg_cpu = sum(c['percent'] for c in recent_cpu) / len(recent_cpu) if recent_cpu else 0
@@ -176,7 +1133,7 @@ class PerformanceMonitor:
             
             # Request metrics
             'requests': {
-                'total_processed': sum(stats['count'] for stats in self.metrics['endpoint_stats'].values()),
+                'total_processed': overall.count,
                 'active_connections': self.metrics['active_connections'],
                 'avg_response_time': round(avg_response_time, 3),
                 'max_response_time': round(max_response_time, 3),
@@ -191,6 +1148,9 @@ class PerformanceMonitor:
                 'disk_percent': disk_usage,
                 'avg_memory_10min': round(avg_memory, 1),
                 'avg_cpu_10min': round(avg_cpu, 1),
+                'process': dict(snapshot['process']),
+                'gc': dict(snapshot['gc']),
+                'sampled_at': snapshot['timestamp'].isoformat()
             },
             
             # Endpoint performance
@@ -198,21 +1158,37 @@ class PerformanceMonitor:
                 'slowest': [
                     {
                         'endpoint': endpoint,
-                        'avg_time': round(stats['total_time'] / stats['count'], 3),
-                        'count': stats['count']
+                        'avg_time': round(histogram.total / histogram.count, 3),
+                        'p99_time': round(histogram.quantile(0.99), 3),
+                        'count': histogram.count
                     }
-                    for endpoint, stats in slow_endpoints
+                    for endpoint, histogram in slow_endpoints
                 ],
                 'most_popular': [
                     {
                         'endpoint': endpoint,
-                        'count': stats['count'],
-                        'avg_time': round(stats['total_time'] / stats['count'], 3)
+                        'count': histogram.count,
+                        'avg_time': round(histogram.total / histogram.count, 3)
                     }
-                    for endpoint, stats in popular_endpoints
+                    for endpoint, histogram in popular_endpoints
                 ]
             },
             
+            # Latency quantiles per endpoint, status class and window
+            'latency': self.get_latency_stats(),
+            
+            # SQL per endpoint and likely N+1 statements
+            'database': self.queries.get_report(),
+            
+            # Pool checkout wait, transactions and lock errors
+            'connections': self.connections.get_report(),
+            
+            # Render time per endpoint, template, block and macro
+            'templates': self.templates.get_report(),
+            
+            # GC pauses and sampled allocations
+            'memory': self.memory.get_report(),
+            
             # Error statistics
             'errors': dict(self.metrics['error_counts']),
             'total_errors': sum(self.metrics['error_counts'].values())
@@ -223,9 +1199,11 @@ class PerformanceMonitor:
     def get_health_status(self):
         """Get system health status"""
         try:
-            memory_percent = psutil.virtual_memory().percent
-            cpu_percent = psutil.cpu_percent()
-            disk_percent = psutil.disk_usage('/').percent
+            # O(1): read the sampler's snapshot instead of calling psutil per probe
+            snapshot = self.get_system_snapshot()
+            memory_percent = snapshot['memory_percent']
+            cpu_percent = snapshot['cpu_percent']
+            disk_percent = snapshot['disk_percent']
             
             # Calculate health score
             health_score = 100
@@ -250,7 +1228,7 @@ class PerformanceMonitor:
                 health_score -= 10
             
             # Check error rate
-            total_requests = sum(stats['count'] for stats in self.metrics['endpoint_stats'].values())
+            total_requests = self.metrics['total_requests']
             total_errors = sum(self.metrics['error_counts'].values())
             error_rate = (total_errors / total_requests * 100) if total_requests > 0 else 0
             
@@ -277,11 +1255,14 @@ class PerformanceMonitor:
                 'memory_percent': memory_percent,
                 'cpu_percent': cpu_percent,
                 'disk_percent': disk_percent,
+                'process_rss_bytes': snapshot['process']['rss_bytes'],
+                'process_threads': snapshot['process']['threads'],
                 'error_rate': round(error_rate, 2),
                 'active_connections': self.metrics['active_connections'],
-                'uptime_seconds': (datetime.now() - self.start_time).total_seconds()
+                'uptime_seconds': (datetime.now() - self.start_time).total_seconds(),
+                'sample_age_seconds': round((datetime.now() - snapshot['timestamp']).total_seconds(), 1)
             }
-            
+        
         except Exception as e:
             logger.error(f"Health check error: {e}")
             return {
@@ -340,7 +1321,7 @@ def database_performance_check(db_path):
             'indexes': len(indexes),
             'tables': len(tables)
         }
-        
+    
     except Exception as e:
         logger.error(f"Database performance check error: {e}")
         return {'error': str(e)}
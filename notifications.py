@@ -7,13 +7,10 @@ from flask_socketio import SocketIO, emit, join_room, leave_room, disconnect
 from flask import request
 from flask_login import current_user
 import json
-try:
-    import redis
-except ImportError:
-    redis = None
 import logging
 from datetime import datetime
 from models import db, Order, User
+from redis_connection import REDIS_OUTAGE_ERRORS, RedisConnection
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +21,7 @@ class NotificationManager:
         self.app = app
         self.socketio = socketio
         self.redis_client = None
+        self.redis_connection = None
         self.connected_users = {}
         
     def init_app(self, app, socketio):
@@ -31,16 +29,14 @@ class NotificationManager:
         self.app = app
         self.socketio = socketio
         
-        # Initialize Redis for message persistence (optional)
-        redis_url = app.config.get('REDIS_URL')
-        if redis_url and redis_url != 'memory://' and redis:
-            try:
-                self.redis_client = redis.from_url(redis_url)
-                self.redis_client.ping()
+        # Initialize Redis for message persistence (optional), shared with the cache
+        self.redis_connection = RedisConnection.from_app(app)
+        if self.redis_connection:
+            self.redis_client = self.redis_connection.client
+            if self.redis_connection.check():
                 logger.info("Redis connected for notifications")
-            except Exception as e:
-                logger.warning(f"Redis connection failed: {e}")
-                self.redis_client = None
+            else:
+                logger.warning("Redis connection failed, notifications will not be persisted until it recovers")
         
         # Register SocketIO event handlers
         self.register_handlers()
@@ -250,21 +246,35 @@ class NotificationManager:
         except Exception as e:
             logger.error(f"Failed to broadcast staff status update: {e}")
     
+    def _redis_available(self):
+        """True when Redis is configured and not tripped by recent failures"""
+        if not self.redis_client:
+            return False
+        return self.redis_connection is None or self.redis_connection.breaker.allow_request()
+    
+    def _redis_error(self, error):
+        """Report connection-level failures to the shared circuit breaker"""
+        if self.redis_connection and isinstance(error, REDIS_OUTAGE_ERRORS):
+            self.redis_connection.breaker.record_failure(error)
+    
     def store_notification(self, role, notification_data):
         """Store notification in Redis for persistence"""
-        if self.redis_client:
+        if self._redis_available():
             try:
                 key = f"notifications:{role}"
-                # Keep last 50 notifications per role
-                self.redis_client.lpush(key, json.dumps(notification_data))
-                self.redis_client.ltrim(key, 0, 49)
-                self.redis_client.expire(key, 86400)  # Expire in 24 hours
+                # Keep last 50 notifications per role, one round trip
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.lpush(key, json.dumps(notification_data))
+                pipe.ltrim(key, 0, 49)
+                pipe.expire(key, 86400)  # Expire in 24 hours
+                pipe.execute()
             except Exception as e:
                 logger.error(f"Failed to store notification in Redis: {e}")
+                self._redis_error(e)
     
     def send_pending_notifications(self, user_id):
         """Send pending notifications to user"""
-        if self.redis_client:
+        if self._redis_available():
             try:
                 user = User.query.get(user_id)
                 if user and hasattr(user, 'role'):
@@ -278,6 +288,7 @@ class NotificationManager:
                         
             except Exception as e:
                 logger.error(f"Failed to send pending notifications: {e}")
+                self._redis_error(e)
     
     def get_status_text(self, status):
         """Get human-readable status text"""
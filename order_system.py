@@ -5,13 +5,15 @@ Complete order processing with status tracking, notifications, and validation
 
 from flask import Blueprint, request, jsonify, session
 from models import (
-    db, Order, OrderItem, OrderItemOption, Menu, MenuOptionItem, 
+    db, Order, Menu, MenuOptionItem, 
     DeliveryZone, User, get_thai_now
 )
 from datetime import datetime, timedelta
 import uuid
 import hashlib
 from cart_system import CartManager
+from sqlite_profile import sqlite_profile
+from order_writer import OrderWriter
 
 # Create order blueprint
 order_bp = Blueprint('order', __name__, url_prefix='/api/order')
@@ -36,6 +38,14 @@ class OrderManager:
         'digital_wallet': 'กระเป๋าเงินดิจิทัล'
     }
     
+    # Order.payment_method values for each method above
+    PAYMENT_METHOD_CODES = {
+        'cod': 'COD',
+        'bank_transfer': 'TOD',
+        'credit_card': 'CARD',
+        'digital_wallet': 'WALLET'
+    }
+    
     @staticmethod
     def generate_order_number():
         """Generate unique order number"""
@@ -106,28 +116,17 @@ class OrderManager:
     @staticmethod
     def create_order_items(order, cart_items):
         """Create order items from cart items"""
-        for cart_item in cart_items:
-            # Create order item
-            order_item = OrderItem(
-                order_id=order.id,
-                menu_id=cart_item['menu_id'],
-                quantity=cart_item['quantity'],
-                unit_price=cart_item['menu_price'],
-                total_price=cart_item['total_price'],
-                special_instructions=cart_item.get('special_instructions', '')
+        return OrderWriter.insert_items(order.id, [
+            OrderWriter.item_row(
+                cart_item['menu_id'],
+                cart_item['menu_name'],
+                cart_item['menu_price'],
+                cart_item['quantity'],
+                cart_item.get('special_instructions', ''),
+                [(option['id'], option['name'], option['price']) for option in cart_item.get('options', [])]
             )
-            
-            db.session.add(order_item)
-            db.session.flush()  # Get order_item.id
-            
-            # Create order item options
-            for option in cart_item.get('options', []):
-                order_option = OrderItemOption(
-                    order_item_id=order_item.id,
-                    option_item_id=option['id'],
-                    additional_price=option['price']
-                )
-                db.session.add(order_option)
+            for cart_item in cart_items
+        ])
     
     @staticmethod
     def send_order_notification(order, notification_type='new_order'):
@@ -187,37 +186,39 @@ def place_order():
         discount = data.get('discount', 0)
         totals = OrderManager.calculate_order_totals(cart['items'], delivery_fee, discount)
         
-        # Create order
-        order = Order(
-            order_number=OrderManager.generate_order_number(),
-            customer_name=customer_info['name'].strip(),
-            customer_phone=customer_info['phone'].strip(),
-            customer_email=customer_info.get('email', '').strip(),
-            delivery_address=customer_info['address'].strip(),
-            delivery_zone_id=cart.get('zone_id'),
-            order_type='delivery' if delivery_zone else 'pickup',
-            payment_method=payment_info['method'],
-            payment_status='pending',
-            status='pending',
-            subtotal=totals['subtotal'],
-            tax_amount=totals['tax_amount'],
-            service_charge=totals['service_charge'],
-            delivery_fee=totals['delivery_fee'],
-            discount_amount=totals['discount_amount'],
-            total_amount=totals['total'],
-            special_instructions=data.get('special_instructions', ''),
-            estimated_delivery_time=get_thai_now() + timedelta(minutes=45),  # Default 45 min
-            created_at=get_thai_now()
-        )
-        
-        db.session.add(order)
-        db.session.flush()  # Get order.id
-        
-        # Create order items
-        OrderManager.create_order_items(order, cart['items'])
-        
-        # Commit transaction
-        db.session.commit()
+        # Orders have no notes column, the rider reads them with the address
+        delivery_address = customer_info['address'].strip()
+        special_instructions = data.get('special_instructions', '').strip()
+        if special_instructions:
+            delivery_address = f"{delivery_address}\nหมายเหตุ: {special_instructions}"
+        
+        # Create order, rebuilt from scratch if SQLite reports the database locked
+        @sqlite_profile.retry_on_locked
+        def save_order():
+            order = Order(
+                customer_name=customer_info['name'].strip(),
+                customer_phone=customer_info['phone'].strip(),
+                delivery_address_details=delivery_address,
+                delivery_zone_id=cart.get('zone_id'),
+                total_price=totals['total'],
+                payment_method=OrderManager.PAYMENT_METHOD_CODES[payment_info['method']],
+                payment_status='pending',
+                status='pending',
+                created_at=get_thai_now()
+            )
+            order.generate_order_number()
+            
+            db.session.add(order)
+            db.session.flush()  # Get order.id
+            
+            # Create order items
+            OrderManager.create_order_items(order, cart['items'])
+            
+            # Commit transaction
+            db.session.commit()
+            return order
+        
+        order = save_order()
         
         # Clear cart
         session['cart'] = {
@@ -241,10 +242,10 @@ def place_order():
                 'order_number': order.order_number,
                 'status': order.status,
                 'status_text': OrderManager.ORDER_STATUSES.get(order.status),
-                'total_amount': float(order.total_amount),
-                'estimated_delivery_time': order.estimated_delivery_time.isoformat(),
-                'payment_method': order.payment_method,
-                'payment_method_text': OrderManager.PAYMENT_METHODS.get(order.payment_method)
+                'total_amount': float(order.total_price),
+                'estimated_delivery_time': (order.created_at + timedelta(minutes=45)).isoformat(),  # Default 45 min
+                'payment_method': payment_info['method'],
+                'payment_method_text': OrderManager.PAYMENT_METHODS.get(payment_info['method'])
             }
         }), 201
         
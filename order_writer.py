@@ -0,0 +1,71 @@
+"""
+Order Writer
+Set-based inserts of an order's items and options
+"""
+
+from sqlalchemy import insert
+
+from models import db, OrderItem, OrderItemOption
+
+class OrderWriter:
+    """Writes order items and their options with a fixed number of statements
+    
+    Adding and flushing one item at a time costs a round trip per item and
+    per option. Here all item rows go out as one INSERT ... RETURNING id
+    (batched by SQLAlchemy's insertmanyvalues), then all option rows as one
+    executemany, whatever the size of the basket.
+    
+    SQLite has no sentinel for sort_by_parameter_order and would fall back
+    to a statement per row. The flushed order already holds its write lock,
+    so rowids are handed out in VALUES order and sorting them is enough.
+    """
+    
+    @staticmethod
+    def item_row(menu_id, menu_name, price_per_item, quantity, special_requests=None, options=()):
+        """One order line, options are (option_id, option_name, option_price) tuples"""
+        return {
+            'menu_id': menu_id,
+            'menu_name': menu_name,
+            'price_per_item': price_per_item,
+            'quantity': quantity,
+            'special_requests': special_requests,
+            'options': [
+                {'option_id': option_id, 'option_name': option_name, 'option_price': option_price}
+                for option_id, option_name, option_price in options
+            ]
+        }
+    
+    @staticmethod
+    def insert_items(order_id, items):
+        """Insert the lines of a flushed order, returns the new item ids in line order"""
+        if not items:
+            return []
+        
+        in_order = db.session.get_bind().dialect.name != 'sqlite'
+        item_ids = db.session.scalars(
+            insert(OrderItem).returning(OrderItem.id, sort_by_parameter_order=in_order),
+            [
+                {key: value for key, value in item.items() if key != 'options'} | {'order_id': order_id}
+                for item in items
+            ]
+        ).all()
+        if not in_order:
+            item_ids = sorted(item_ids)
+        
+        option_rows = [
+            dict(option, order_item_id=item_id)
+            for item_id, item in zip(item_ids, items)
+            for option in item['options']
+        ]
+        if option_rows:
+            db.session.execute(insert(OrderItemOption), option_rows)
+        return item_ids
+    
+    @staticmethod
+    def write(order, items):
+        """Insert a new order with its lines and commit once"""
+        db.session.add(order)
+        db.session.flush()  # Assigns order.id
+        OrderWriter.insert_items(order.id, items)
+        db.session.commit()
+        return order
@@ -0,0 +1,208 @@
+"""
+Request Sampling Profiler
+Statistical stack profiles of single requests, saved as collapsed stacks
+"""
+
+import os
+import sys
+import hmac
+import time
+import random
+import hashlib
+import logging
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+try:
+    # Under eventlet the threading module is green; sample from a real thread
+    from eventlet.patcher import original, is_monkey_patched
+    _threading = original('threading')
+except ImportError:
+    import threading as _threading
+    is_monkey_patched = None
+
+logger = logging.getLogger(__name__)
+
+def green_threads_active():
+    """True when eventlet has monkey-patched threads (gunicorn --worker-class eventlet)
+    
+    All greenlets then run on one OS thread, so sampling that thread's
+    stack would mix every concurrent request into the profile.
+    """
+    return is_monkey_patched is not None and is_monkey_patched('thread')
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval from a helper thread
+    
+    Stacks are kept collapsed ("outer;inner;leaf" -> count), the format
+    flamegraph.pl and speedscope read directly.
+    """
+    
+    def __init__(self, thread_id, interval=0.005, max_seconds=30):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = _threading.Event()
+        self._thread = None
+    
+    def start(self):
+        self._thread = _threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        return self.stacks
+    
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+class RequestProfiler:
+    """Profiles requests on demand and keeps a bounded ring of profile files
+    
+    A request is profiled when it carries a valid signed token in the
+    X-Profile-Token header or _profile query argument, or when its endpoint
+    has a sample rate and the dice say so. Nothing is profiled under
+    eventlet monkey patching, see green_threads_active().
+    """
+    
+    TOKEN_HEADER = 'X-Profile-Token'
+    TOKEN_ARG = '_profile'
+    
+    def __init__(self, app=None):
+        self.app = app
+        self.profile_dir = 'profiles'
+        self.max_files = 50
+        self.interval = 0.005
+        self.max_seconds = 30
+        self.sample_rates = {}  # endpoint -> fraction of requests to profile
+        self.stats = {'profiled': 0, 'token_rejected': 0, 'write_errors': 0, 'unsupported': 0}
+    
+    def init_app(self, app):
+        """Initialize request profiler with Flask app"""
+        self.app = app
+        self.profile_dir = app.config.get('PROFILE_DIR', 'profiles')
+        self.max_files = app.config.get('PROFILE_MAX_FILES', 50)
+        self.interval = app.config.get('PROFILE_INTERVAL', 0.005)
+        self.max_seconds = app.config.get('PROFILE_MAX_SECONDS', 30)
+        self.sample_rates = dict(app.config.get('PROFILE_SAMPLE_RATES', {}))
+        if green_threads_active():
+            logger.warning("Request profiling disabled: eventlet runs every request on one OS thread")
+    
+    def _signature(self, expires):
+        key = self.app.config['SECRET_KEY'].encode()
+        return hmac.new(key, f"profile:{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+    
+    def make_token(self, ttl=300):
+        """Signed token that enables profiling for ttl seconds"""
+        expires = int(time.time()) + ttl
+        return f"{expires}.{self._signature(expires)}"
+    
+    def verify_token(self, token):
+        try:
+            expires, signature = token.split('.', 1)
+            if int(expires) < time.time():
+                return False
+            # Compare bytes, compare_digest raises TypeError on non-ASCII str
+            return hmac.compare_digest(signature.encode(), self._signature(int(expires)).encode())
+        except (TypeError, ValueError):
+            return False
+    
+    def set_sample_rate(self, endpoint, rate):
+        """Profile this fraction of the endpoint's requests, 0 turns it off"""
+        if rate > 0:
+            self.sample_rates[endpoint] = min(rate, 1.0)
+        else:
+            self.sample_rates.pop(endpoint, None)
+    
+    def should_profile(self, request):
+        token = request.headers.get(self.TOKEN_HEADER) or request.args.get(self.TOKEN_ARG)
+        if token:
+            if self.verify_token(token):
+                return True
+            self.stats['token_rejected'] += 1
+            logger.warning(f"Rejected profiling token for {request.endpoint}")
+        rate = self.sample_rates.get(request.endpoint)
+        return bool(rate) and random.random() < rate
+    
+    def start(self, request):
+        """Start sampling the current thread if this request should be profiled"""
+        if self.app is None or not self.should_profile(request):
+            return None
+        if green_threads_active():
+            self.stats['unsupported'] += 1
+            return None
+        return StackSampler(_threading.get_ident(), self.interval, self.max_seconds).start()
+    
+    def finish(self, sampler, endpoint, duration):
+        """Stop sampling and write the profile, returns its file name"""
+        stacks = sampler.stop()
+        if not stacks:
+            return None
+        
+        Path(self.profile_dir).mkdir(parents=True, exist_ok=True)
+        safe_endpoint = ''.join(c if c.isalnum() else '_' for c in endpoint)
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{safe_endpoint}_{int(duration * 1000)}ms.folded"
+        try:
+            with open(os.path.join(self.profile_dir, filename), 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self._trim()
+        except OSError as e:
+            self.stats['write_errors'] += 1
+            logger.error(f"Could not write profile {filename}: {e}")
+            return None
+        
+        self.stats['profiled'] += 1
+        logger.info(f"Profiled {endpoint} ({sampler.samples} samples): {filename}")
+        return filename
+    
+    def _trim(self):
+        """Delete the oldest profiles beyond max_files"""
+        profiles = self.list_profiles()
+        for profile in profiles[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.profile_dir, profile['filename']))
+            except OSError:
+                pass
+    
+    def list_profiles(self):
+        """Saved profiles, newest first"""
+        if not os.path.isdir(self.profile_dir):
+            return []
+        profiles = []
+        for entry in os.scandir(self.profile_dir):
+            if entry.name.endswith('.folded'):
+                stat = entry.stat()
+                profiles.append({
+                    'filename': entry.name,
+                    'size': stat.st_size,
+                    'created': datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
+        profiles.sort(key=lambda x: x['filename'], reverse=True)
+        return profiles
+    
+    def get_status(self):
+        return {
+            'sample_rates': dict(self.sample_rates),
+            'profile_dir': self.profile_dir,
+            'max_files': self.max_files,
+            'stats': dict(self.stats),
+            'profiles': self.list_profiles()
+        }
@@ -0,0 +1,194 @@
+"""
+Shared Redis Connections
+Pooled Redis clients with tight timeouts and a circuit breaker
+"""
+
+import threading
+import time
+from collections import deque
+import logging
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean Redis itself is unhealthy, as opposed to a bad command
+REDIS_OUTAGE_ERRORS = (redis.ConnectionError, redis.TimeoutError, OSError) if redis else (OSError,)
+
+class CircuitBreaker:
+    """Stops calling a failing dependency and probes it until it recovers
+    
+    closed: requests flow, failures are counted
+    open: requests are refused until reset_timeout has passed
+    half_open: one caller runs the probe, success closes the breaker
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name, probe=None, failure_threshold=3, failure_window=30, reset_timeout=10):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_at = 0
+        self.last_error = None
+        self.stats = {'trips': 0, 'recoveries': 0, 'failed_probes': 0, 'rejected': 0}
+        self._failures = deque()  # monotonic timestamps of recent failures
+        self._recovery_listeners = []
+        self._lock = threading.Lock()
+    
+    def add_recovery_listener(self, callback):
+        """Call callback() each time the breaker closes after an outage"""
+        if callback not in self._recovery_listeners:
+            self._recovery_listeners.append(callback)
+    
+    def allow_request(self):
+        """True if the dependency may be called right now"""
+        if self.state == self.CLOSED:
+            return True
+        
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN or time.monotonic() - self.opened_at < self.reset_timeout:
+                # Still cooling down, or another caller is probing
+                self.stats['rejected'] += 1
+                return False
+            self.state = self.HALF_OPEN
+        
+        try:
+            if self.probe:
+                self.probe()
+        except Exception as e:
+            with self._lock:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.last_error = str(e)
+                self.stats['failed_probes'] += 1
+            return False
+        
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures.clear()
+            self.stats['recoveries'] += 1
+        logger.info(f"{self.name} recovered, circuit closed")
+        
+        for callback in self._recovery_listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"{self.name} recovery listener failed: {e}")
+        return True
+    
+    def record_failure(self, error=None, trip=False):
+        """Count a failure, opening the circuit once the threshold is reached"""
+        now = time.monotonic()
+        with self._lock:
+            self.last_error = str(error) if error is not None else self.last_error
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.failure_window:
+                self._failures.popleft()
+            
+            if self.state == self.OPEN:
+                return
+            if not trip and len(self._failures) < self.failure_threshold:
+                return
+            
+            self.state = self.OPEN
+            self.opened_at = now
+            self.stats['trips'] += 1
+        
+        logger.warning(f"{self.name} unavailable, circuit opened for {self.reset_timeout}s: {error}")
+    
+    def get_stats(self):
+        """Get breaker state and counters"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+            stats['recent_failures'] = len(self._failures)
+            stats['last_error'] = self.last_error
+        if self.state == self.OPEN:
+            stats['retry_in_seconds'] = round(max(0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+        return stats
+
+class RedisConnection:
+    """Pooled Redis client plus the breaker guarding it
+    
+    One instance is shared per REDIS_URL, so caching and notifications
+    use the same pool and trip the same breaker.
+    """
+    
+    _instances = {}
+    _instances_lock = threading.Lock()
+    
+    def __init__(self, url, max_connections=50, socket_timeout=0.5, connect_timeout=0.25,
+                 health_check_interval=30, failure_threshold=3, failure_window=30, reset_timeout=10):
+        self.url = url
+        self.pool = redis.ConnectionPool.from_url(
+            url,
+            max_connections=max_connections,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=connect_timeout,
+            health_check_interval=health_check_interval
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+        # Subscribers block on reads for long stretches, so no socket_timeout here
+        self.pubsub_client = redis.from_url(
+            url,
+            socket_connect_timeout=connect_timeout,
+            health_check_interval=health_check_interval
+        )
+        self.breaker = CircuitBreaker(
+            'Redis',
+            probe=self.client.ping,
+            failure_threshold=failure_threshold,
+            failure_window=failure_window,
+            reset_timeout=reset_timeout
+        )
+    
+    @classmethod
+    def from_app(cls, app):
+        """Shared connection for the app's REDIS_URL, or None when Redis is not configured"""
+        redis_url = app.config.get('REDIS_URL')
+        if not redis_url or redis_url == 'memory://' or not redis:
+            return None
+        
+        with cls._instances_lock:
+            connection = cls._instances.get(redis_url)
+            if connection is None:
+                connection = cls(
+                    redis_url,
+                    max_connections=app.config.get('REDIS_MAX_CONNECTIONS', 50),
+                    socket_timeout=app.config.get('REDIS_SOCKET_TIMEOUT', 0.5),
+                    connect_timeout=app.config.get('REDIS_CONNECT_TIMEOUT', 0.25),
+                    health_check_interval=app.config.get('REDIS_HEALTH_CHECK_INTERVAL', 30),
+                    failure_threshold=app.config.get('REDIS_BREAKER_FAILURES', 3),
+                    failure_window=app.config.get('REDIS_BREAKER_WINDOW', 30),
+                    reset_timeout=app.config.get('REDIS_BREAKER_RESET', 10)
+                )
+                cls._instances[redis_url] = connection
+        return connection
+    
+    def check(self):
+        """Ping once at startup, opening the breaker straight away if Redis is down"""
+        try:
+            self.client.ping()
+            return True
+        except Exception as e:
+            self.breaker.record_failure(e, trip=True)
+            return False
+    
+    def get_stats(self):
+        """Get connection pool usage"""
+        return {
+            'max_connections': self.pool.max_connections,
+            'in_use_connections': len(getattr(self.pool, '_in_use_connections', ())),
+            'idle_connections': len(getattr(self.pool, '_available_connections', ()))
+        }
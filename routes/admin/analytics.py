@@ -17,6 +17,7 @@ from models import (
     get_thai_now, update_daily_report, update_hourly_stats, 
     update_menu_popularity
 )
+from time_windows import TimeWindow
 from .auth import admin_required
 from . import admin_bp
 
@@ -41,8 +42,9 @@ def best_sellers():
     """Best selling items analysis page"""
     try:
         # Get date range from request (default to last 30 days)
-        end_date = datetime.now().date()
+        end_date = get_thai_now().date()
         start_date = end_date - timedelta(days=30)
+        window = TimeWindow.for_dates(start_date, end_date)
         
         # Get best selling items with sales data
         best_sellers_query = db.session.query(
@@ -59,8 +61,7 @@ def best_sellers():
             Order, OrderItem.order_id == Order.id
         ).filter(
             Order.status.in_(['completed', 'delivered']),
-            func.date(Order.created_at) >= start_date,
-            func.date(Order.created_at) <= end_date
+            window.filter(Order.created_at)
         ).group_by(
             Menu.id, Menu.name, Menu.category, Menu.price
         ).order_by(
@@ -94,8 +95,8 @@ def best_sellers():
         # Return empty data if there's an error
         return render_template('admin/analytics/best_sellers.html', 
                              best_sellers=[],
-                             start_date=datetime.now().date() - timedelta(days=30),
-                             end_date=datetime.now().date())
+                             start_date=get_thai_now().date() - timedelta(days=30),
+                             end_date=get_thai_now().date())
 
 
 @admin_bp.route('/analytics/feedback')
@@ -172,7 +173,7 @@ def cash_reconciliation():
         if report_date:
             report_date = datetime.strptime(report_date, '%Y-%m-%d').date()
         else:
-            report_date = datetime.now().date()
+            report_date = get_thai_now().date()
         
         # Calculate reconciliation data
         reconciliation_data = {
@@ -231,7 +232,7 @@ def cash_reconciliation():
         # Return empty data if there's an error
         return render_template('admin/reports/cash_reconciliation.html', 
                              reconciliation={
-                                 'report_date': datetime.now().date(),
+                                 'report_date': get_thai_now().date(),
                                  'opening_cash': 0,
                                  'sales_summary': {},
                                  'expenses': {},
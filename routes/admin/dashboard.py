@@ -8,32 +8,34 @@ and quick access to management functions.
 
 from flask import render_template, jsonify
 from flask_login import current_user
-from sqlalchemy import func
 from datetime import datetime, timedelta
 from models import (
     Order, Menu, Ingredient, User, StockAdjustment, 
     Promotion, DeliveryZone, get_thai_now
 )
+from time_windows import TimeWindow
+from caching import cached, cache_warmer
 from .auth import admin_required
 from . import admin_bp
 
 
-@admin_bp.route('/')
-@admin_bp.route('/dashboard')
-@admin_required
-def dashboard():
-    """Main admin dashboard"""
-    # Get today's date range
-    today = get_thai_now().date()
-    tomorrow = today + timedelta(days=1)
-    
+@cache_warmer.register('dashboard_tiles', tags=['analytics'])
+@cached(
+    timeout=300,
+    key_func=lambda: f"analytics:dashboard_tiles:{get_thai_now().date()}",
+    tags=['analytics'],
+    single_flight=True,
+    soft_ttl=30
+)
+def get_dashboard_tiles():
+    """Today's statistic tiles, refreshed in the background after 30 seconds"""
     # Order statistics for today
     today_orders = Order.query.filter(
-        func.date(Order.created_at) == today
+        TimeWindow.today().filter(Order.created_at)
     ).all()
     
     # Calculate statistics
-    stats = {
+    return {
         'total_orders_today': len(today_orders),
         'total_revenue_today': sum(float(order.total_price) for order in today_orders),
         'pending_orders': len([o for o in today_orders if o.status == 'pending']),
@@ -45,6 +47,14 @@ def dashboard():
         ).count(),
         'active_promotions': 0  # Will implement later
     }
+
+
+@admin_bp.route('/')
+@admin_bp.route('/dashboard')
+@admin_required
+def dashboard():
+    """Main admin dashboard"""
+    stats = get_dashboard_tiles()
     
     # Recent orders (last 10)
     recent_orders = Order.query.order_by(Order.created_at.desc()).limit(10).all()
@@ -68,12 +78,9 @@ def dashboard():
 @admin_required
 def api_dashboard_stats():
     """API endpoint for dashboard statistics (for AJAX updates)"""
-    # Get today's date range
-    today = get_thai_now().date()
-    
     # Order statistics for today
     today_orders = Order.query.filter(
-        func.date(Order.created_at) == today
+        TimeWindow.today().filter(Order.created_at)
     ).all()
     
     # Order status distribution
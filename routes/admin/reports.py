@@ -14,6 +14,7 @@ from models import (
     Order, OrderItem, Menu, Ingredient, StockAdjustment,
     User, DeliveryZone, db, get_thai_now
 )
+from time_windows import TimeWindow
 from .auth import admin_required
 from . import admin_bp
 
@@ -62,9 +63,9 @@ def sales_report():
             default_period = f'{start_date} ถึง {end_date}'
         
         # Build query
+        window = TimeWindow.for_dates(start_dt, end_dt)
         query = Order.query.filter(
-            func.date(Order.created_at) >= start_dt,
-            func.date(Order.created_at) <= end_dt,
+            window.filter(Order.created_at),
             Order.status.in_(['delivered', 'completed'])
         )
         
@@ -79,12 +80,8 @@ def sales_report():
         average_order_value = total_revenue / total_orders if total_orders > 0 else 0
         
         # Calculate growth rate (compare with previous period)
-        previous_start = start_dt - (end_dt - start_dt)
-        previous_end = start_dt
-        
         previous_query = Order.query.filter(
-            func.date(Order.created_at) >= previous_start,
-            func.date(Order.created_at) < previous_end,
+            window.previous().filter(Order.created_at),
             Order.status.in_(['delivered', 'completed'])
         )
         if zone_id:
@@ -486,8 +483,7 @@ def operations_report():
         
         # Get all orders in date range
         orders = Order.query.filter(
-            func.date(Order.created_at) >= start_dt,
-            func.date(Order.created_at) <= end_dt
+            TimeWindow.for_dates(start_dt, end_dt).filter(Order.created_at)
         ).all()
         
         completed_orders = [o for o in orders if o.status in ['delivered', 'completed']]
@@ -767,8 +763,7 @@ def api_sales_chart():
     
     # Get sales data
     orders = Order.query.filter(
-        func.date(Order.created_at) >= start_date,
-        func.date(Order.created_at) <= end_date,
+        TimeWindow.for_dates(start_date, end_date).filter(Order.created_at),
         Order.status.in_(['delivered', 'completed'])
     ).all()
     
@@ -11,9 +11,12 @@ This module handles all API endpoints for:
 
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_required, current_user
-from models import db, Order, OrderItem, OrderItemOption, Menu, MenuOptionItem, Feedback, DeliveryZone
+from models import db, Order, Menu, MenuOptionItem, Feedback, DeliveryZone
 from routes.customer import add_to_cart, remove_from_cart, update_cart_quantity, clear_cart
 from routes.staff import can_update_order_status
+from caching import cache_menu_items, cache_delivery_zones, cache_warmer
+from sqlite_profile import sqlite_profile
+from order_writer import OrderWriter
 from datetime import datetime
 import re
 
@@ -189,49 +192,35 @@ def create_order():
         # Calculate total price
         total_price = sum(item['total_price'] for item in cart_items)
         
-        # Create order
-        order = Order(
-            customer_name=data['customer_name'],
-            customer_phone=data['customer_phone'],
-            delivery_address_details=data['delivery_address'],
-            delivery_zone_id=data.get('delivery_zone_id'),
-            total_price=total_price,
-            payment_method=data['payment_method']
-        )
-        
-        # Generate order number
-        order.generate_order_number()
-        
-        # Save order to get ID
-        db.session.add(order)
-        db.session.flush()
-        
-        # Create order items
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                menu_id=cart_item['menu_id'],
-                menu_name=cart_item['menu_name'],
-                price_per_item=cart_item['base_price'],
-                quantity=cart_item['quantity'],
-                special_requests=cart_item.get('special_requests')
+        # Create order, rebuilt from scratch if SQLite reports the database locked
+        @sqlite_profile.retry_on_locked
+        def save_order():
+            order = Order(
+                customer_name=data['customer_name'],
+                customer_phone=data['customer_phone'],
+                delivery_address_details=data['delivery_address'],
+                delivery_zone_id=data.get('delivery_zone_id'),
+                total_price=total_price,
+                payment_method=data['payment_method']
             )
             
-            db.session.add(order_item)
-            db.session.flush()
+            # Generate order number
+            order.generate_order_number()
             
-            # Add order item options
-            for option in cart_item['options']:
-                order_option = OrderItemOption(
-                    order_item_id=order_item.id,
-                    option_id=option['id'],
-                    option_name=option['name'],
-                    option_price=option['price']
+            # Insert order, items and options, then commit once
+            return OrderWriter.write(order, [
+                OrderWriter.item_row(
+                    cart_item['menu_id'],
+                    cart_item['menu_name'],
+                    cart_item['base_price'],
+                    cart_item['quantity'],
+                    cart_item.get('special_requests'),
+                    [(option['id'], option['name'], option['price']) for option in cart_item['options']]
                 )
-                db.session.add(order_option)
+                for cart_item in cart_items
+            ])
         
-        # Commit the transaction
-        db.session.commit()
+        order = save_order()
         
         # Clear cart after successful order
         clear_cart()
@@ -516,51 +505,63 @@ def emit_order_status_update(order):
 
 # ==================== HELPER API ENDPOINTS ====================
 
+@cache_warmer.register('delivery_zones', tags=['menu', 'zones'])
+@cache_delivery_zones()
+def get_active_zones_data():
+    """Active delivery zones as served by /api/zones"""
+    zones = DeliveryZone.query.filter_by(is_active=True).all()
+    
+    zones_data = []
+    for zone in zones:
+        zones_data.append({
+            'id': zone.id,
+            'name': zone.name,
+            'description': zone.description
+        })
+    
+    return zones_data
+
 @api_bp.route('/zones', methods=['GET'])
 def get_zones():
     """Get all active delivery zones"""
     
     try:
-        zones = DeliveryZone.query.filter_by(is_active=True).all()
-        
-        zones_data = []
-        for zone in zones:
-            zones_data.append({
-                'id': zone.id,
-                'name': zone.name,
-                'description': zone.description
-            })
-        
         return jsonify({
             'success': True,
-            'zones': zones_data
+            'zones': get_active_zones_data()
         })
         
     except Exception as e:
         return jsonify({'error': 'เกิดข้อผิดพลาดในการดึงข้อมูลโซน'}), 500
 
+@cache_warmer.register('menu_catalog', tags=['menu'])
+@cache_menu_items()
+def get_active_menu_data():
+    """Active menu catalog as served by /api/menu"""
+    menus = Menu.query.filter_by(is_active=True).all()
+    
+    menu_data = []
+    for menu in menus:
+        menu_item = {
+            'id': menu.id,
+            'name': menu.name,
+            'description': menu.description,
+            'price': float(menu.price),
+            'category': menu.category,
+            'image_url': menu.image_url
+        }
+        menu_data.append(menu_item)
+    
+    return menu_data
+
 @api_bp.route('/menu', methods=['GET'])
 def get_menu():
     """Get all active menu items"""
     
     try:
-        menus = Menu.query.filter_by(is_active=True).all()
-        
-        menu_data = []
-        for menu in menus:
-            menu_item = {
-                'id': menu.id,
-                'name': menu.name,
-                'description': menu.description,
-                'price': float(menu.price),
-                'category': menu.category,
-                'image_url': menu.image_url
-            }
-            menu_data.append(menu_item)
-        
         return jsonify({
             'success': True,
-            'menu': menu_data
+            'menu': get_active_menu_data()
         })
         
     except Exception as e:
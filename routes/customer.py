@@ -11,12 +11,15 @@ This module handles all customer-facing routes including:
 - Session management for spam prevention
 """
 
-from flask import Blueprint, render_template, request, jsonify, session
+from flask import Blueprint, render_template, request, jsonify, session, abort
 from models import (
     db, Menu, MenuOptionGroup, MenuOptionItem, DeliveryZone, 
     Order, OrderItem, OrderItemOption, Feedback, CustomerSession,
     get_thai_now
 )
+from caching import cache_menu_options, cache_warmer
+from sqlite_profile import sqlite_profile
+from order_writer import OrderWriter
 import uuid
 import hashlib
 from datetime import datetime, timedelta
@@ -107,16 +110,18 @@ def menu(zone_id=None):
                          selected_zone=zone,
                          cart_count=cart_count)
 
-@customer_bp.route('/menu/<int:menu_id>/options')
-def menu_options(menu_id):
+@cache_menu_options()
+def get_menu_options_data(menu_id):
     """
-    Get menu options for customization via AJAX
+    Option groups payload for one menu item, None if the menu does not exist
     
     Args:
         menu_id (int): Menu item ID
     """
     
-    menu = Menu.query.get_or_404(menu_id)
+    menu = db.session.get(Menu, menu_id)
+    if menu is None:
+        return None
     
     # Get all active option groups for this menu
     option_groups = MenuOptionGroup.query.filter_by(menu_id=menu_id, is_active=True).all()
@@ -142,7 +147,7 @@ def menu_options(menu_id):
         
         options_data.append(group_data)
     
-    return jsonify({
+    return {
         'menu': {
             'id': menu.id,
             'name': menu.name,
@@ -150,7 +155,28 @@ def menu_options(menu_id):
             'description': menu.description
         },
         'option_groups': options_data
-    })
+    }
+
+@cache_warmer.register('menu_options', tags=['menu'])
+def warm_menu_options():
+    """Fill the option groups cache for every active menu item"""
+    for (menu_id,) in db.session.query(Menu.id).filter_by(is_active=True).all():
+        get_menu_options_data(menu_id)
+
+@customer_bp.route('/menu/<int:menu_id>/options')
+def menu_options(menu_id):
+    """
+    Get menu options for customization via AJAX
+    
+    Args:
+        menu_id (int): Menu item ID
+    """
+    
+    options_data = get_menu_options_data(menu_id)
+    if options_data is None:
+        abort(404)
+    
+    return jsonify(options_data)
 
 @customer_bp.route('/cart')
 def cart():
@@ -329,39 +355,18 @@ def update_order(order_id):
         
         # Recreate order items from cart
         total_price = 0
+        rows = []
+        menus, options = load_cart_catalog(cart)
         
         for cart_item in cart:
-            menu = db.session.get(Menu, cart_item['menu_id'])
-            if not menu or not menu.is_active:
+            row = order_item_row(cart_item, menus, options)
+            if row is None:
                 continue
-            
-            # Create order item
-            order_item = OrderItem(
-                order_id=order.id,
-                menu_id=menu.id,
-                menu_name=menu.name,
-                quantity=cart_item['quantity'],
-                price=cart_item['total_price'],
-                special_requests=cart_item.get('special_requests')
-            )
-            db.session.add(order_item)
-            db.session.flush()  # Get the ID
-            
-            # Add options
-            for option in cart_item.get('options', []):
-                if option.get('id'):
-                    option_item = db.session.get(MenuOptionItem, option['id'])
-                    if option_item:
-                        order_option = OrderItemOption(
-                            order_item_id=order_item.id,
-                            option_id=option_item.id,
-                            option_name=option_item.name,
-                            option_price=option_item.additional_price
-                        )
-                        db.session.add(order_option)
-            
+            rows.append(row)
             total_price += cart_item['total_price']
         
+        OrderWriter.insert_items(order.id, rows)
+        
         # Update order total
         order.total_price = total_price
         order.last_updated_at = get_thai_now()
@@ -525,6 +530,49 @@ def get_order_status(order_id):
             'message': f'เกิดข้อผิดพลาด: {str(e)}'
         }), 500
 
+def load_cart_catalog(cart):
+    """
+    Active menus and option items referenced by a cart, in two queries
+    
+    Returns:
+        tuple: ({menu_id: Menu}, {option_id: MenuOptionItem})
+    """
+    menu_ids = {cart_item['menu_id'] for cart_item in cart}
+    option_ids = {
+        option['id'] for cart_item in cart for option in cart_item.get('options', []) if option.get('id')
+    }
+    
+    menus = {}
+    if menu_ids:
+        menus = {menu.id: menu for menu in Menu.query.filter(Menu.id.in_(menu_ids)).filter_by(is_active=True)}
+    options = {}
+    if option_ids:
+        options = {
+            option_item.id: option_item
+            for option_item in MenuOptionItem.query.filter(MenuOptionItem.id.in_(option_ids)).filter_by(is_active=True)
+        }
+    return menus, options
+
+def order_item_row(cart_item, menus, options):
+    """OrderWriter row for a cart item, None when its menu is no longer available
+    
+    menus and options come from load_cart_catalog().
+    """
+    menu = menus.get(cart_item['menu_id'])
+    if menu is None:
+        return None
+    
+    selected = []
+    for option in cart_item.get('options', []):
+        option_item = options.get(option.get('id'))
+        if option_item:
+            selected.append((option_item.id, option_item.name, option_item.additional_price))
+    
+    return OrderWriter.item_row(
+        menu.id, menu.name, menu.price, cart_item['quantity'],
+        cart_item.get('special_requests'), selected
+    )
+
 # Cart management helper functions
 def add_to_cart(menu_id, quantity, options=None, special_requests=None):
     """
@@ -643,6 +691,7 @@ def api_place_order():
         customer_phone = data.get('customer_phone', '').strip()
         delivery_address = data.get('delivery_address', '').strip()
         special_instructions = data.get('special_instructions', '').strip()
+        payment_method = data.get('payment_method', 'COD')
         
         # Validation
         if not customer_name:
@@ -657,6 +706,22 @@ def api_place_order():
                 'message': 'กรุณาระบุหมายเลขโทรศัพท์'
             }), 400
         
+        if not delivery_address:
+            return jsonify({
+                'success': False,
+                'message': 'กรุณาระบุที่อยู่จัดส่ง'
+            }), 400
+        
+        if payment_method not in ['COD', 'TOD']:
+            return jsonify({
+                'success': False,
+                'message': 'วิธีการชำระเงินไม่ถูกต้อง'
+            }), 400
+        
+        # Orders have no notes column, the rider reads them with the address
+        if special_instructions:
+            delivery_address = f"{delivery_address}\nหมายเหตุ: {special_instructions}"
+        
         # Get cart from session
         cart = session.get('cart', [])
         if not cart:
@@ -674,10 +739,11 @@ def api_place_order():
         # Calculate total price and validate menu items
         total_price = 0
         valid_items = []
+        menus, options = load_cart_catalog(cart)
         
         for cart_item in cart:
-            menu = db.session.get(Menu, cart_item['menu_id'])
-            if not menu or not menu.is_active:
+            menu = menus.get(cart_item['menu_id'])
+            if menu is None:
                 continue  # Skip inactive items
             
             # Validate options
@@ -685,11 +751,10 @@ def api_place_order():
             valid_options = []
             
             for option in cart_item.get('options', []):
-                if option.get('id'):
-                    option_item = db.session.get(MenuOptionItem, option['id'])
-                    if option_item and option_item.is_active:
-                        options_price += float(option_item.additional_price)
-                        valid_options.append(option)
+                option_item = options.get(option.get('id'))
+                if option_item:
+                    options_price += float(option_item.additional_price)
+                    valid_options.append(option)
             
             # Recalculate item total
             item_total = (float(menu.price) + options_price) * cart_item['quantity']
@@ -705,52 +770,36 @@ def api_place_order():
                 'message': 'ไม่มีรายการที่สามารถสั่งได้'
             }), 400
         
-        # Create order
-        order = Order(
-            customer_name=customer_name,
-            customer_phone=customer_phone,
-            delivery_address=delivery_address,
-            total_price=total_price,
-            zone_id=zone.id if zone else None,
-            special_instructions=special_instructions
-        )
-        
-        db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Create order items
-        for cart_item in valid_items:
-            menu = db.session.get(Menu, cart_item['menu_id'])
-            
-            order_item = OrderItem(
-                order_id=order.id,
-                menu_id=menu.id,
-                menu_name=menu.name,
-                quantity=cart_item['quantity'],
-                price=cart_item['total_price'],
-                special_requests=cart_item.get('special_requests')
+        # Plain rows, so a retried save does not reload the catalog
+        rows = [order_item_row(cart_item, menus, options) for cart_item in valid_items]
+        
+        # Create order, rebuilt from scratch if SQLite reports the database locked
+        @sqlite_profile.retry_on_locked
+        def save_order():
+            order = Order(
+                customer_name=customer_name,
+                customer_phone=customer_phone,
+                delivery_address_details=delivery_address,
+                delivery_zone_id=zone.id if zone else None,
+                total_price=total_price,
+                payment_method=payment_method
             )
-            db.session.add(order_item)
-            db.session.flush()  # Get order item ID
+            order.generate_order_number()
             
-            # Add options
-            for option in cart_item.get('options', []):
-                if option.get('id'):
-                    option_item = db.session.get(MenuOptionItem, option['id'])
-                    if option_item:
-                        order_option = OrderItemOption(
-                            order_item_id=order_item.id,
-                            option_id=option_item.id,
-                            option_name=option_item.name,
-                            option_price=option_item.additional_price
-                        )
-                        db.session.add(order_option)
-        
-        # Record session activity for rate limiting
-        customer_session = get_or_create_session()
-        customer_session.record_order()
+            db.session.add(order)
+            db.session.flush()  # Get order ID
+            
+            # Create order items and options in bulk
+            OrderWriter.insert_items(order.id, rows)
+            
+            # Record session activity for rate limiting
+            customer_session = get_or_create_session()
+            customer_session.record_order()
+            
+            db.session.commit()
+            return order
         
-        db.session.commit()
+        order = save_order()
         
         # Clear cart
         clear_cart()
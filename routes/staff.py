@@ -11,6 +11,7 @@ This module handles all staff-facing routes including:
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User, Order, OrderItem
+from time_windows import TimeWindow
 from datetime import datetime
 from functools import wraps
 
@@ -143,23 +144,20 @@ def delivery_dashboard():
     ready_orders = Order.query.filter_by(status='ready').order_by(Order.created_at.asc()).all()
     delivering_orders = Order.query.filter_by(status='delivering').order_by(Order.created_at.asc()).all()
     
-    # Calculate statistics
-    today = datetime.now().date()
-    
-    # Count delivered orders today
-    delivered_today_count = 0
-    total_today_amount = 0.0
-    
-    for order in Order.query.filter_by(status='delivered').all():
-        if order.last_updated_at and order.last_updated_at.date() == today:
-            delivered_today_count += 1
-            total_today_amount += float(order.total_price or 0)
+    # Count and total of orders delivered today (Thai time)
+    delivered_today_count, total_today_amount = db.session.query(
+        db.func.count(Order.id),
+        db.func.coalesce(db.func.sum(Order.total_price), 0)
+    ).filter(
+        Order.status == 'delivered',
+        TimeWindow.today().filter(Order.last_updated_at)
+    ).one()
     
     stats = {
         'ready_for_delivery': len(ready_orders),
         'delivering': len(delivering_orders),
         'delivered_today': delivered_today_count,
-        'total_today': total_today_amount
+        'total_today': float(total_today_amount)
     }
     
     return render_template('staff/delivery_dashboard.html',
@@ -202,9 +200,7 @@ def orders_list():
     
     # Apply date filter
     if date_filter == 'today':
-        from datetime import date
-        today = date.today()
-        query = query.filter(db.func.date(Order.created_at) == today)
+        query = query.filter(TimeWindow.today().filter(Order.created_at))
     
     # Order by creation time (newest first)
     orders = query.order_by(Order.created_at.desc()).all()
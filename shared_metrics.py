@@ -0,0 +1,334 @@
+"""
+Shared Worker Metrics
+Per-worker request histograms in a shared mmap file, merged for a whole-node view
+"""
+
+import os
+import mmap
+import struct
+import time
+import threading
+import logging
+from array import array
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from monitoring import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+class SharedMetrics:
+    """Fixed-layout mmap file where every worker publishes its metrics
+    
+    Each worker owns one slot and rewrites it from a background thread
+    every METRICS_SHARED_INTERVAL seconds, so requests never touch the
+    file. A slot holds a table of keys ("req" latency histograms per
+    endpoint and status class, "err" exception counts) with the
+    LatencyHistogram buckets laid out as a fixed uint64 array. Writers
+    bump a sequence number around each write (odd while writing), and
+    readers retry until they copy a slot with an even, unchanged one.
+    Slots of exited workers are reclaimed by the next worker to start.
+    
+    The file name carries the layout (version, slots, keys, buckets), so a
+    worker started with other settings maps its own file and never
+    resizes one that older workers still have mapped.
+    """
+    
+    MAGIC = b'LANAIMM1'
+    VERSION = 1
+    HEADER = struct.Struct('<8sIIII')  # magic, version, slots, keys, buckets
+    HEADER_SIZE = 64
+    SLOT_HEADER = struct.Struct('<qQdqI')  # pid, sequence, updated, active requests, keys used
+    SLOT_HEADER_SIZE = 64
+    KEY_NAME_SIZE = 120
+    KEY_HEADER = struct.Struct(f'<{KEY_NAME_SIZE}sQddd')  # name, count, total, min, max
+    
+    def __init__(self, app=None):
+        self.app = app
+        self.monitor = None
+        self.path = None
+        self.slots = 8
+        self.keys = 256
+        self.buckets = 704  # Covers ~67 seconds, slower requests share the last bucket
+        self.interval = 5
+        self.pid = None
+        self.slot = None
+        self.stats = {'flushes': 0, 'dropped_keys': 0, 'read_retries': 0}
+        self._mmap = None
+        self._fd = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # The flush thread and reports both write our slot
+    
+    def init_app(self, app, monitor):
+        """Enable aggregation when METRICS_SHARED_PATH is set"""
+        self.app = app
+        self.monitor = monitor
+        self.path = app.config.get('METRICS_SHARED_PATH')
+        self.slots = app.config.get('METRICS_SHARED_SLOTS', 8)
+        self.keys = app.config.get('METRICS_SHARED_KEYS', 256)
+        self.interval = app.config.get('METRICS_SHARED_INTERVAL', 5)
+        if self.path and fcntl is None:
+            logger.warning("Shared metrics need fcntl, aggregation disabled")
+            self.path = None
+        if self.path:
+            # Claimed lazily so each forked worker gets its own slot
+            app.before_request(self.ensure_worker)
+    
+    @property
+    def enabled(self):
+        return bool(self.path)
+    
+    @property
+    def layout_path(self):
+        """File for this layout, next to METRICS_SHARED_PATH"""
+        return f"{self.path}.v{self.VERSION}.{self.slots}x{self.keys}x{self.buckets}"
+    
+    @property
+    def key_size(self):
+        return self.KEY_HEADER.size + self.buckets * 8
+    
+    @property
+    def slot_size(self):
+        return self.SLOT_HEADER_SIZE + self.keys * self.key_size
+    
+    @property
+    def file_size(self):
+        return self.HEADER_SIZE + self.slots * self.slot_size
+    
+    def _slot_offset(self, slot):
+        return self.HEADER_SIZE + slot * self.slot_size
+    
+    def _open(self):
+        """Map this layout's file, creating it if needed, or (None, None) if it is unusable
+        
+        An existing file is never truncated or rewritten, other workers
+        may have it mapped and would fault on a shrunk mapping.
+        """
+        fd = os.open(self.layout_path, os.O_RDWR | os.O_CREAT, 0o600)
+        mapped = None
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(fd).st_size
+            if size == 0:
+                os.ftruncate(fd, self.file_size)  # New file, nobody has it mapped yet
+            if size in (0, self.file_size):
+                mapped = mmap.mmap(fd, self.file_size)
+                expected = self.HEADER.pack(self.MAGIC, self.VERSION, self.slots, self.keys, self.buckets)
+                header = mapped[:self.HEADER.size]
+                if header == bytes(self.HEADER.size):
+                    mapped[:self.HEADER.size] = expected
+                elif header != expected:
+                    mapped.close()
+                    mapped = None
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        
+        if mapped is None:
+            os.close(fd)
+            logger.error(f"{self.layout_path} does not match its layout, shared metrics disabled")
+            return None, None
+        return fd, mapped
+    
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    
+    def ensure_worker(self):
+        """Claim a slot and start flushing, again after a fork"""
+        if not self.enabled or self.pid == os.getpid():
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self._fd, self._mmap = self._open()
+            self.pid = os.getpid()
+            if self._mmap is None:
+                return
+            self.slot = self._claim_slot()
+            if self.slot is None:
+                logger.warning(f"No free shared metrics slot for worker {self.pid}")
+                return
+            self._thread = threading.Thread(target=self._flush_loop, name='shared-metrics', daemon=True)
+            self._thread.start()
+            logger.info(f"Worker {self.pid} publishing metrics to {self.path} slot {self.slot}")
+    
+    def _claim_slot(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            for slot in range(self.slots):
+                offset = self._slot_offset(slot)
+                pid = struct.unpack_from('<q', self._mmap, offset)[0]
+                if pid == 0 or (pid != os.getpid() and not self._pid_alive(pid)):
+                    self._mmap[offset:offset + self.slot_size] = bytes(self.slot_size)
+                    struct.pack_into('<q', self._mmap, offset, os.getpid())
+                    return slot
+            return None
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+    
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self.pid == pid:
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Shared metrics flush error: {e}")
+            time.sleep(self.interval)
+    
+    def _collect(self):
+        """This worker's keys as (name, histogram) pairs"""
+        entries = [
+            (f"req|{endpoint}|{status_class}", histogram.lifetime)
+            for (endpoint, status_class), histogram in list(self.monitor.metrics['latency'].items())
+        ]
+        for error_type, count in list(self.monitor.metrics['error_counts'].items()):
+            errors = LatencyHistogram()
+            errors.count = count
+            entries.append((f"err|{error_type}", errors))
+        return entries
+    
+    def flush(self):
+        """Rewrite this worker's slot"""
+        if self.slot is None:
+            return
+        with self._flush_lock:
+            self._write_slot(self._collect())
+    
+    def _write_slot(self, entries):
+        if len(entries) > self.keys:
+            self.stats['dropped_keys'] = len(entries) - self.keys
+            entries = entries[:self.keys]
+        
+        offset = self._slot_offset(self.slot)
+        mapped = self._mmap
+        sequence = struct.unpack_from('<Q', mapped, offset + 8)[0] + 1
+        struct.pack_into('<Q', mapped, offset + 8, sequence)  # Odd: write in progress
+        
+        key_offset = offset + self.SLOT_HEADER_SIZE
+        for name, histogram in entries:
+            encoded = name.encode('utf-8')[:self.KEY_NAME_SIZE]
+            self.KEY_HEADER.pack_into(
+                mapped, key_offset, encoded, histogram.count, histogram.total,
+                histogram.min or 0.0, histogram.max or 0.0
+            )
+            bucket_offset = key_offset + self.KEY_HEADER.size
+            counts = array('Q', bytes(self.buckets * 8))
+            for index, count in dict(histogram.buckets).items():
+                counts[min(index, self.buckets - 1)] += count
+            mapped[bucket_offset:bucket_offset + self.buckets * 8] = counts.tobytes()
+            key_offset += self.key_size
+        
+        self.SLOT_HEADER.pack_into(
+            mapped, offset, self.pid, sequence + 1, time.time(),
+            self.monitor.metrics['active_connections'], len(entries)
+        )
+        self.stats['flushes'] += 1
+    
+    def _read_slot(self, slot):
+        """Consistent copy of a slot, or None if it is empty or kept changing"""
+        offset = self._slot_offset(slot)
+        for _ in range(5):
+            before = self.SLOT_HEADER.unpack_from(self._mmap, offset)
+            if before[0] == 0:
+                return None
+            if before[1] % 2:
+                self.stats['read_retries'] += 1
+                time.sleep(0.001)
+                continue
+            data = self._mmap[offset:offset + self.SLOT_HEADER_SIZE + before[4] * self.key_size]
+            after = self.SLOT_HEADER.unpack_from(self._mmap, offset)
+            if after[1] == before[1]:
+                return before, data
+            self.stats['read_retries'] += 1
+        return None
+    
+    def read_workers(self):
+        """Every live worker's published metrics"""
+        self.ensure_worker()
+        if self._mmap is None:
+            return []
+        if self.slot is not None:
+            self.flush()
+        
+        workers = []
+        for slot in range(self.slots):
+            copied = self._read_slot(slot)
+            if copied is None:
+                continue
+            (pid, _, updated, active, used), data = copied
+            if not self._pid_alive(pid):
+                continue  # Exited worker whose slot was not reclaimed yet
+            
+            latency = {}
+            errors = {}
+            for key in range(used):
+                key_offset = self.SLOT_HEADER_SIZE + key * self.key_size
+                name, count, total, minimum, maximum = self.KEY_HEADER.unpack_from(data, key_offset)
+                name = name.rstrip(b'\0').decode('utf-8', 'replace')
+                kind, _, rest = name.partition('|')
+                if kind == 'err':
+                    errors[rest] = count
+                    continue
+                histogram = LatencyHistogram()
+                histogram.count, histogram.total = count, total
+                histogram.min, histogram.max = (minimum, maximum) if count else (None, None)
+                buckets = array('Q')
+                bucket_offset = key_offset + self.KEY_HEADER.size
+                buckets.frombytes(data[bucket_offset:bucket_offset + self.buckets * 8])
+                for index, bucket_count in enumerate(buckets):
+                    if bucket_count:
+                        histogram.buckets[index] = bucket_count
+                endpoint, _, status_class = rest.rpartition('|')
+                latency[(endpoint, status_class)] = histogram
+            
+            workers.append({
+                'pid': pid, 'slot': slot, 'updated': updated, 'active_requests': active,
+                'latency': latency, 'errors': errors
+            })
+        return workers
+    
+    def get_node_report(self):
+        """All workers' request latency and errors merged"""
+        workers = self.read_workers()
+        latency = {}
+        errors = {}
+        for worker in workers:
+            for key, histogram in worker['latency'].items():
+                latency.setdefault(key, LatencyHistogram()).merge(histogram)
+            for error_type, count in worker['errors'].items():
+                errors[error_type] = errors.get(error_type, 0) + count
+        
+        endpoints = {}
+        for (endpoint, status_class), histogram in latency.items():
+            endpoints.setdefault(endpoint, {})[status_class] = histogram.summary()
+        
+        now = time.time()
+        return {
+            'workers': [
+                {
+                    'pid': worker['pid'],
+                    'slot': worker['slot'],
+                    'seconds_since_update': round(now - worker['updated'], 1),
+                    'active_requests': worker['active_requests'],
+                    'requests': sum(h.count for h in worker['latency'].values())
+                }
+                for worker in workers
+            ],
+            'total_requests': sum(h.count for h in latency.values()),
+            'active_requests': sum(worker['active_requests'] for worker in workers),
+            'endpoints': endpoints,
+            'errors': errors
+        }
+
+# Global shared metrics instance
+shared_metrics = SharedMetrics()
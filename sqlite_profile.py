@@ -0,0 +1,132 @@
+"""
+SQLite Engine Profile
+Connection pragmas, pool options and 'database is locked' retries for SQLite
+"""
+
+import time
+import random
+import logging
+from functools import wraps
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Applied to every new DBAPI connection, SQLITE_PRAGMAS overrides per key
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',  # Readers no longer block the single writer
+    'synchronous': 'NORMAL',  # Safe with WAL, fsync only at checkpoints
+    'busy_timeout': 5000,  # Milliseconds a writer waits for the lock before raising
+    'cache_size': -32000,  # Negative is KiB, 32 MB page cache per connection
+    'mmap_size': 134217728,  # 128 MB of the file read through mmap
+    'temp_store': 'MEMORY'
+}
+
+def sqlite_engine_options(pool_size=5, max_overflow=5, pool_timeout=30):
+    """Engine options for a SQLite file database
+    
+    SQLite allows a single writer, so a large pool only adds connections
+    queueing on the file lock. A small QueuePool keeps page caches warm,
+    pre-ping and recycle are dropped since there is no server to lose.
+    """
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'connect_args': {'check_same_thread': False}  # Pooled connections move between threads
+    }
+
+def is_locked_error(error):
+    """True for SQLite 'database is locked' and 'database table is locked'"""
+    return isinstance(error, OperationalError) and 'is locked' in str(getattr(error, 'orig', error))
+
+class SQLiteProfile:
+    """Applies pragmas to SQLite connections and retries locked writes"""
+    
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = False
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.max_retries = 5
+        self.retry_base_delay = 0.05
+        self.retry_max_delay = 1.0
+        self.stats = {'connections': 0, 'pragma_errors': 0, 'retries': 0, 'gave_up': 0}
+    
+    def init_app(self, app, db):
+        """Register the pragma listener when the app's engine is SQLite"""
+        self.app = app
+        self.pragmas = {**DEFAULT_PRAGMAS, **app.config.get('SQLITE_PRAGMAS', {})}
+        self.max_retries = app.config.get('SQLITE_LOCK_RETRIES', 5)
+        self.retry_base_delay = app.config.get('SQLITE_RETRY_BASE_DELAY', 0.05)
+        self.retry_max_delay = app.config.get('SQLITE_RETRY_MAX_DELAY', 1.0)
+        
+        with app.app_context():
+            engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        self.apply(engine)
+        logger.info(f"SQLite profile applied: {self.pragmas}")
+    
+    def apply(self, engine):
+        if not event.contains(engine, 'connect', self._on_connect):
+            event.listen(engine, 'connect', self._on_connect)
+        self.enabled = True
+    
+    def _on_connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                try:
+                    cursor.execute(f"PRAGMA {name}={value}")
+                except Exception as e:
+                    self.stats['pragma_errors'] += 1
+                    logger.warning(f"Could not set PRAGMA {name}: {e}")
+        finally:
+            cursor.close()
+        self.stats['connections'] += 1
+    
+    def backoff(self, attempt):
+        """Jittered exponential delay before retry number attempt"""
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+    
+    def retry_on_locked(self, func):
+        """Re-run func after a rollback while it fails with 'database is locked'
+        
+        func must be the whole unit of work, building its objects and
+        committing, since the rollback discards everything it added.
+        """
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            from models import db
+            from monitoring import performance_monitor
+            
+            attempt = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as e:
+                    if not is_locked_error(e):
+                        raise
+                    db.session.rollback()
+                    if attempt >= self.max_retries:
+                        self.stats['gave_up'] += 1
+                        logger.error(f"{func.__name__} still locked after {attempt} retries")
+                        raise
+                    attempt += 1
+                    self.stats['retries'] += 1
+                    performance_monitor.connections.record_lock_retry()
+                    time.sleep(self.backoff(attempt))
+        return wrapper
+    
+    def get_status(self):
+        return {
+            'enabled': self.enabled,
+            'pragmas': dict(self.pragmas),
+            'max_retries': self.max_retries,
+            'stats': dict(self.stats)
+        }
+
+# Global SQLite profile instance
+sqlite_profile = SQLiteProfile()
@@ -409,3 +409,393 @@ class TestModelRelationships:
                 assert False, "Should not allow duplicate email"
             except Exception:
                 db.session.rollback()  # Clean up failed transaction
+
+
+class TestQueryPlans:
+    """Test the hot Order/OrderItem queries are served by an index"""
+    
+    @staticmethod
+    def full_scans(query):
+        """Tables the query plan reads with a full table scan"""
+        from sqlalchemy.dialects import sqlite
+        import re
+        
+        statement = query.statement if hasattr(query, 'statement') else query
+        compiled = statement.compile(dialect=sqlite.dialect(), compile_kwargs={'render_postcompile': True})
+        # Parameter values do not change the plan without sqlite_stat4
+        params = (None,) * len(compiled.positiontup)
+        plan = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        details = [row[-1] for row in plan]
+        # "SCAN orders" is a table scan, "SCAN orders USING INDEX ..." walks an index
+        return [detail for detail in details if re.fullmatch(r'SCAN (TABLE )?\w+( AS \w+)?', detail)], details
+    
+    def assert_indexed(self, query):
+        scans, details = self.full_scans(query)
+        assert not scans, f"Full table scan in plan: {details}"
+    
+    def test_staff_queue_by_status(self, app):
+        """Test status filters with created_at ordering use the status index"""
+        with app.app_context():
+            self.assert_indexed(Order.query.filter(
+                Order.status.in_(['pending', 'confirmed', 'preparing'])
+            ).order_by(Order.created_at.asc()))
+            self.assert_indexed(Order.query.filter(
+                Order.status == 'ready'
+            ).order_by(Order.created_at.asc()))
+    
+    def test_reports_by_time_window(self, app):
+        """Test created_at ranges, with and without a status filter"""
+        start = datetime(2025, 7, 1)
+        end = start + timedelta(days=1)
+        with app.app_context():
+            self.assert_indexed(Order.query.filter(
+                Order.created_at >= start, Order.created_at < end
+            ))
+            self.assert_indexed(Order.query.filter(
+                Order.created_at >= start, Order.created_at < end,
+                Order.status.in_(['delivered', 'completed'])
+            ))
+            self.assert_indexed(Order.query.order_by(Order.created_at.desc()).limit(10))
+    
+    def test_customer_order_history(self, app):
+        """Test order history by phone number"""
+        with app.app_context():
+            self.assert_indexed(Order.query.filter_by(
+                customer_phone='0812345678'
+            ).order_by(Order.created_at.desc()).limit(20))
+    
+    def test_order_items_joins(self, app):
+        """Test items of an order and menu sales joined to their orders"""
+        start = datetime(2025, 7, 1)
+        with app.app_context():
+            self.assert_indexed(OrderItem.query.filter_by(order_id=1))
+            self.assert_indexed(OrderItem.query.join(Order).filter(
+                OrderItem.menu_id == 1,
+                Order.created_at >= start,
+                Order.status.in_(['delivered', 'completed'])
+            ))
+            self.assert_indexed(db.session.query(
+                OrderItem.menu_id, db.func.sum(OrderItem.quantity)
+            ).join(Order).filter(
+                Order.created_at >= start
+            ).group_by(OrderItem.menu_id))
+    
+    def test_stock_adjustments_and_feedback(self, app):
+        """Test stock history per ingredient, recent movements and feedback lookup"""
+        from models import Feedback, StockAdjustment
+        
+        start = datetime(2025, 7, 1)
+        with app.app_context():
+            self.assert_indexed(StockAdjustment.query.filter_by(
+                ingredient_id=1
+            ).order_by(StockAdjustment.created_at.desc()))
+            self.assert_indexed(StockAdjustment.query.filter(
+                StockAdjustment.created_at >= start
+            ).order_by(StockAdjustment.created_at.desc()))
+            self.assert_indexed(Feedback.query.filter_by(order_id=1))
+    
+    def test_full_scan_is_detected(self, app):
+        """Test the plan check itself flags an unindexed filter"""
+        with app.app_context():
+            scans, _ = self.full_scans(Order.query.filter(Order.payment_method == 'COD'))
+            assert scans == ['SCAN orders']
+
+
+class TestTimeWindow:
+    """Test restaurant-local [start, end) windows used for date filters"""
+    
+    def test_day_week_and_month_bounds(self):
+        """Test windows start at local midnight and end at the next boundary"""
+        from time_windows import TimeWindow, local_midnight
+        from models import THAI_TZ
+        
+        day = datetime(2025, 7, 16, 23, 30, tzinfo=THAI_TZ).date()  # A Wednesday
+        window = TimeWindow.for_day(day)
+        assert window.start == datetime(2025, 7, 16, tzinfo=THAI_TZ)
+        assert window.end == datetime(2025, 7, 17, tzinfo=THAI_TZ)
+        
+        week = TimeWindow.for_week(day)
+        assert (week.start.date(), week.end.date()) == (datetime(2025, 7, 14).date(), datetime(2025, 7, 21).date())
+        
+        month = TimeWindow.for_month(datetime(2025, 12, 31, 12, tzinfo=THAI_TZ))
+        assert month.start == local_midnight(datetime(2025, 12, 1).date())
+        assert month.end == local_midnight(datetime(2026, 1, 1).date())
+        
+        days = TimeWindow.for_dates(datetime(2025, 7, 1).date(), datetime(2025, 7, 3).date())
+        assert len(list(days.dates())) == 3
+        assert days.previous() == TimeWindow.for_dates(datetime(2025, 6, 28).date(), datetime(2025, 6, 30).date())
+        assert TimeWindow.last_days(3, until=datetime(2025, 7, 3).date()) == days
+    
+    def test_local_day_of_utc_timestamp(self):
+        """Test a UTC evening timestamp falls on the next Bangkok day"""
+        from datetime import timezone
+        from time_windows import TimeWindow
+        
+        utc_evening = datetime(2025, 7, 16, 18, 30, tzinfo=timezone.utc)  # 01:30 on the 17th in Bangkok
+        window = TimeWindow.for_day(utc_evening)
+        assert window.start.date() == datetime(2025, 7, 17).date()
+        assert window.contains(utc_evening)
+        assert window.contains(datetime(2025, 7, 17, 1, 30))  # Naive values are local
+        assert not window.contains(window.end)
+    
+    def test_filter_matches_stored_orders(self, app):
+        """Test the window selects exactly the orders created on that local day"""
+        from time_windows import TimeWindow
+        from models import THAI_TZ
+        
+        day = datetime(2025, 7, 16).date()
+        with app.app_context():
+            for created in [datetime(2025, 7, 15, 23, 59, 59), datetime(2025, 7, 16, 0, 0),
+                            datetime(2025, 7, 16, 23, 59, 59, 999999), datetime(2025, 7, 17, 0, 0)]:
+                db.session.add(Order(
+                    order_number=f"TW{created:%d%H%M%S%f}"[:20], customer_name='Window Test',
+                    customer_phone='0811111111', delivery_address_details='Test',
+                    total_price=100, payment_method='COD',
+                    created_at=created.replace(tzinfo=THAI_TZ)
+                ))
+            db.session.commit()
+            
+            orders = Order.query.filter(
+                Order.customer_name == 'Window Test',
+                TimeWindow.for_day(day).filter(Order.created_at)
+            ).all()
+            assert sorted(order.created_at.hour for order in orders) == [0, 23]
+    
+    def test_window_filter_uses_index(self, app):
+        """Test the window filter is a range search where func.date() scans"""
+        from time_windows import TimeWindow
+        
+        with app.app_context():
+            window = TimeWindow.today()
+            scans, details = TestQueryPlans.full_scans(Order.query.filter(window.filter(Order.created_at)))
+            assert not scans and 'ix_orders_created_at' in details[0]
+            scans, _ = TestQueryPlans.full_scans(Order.query.filter(
+                Order.status == 'pending', window.filter(Order.created_at)
+            ))
+            assert not scans
+            scans, _ = TestQueryPlans.full_scans(Order.query.filter(
+                db.func.date(Order.created_at) == window.start.date()
+            ))
+            assert scans == ['SCAN orders']
+
+
+class TestOrderSequence:
+    """Test per-day order numbers from the OrderSequence counter"""
+    
+    def test_numbers_continue_existing_day(self, app):
+        """Test a new day's counter starts after orders numbered before it existed"""
+        from models import OrderSequence, get_thai_now
+        
+        with app.app_context():
+            today = get_thai_now().strftime('%Y%m%d')
+            for n in (1, 2):
+                db.session.add(Order(
+                    order_number=f"LA{today}-{n:03d}", customer_name='Existing',
+                    customer_phone='0811111111', delivery_address_details='Test',
+                    total_price=100, payment_method='COD'
+                ))
+            db.session.commit()
+            
+            order = Order(customer_name='Next', customer_phone='0822222222',
+                          delivery_address_details='Test', total_price=100, payment_method='COD')
+            order.generate_order_number()
+            assert order.order_number == f"LA{today}-003"
+            db.session.add(order)
+            db.session.commit()
+            
+            assert OrderSequence.next_value(today) == 4
+            db.session.rollback()  # A rolled back order gives its number back
+            assert OrderSequence.next_value(today) == 4
+            assert OrderSequence.next_value('20250101') == 1
+    
+    def test_new_day_counter_starts_after_highest_number(self, app):
+        """Test gaps left by deleted orders do not make the counter reissue a number"""
+        from models import get_thai_now
+        
+        with app.app_context():
+            today = get_thai_now().strftime('%Y%m%d')
+            for n in (1, 7):
+                db.session.add(Order(
+                    order_number=f"LA{today}-{n:03d}", customer_name='Existing',
+                    customer_phone='0811111111', delivery_address_details='Test',
+                    total_price=100, payment_method='COD'
+                ))
+            db.session.commit()
+            
+            order = Order(customer_name='Next', customer_phone='0822222222',
+                          delivery_address_details='Test', total_price=100, payment_method='COD')
+            order.generate_order_number()
+            assert order.order_number == f"LA{today}-008"
+    
+    def test_locked_fallback_for_other_databases(self, app):
+        """Test databases without ON CONFLICT use the SELECT ... FOR UPDATE path"""
+        from unittest.mock import patch
+        from models import OrderSequence
+        
+        with app.app_context():
+            with patch.object(db.engine.dialect, 'name', 'mysql'), \
+                    patch.object(OrderSequence, '_locked_next_value', wraps=OrderSequence._locked_next_value) as locked:
+                assert OrderSequence.next_value('20250101', start=db.select(db.literal(4)).scalar_subquery()) == 5
+                assert OrderSequence.next_value('20250101') == 6
+                assert locked.call_count == 2
+            db.session.commit()
+            assert db.session.get(OrderSequence, '20250101').last_value == 6
+    
+    def test_concurrent_orders_get_unique_numbers(self):
+        """Test thousands of orders from many threads get 1..N without duplicates"""
+        import os
+        import tempfile
+        import threading
+        from flask import Flask
+        from models import get_thai_now
+        from sqlite_profile import SQLiteProfile, sqlite_engine_options
+        
+        threads, per_thread = 16, 150
+        with tempfile.TemporaryDirectory() as db_dir:
+            app = Flask(__name__)
+            app.config.update(
+                SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(db_dir, 'sequence.db')}",
+                SQLALCHEMY_ENGINE_OPTIONS=sqlite_engine_options(pool_size=threads),
+                SQLITE_LOCK_RETRIES=20
+            )
+            db.init_app(app)
+            profile = SQLiteProfile()
+            profile.init_app(app, db)
+            with app.app_context():
+                db.create_all()
+            
+            @profile.retry_on_locked
+            def place_order(worker):
+                order = Order(customer_name=f"Worker {worker}", customer_phone='0811111111',
+                              delivery_address_details='Test', total_price=100, payment_method='COD')
+                order.generate_order_number()
+                db.session.add(order)
+                db.session.commit()
+            
+            errors = []
+            start_gate = threading.Barrier(threads)
+            
+            def worker(index):
+                with app.app_context():
+                    start_gate.wait()
+                    try:
+                        for _ in range(per_thread):
+                            place_order(index)
+                    except Exception as e:
+                        errors.append(e)
+                    finally:
+                        db.session.remove()
+            
+            workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            
+            assert errors == []
+            with app.app_context():
+                numbers = [row[0] for row in db.session.query(Order.order_number).all()]
+                db.engine.dispose()
+            
+            prefix = f"LA{get_thai_now():%Y%m%d}-"
+            total = threads * per_thread
+            assert len(numbers) == total
+            assert sorted(int(number[len(prefix):]) for number in numbers) == list(range(1, total + 1))
+
+
+class TestOrderWriter:
+    """Test set-based order item inserts"""
+    
+    def test_items_and_options_match_their_lines(self, app):
+        """Test a large basket is written with a fixed number of statements"""
+        from sqlalchemy import event
+        from models import OrderItemOption
+        from order_writer import OrderWriter
+        
+        with app.app_context():
+            menu = Menu.query.first()
+            lines = [
+                OrderWriter.item_row(
+                    menu.id, f"Line {n}", 50 + n, n % 3 + 1, f"Note {n}",
+                    [(option, f"Option {n}-{option}", option * 5) for option in range(1, n % 4 + 1)]
+                )
+                for n in range(30)
+            ]
+            order = Order(order_number='LA-WRITER-001', customer_name='Writer', customer_phone='0811111111',
+                          delivery_address_details='Test', total_price=100, payment_method='COD')
+            
+            statements = []
+            count = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                OrderWriter.write(order, lines)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            
+            assert len([statement for statement in statements if statement.startswith('INSERT')]) == 3
+            
+            items = OrderItem.query.filter_by(order_id=order.id).order_by(OrderItem.id).all()
+            assert [item.menu_name for item in items] == [f"Line {n}" for n in range(30)]
+            for n, item in enumerate(items):
+                assert item.special_requests == f"Note {n}"
+                assert item.quantity == n % 3 + 1
+                options = OrderItemOption.query.filter_by(order_item_id=item.id).order_by(OrderItemOption.option_id).all()
+                assert [option.option_name for option in options] == [
+                    f"Option {n}-{option}" for option in range(1, n % 4 + 1)
+                ]
+    
+    def test_insert_items_returns_ids_in_line_order(self, app):
+        """Test ids come back in line order when adding to an existing order"""
+        from order_writer import OrderWriter
+        
+        with app.app_context():
+            order = create_test_order('Writer Update')
+            menu = Menu.query.first()
+            
+            assert OrderWriter.insert_items(order.id, []) == []
+            item_ids = OrderWriter.insert_items(order.id, [
+                OrderWriter.item_row(menu.id, name, menu.price, 1) for name in ('First', 'Second', 'Third')
+            ])
+            db.session.commit()
+            
+            assert [db.session.get(OrderItem, item_id).menu_name for item_id in item_ids] == ['First', 'Second', 'Third']
+    
+    def test_customer_basket_costs_fixed_statements(self, app):
+        """Test a customer basket loads its catalog in two queries whatever its size"""
+        from sqlalchemy import event
+        from models import MenuOptionGroup, MenuOptionItem, OrderItemOption
+        from order_writer import OrderWriter
+        from routes.customer import load_cart_catalog, order_item_row
+        
+        with app.app_context():
+            menus = Menu.query.limit(2).all()
+            group = MenuOptionGroup(menu_id=menus[0].id, name='Spice')
+            db.session.add(group)
+            db.session.flush()
+            option_items = [MenuOptionItem(group_id=group.id, name=f"Level {n}", additional_price=n) for n in range(3)]
+            db.session.add_all(option_items)
+            db.session.commit()
+            
+            cart = [
+                {
+                    'menu_id': menus[n % 2].id,
+                    'quantity': 1,
+                    'options': [{'id': option_item.id} for option_item in option_items[:n % 4]]
+                }
+                for n in range(12)
+            ]
+            order = Order(order_number='LA-WRITER-002', customer_name='Basket', customer_phone='0811111111',
+                          delivery_address_details='Test', total_price=100, payment_method='COD')
+            
+            statements = []
+            count = lambda *args: statements.append(args[2].split()[0])
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                catalog = load_cart_catalog(cart)
+                OrderWriter.write(order, [order_item_row(cart_item, *catalog) for cart_item in cart])
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+            
+            assert statements.count('SELECT') == 2
+            assert statements.count('INSERT') == 3
+            assert OrderItemOption.query.join(OrderItem).filter(OrderItem.order_id == order.id).count() == sum(n % 4 for n in range(12))
@@ -7,15 +7,26 @@ import pytest
 import tempfile
 import os
 import time
+import json
+import pickle
+import threading
+import gc
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 
 # Import production components
 from security import SecurityManager, security_manager
-from caching import CacheManager, cache_manager, cached
-from monitoring import PerformanceMonitor, performance_monitor
+from caching import (
+    CacheManager, BackgroundRefresher, CacheSerializer, CacheWarmer, SoftEntry,
+    cache_manager, cached, invalidate_on_commit
+)
+from monitoring import LatencyHistogram, PerformanceMonitor, WindowedHistogram, performance_monitor, sql_fingerprint
 from backup import BackupManager, backup_manager
 from notifications import NotificationManager, notification_manager
+from redis_connection import CircuitBreaker, RedisConnection
+from metrics import MetricsExporter
+from shared_metrics import SharedMetrics
+from sqlite_profile import SQLiteProfile, sqlite_engine_options
 
 
 class TestSecurityManager:
@@ -227,6 +238,743 @@ class TestCacheManager:
             assert stats['hits'] >= 1
             assert stats['misses'] >= 1
             assert stats['sets'] >= 1
+    
+    def test_memory_cache_lru_eviction(self, app):
+        """Test memory backend evicts least recently used entries"""
+        with app.app_context():
+            app.config['CACHE_MEMORY_MAX_ENTRIES'] = 3
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            
+            for key in ['a', 'b', 'c']:
+                cache_mgr.set(key, key.upper(), timeout=60)
+            
+            # Touch 'a' so 'b' becomes the eviction candidate
+            assert cache_mgr.get('a') == 'A'
+            cache_mgr.set('d', 'D', timeout=60)
+            
+            assert cache_mgr.get('b') is None
+            assert cache_mgr.get('a') == 'A'
+            assert cache_mgr.get('d') == 'D'
+            
+            stats = cache_mgr.get_stats()
+            assert stats['memory_cache_size'] == 3
+            assert stats['evictions'] == 1
+    
+    def test_memory_cache_byte_budget(self, app):
+        """Test memory backend stays within its byte budget"""
+        with app.app_context():
+            app.config['CACHE_MEMORY_MAX_BYTES'] = 4096
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            
+            for i in range(20):
+                cache_mgr.set(f'report:{i}', 'x' * 500, timeout=60)
+            
+            stats = cache_mgr.get_stats()
+            assert stats['memory_cache_bytes'] <= 4096
+            assert stats['evictions'] > 0
+            assert cache_mgr.get('report:19') == 'x' * 500
+            
+            # Values larger than the whole budget are rejected
+            assert cache_mgr.set('huge', 'x' * 10000, timeout=60) is False
+    
+    def test_memory_cache_lazy_expiry(self, app):
+        """Test expired entries are reclaimed and counted"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            
+            with patch('caching.time.monotonic', return_value=1000.0):
+                cache_mgr.set('short', 'value', timeout=1)
+                cache_mgr.set('long', 'value', timeout=60)
+            
+            with patch('caching.time.monotonic', return_value=1002.0):
+                cache_mgr.set('other', 'value', timeout=60)
+                assert 'lanaim_cache:short' not in cache_mgr.memory_cache
+                assert cache_mgr.get('long') == 'value'
+            
+            assert cache_mgr.get_stats()['expirations'] == 1
+    
+    def test_local_catalog_entries_expire_quickly(self, app):
+        """Test catalog tags get a short TTL when cached in this worker's memory"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            
+            with patch('caching.time.monotonic', return_value=1000.0):
+                cache_mgr.set('menu_items', ['pad thai'], timeout=1800, tags=['menu'])
+                cache_mgr.set_many({'delivery_zones': ['A']}, timeout=3600, tags=['menu', 'zones'])
+                cache_mgr.set('analytics:sales', 100, timeout=300, tags=['analytics'])
+            
+            with patch('caching.time.monotonic', return_value=1011.0):
+                assert cache_mgr.get('menu_items') is None
+                assert cache_mgr.get('delivery_zones') is None
+                assert cache_mgr.get('analytics:sales') == 100
+    
+    def test_tag_invalidation(self, app):
+        """Test invalidating a tag drops only the keys carrying it"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            
+            cache_mgr.set('analytics:sales:7', [1, 2], tags=['analytics'])
+            cache_mgr.set('analytics:peak', {'h': 12}, tags=['analytics', 'dashboard'])
+            cache_mgr.set('menu_items', ['pad thai'], tags=['menu'])
+            
+            with patch.object(cache_mgr.memory_cache, 'keys') as mock_keys:
+                removed = cache_mgr.invalidate_tag('analytics')
+                mock_keys.assert_not_called()
+            
+            assert removed == 2
+            assert cache_mgr.get('analytics:sales:7') is None
+            assert cache_mgr.get('analytics:peak') is None
+            assert cache_mgr.get('menu_items') == ['pad thai']
+            assert cache_mgr.invalidate_tag('dashboard') == 0
+    
+    def test_redis_tag_invalidation_avoids_keys_scan(self, app):
+        """Test Redis invalidation reads the tag set instead of KEYS"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            cache_mgr.redis_client = MagicMock()
+            pipe = cache_mgr.redis_client.pipeline.return_value
+            pipe.execute.return_value = [{b'lanaim_cache:analytics:a', b'lanaim_cache:analytics:b'}, 1]
+            
+            assert cache_mgr.invalidate_tag('analytics') == 2
+            assert cache_mgr.clear() is True
+            
+            cache_mgr.redis_client.keys.assert_not_called()
+            pipe.smembers.assert_any_call('lanaim_cache_tag:analytics')
+            pipe.smembers.assert_any_call('lanaim_cache_tag:__all__')
+    
+    def test_redis_tag_sets_are_pruned(self, app):
+        """Test expired members are pruned from tag sets and deletes leave the all-keys set"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            cache_mgr.redis_client = MagicMock()
+            cache_mgr.tag_prune_every = 3
+            
+            with patch.object(cache_mgr.refresher, 'schedule') as schedule:
+                for n in range(3):
+                    cache_mgr.set(f'analytics:{n}', n, timeout=60, tags=['analytics'])
+                schedule.assert_called_once_with('__prune_tag_sets__', cache_mgr.prune_tag_sets)
+            
+            members = {
+                'lanaim_cache_tag:__all__': [f'lanaim_cache:analytics:{n}'.encode() for n in range(5)],
+                'lanaim_cache_tag:analytics': [f'lanaim_cache:analytics:{n}'.encode() for n in range(5)]
+            }
+            cache_mgr.redis_client.sscan_iter.side_effect = lambda tag_key, count: iter(members[tag_key])
+            cache_mgr.redis_client.eval.return_value = 1
+            
+            assert cache_mgr.prune_tag_sets(batch_size=2) == 6
+            assert cache_mgr.redis_client.eval.call_count == 6
+            script, numkeys, tag_key, *batch = cache_mgr.redis_client.eval.call_args_list[0].args
+            assert script == CacheManager.PRUNE_TAG_SCRIPT
+            assert len(batch) == 2
+            assert cache_mgr.get_stats()['tag_members_pruned'] == 6
+            
+            pipe = cache_mgr.redis_client.pipeline.return_value
+            pipe.execute.return_value = [1, 1]
+            cache_mgr.delete('analytics:0')
+            pipe.srem.assert_called_with('lanaim_cache_tag:__all__', 'lanaim_cache:analytics:0')
+    
+    def _tiered_cache(self, app):
+        """Cache manager with a mocked Redis L2 and a live L1"""
+        cache_mgr = CacheManager()
+        cache_mgr.init_app(app)
+        cache_mgr.redis_client = MagicMock()
+        with patch.object(threading.Thread, 'start'):
+            cache_mgr.init_l1(app)
+        cache_mgr._listener_connected = True
+        return cache_mgr
+    
+    def test_l1_serves_hot_keys_without_redis(self, app):
+        """Test hot keys are answered from L1 after the first Redis hit"""
+        with app.app_context():
+            cache_mgr = self._tiered_cache(app)
+            pipe = cache_mgr.redis_client.pipeline.return_value
+            pipe.execute.return_value = [pickle.dumps(['pad thai']), 30000]
+            
+            assert cache_mgr.get('menu_items') == ['pad thai']
+            assert cache_mgr.get('menu_items') == ['pad thai']
+            
+            assert pipe.execute.call_count == 1
+            stats = cache_mgr.get_stats()
+            assert stats['backend'] == 'Redis+L1'
+            assert stats['l1_hits'] == 1
+            
+            # Keys outside the hot set always go to Redis
+            cache_mgr.redis_client.get.return_value = None
+            assert cache_mgr.get('analytics:sales') is None
+            cache_mgr.redis_client.get.assert_called_once()
+    
+    def test_l1_invalidation_messages(self, app):
+        """Test invalidations from other workers evict L1 copies"""
+        with app.app_context():
+            cache_mgr = self._tiered_cache(app)
+            cache_mgr.l1_cache.set('lanaim_cache:menu_items', ['old'], 60)
+            cache_mgr.l1_cache.set('lanaim_cache:delivery_zones', ['zone'], 60)
+            
+            # Our own writes are already applied locally
+            cache_mgr._handle_invalidation(json.dumps({
+                'origin': cache_mgr.instance_id, 'keys': ['lanaim_cache:menu_items']
+            }))
+            assert 'lanaim_cache:menu_items' in cache_mgr.l1_cache
+            
+            cache_mgr._handle_invalidation(json.dumps({
+                'origin': 'other-worker', 'keys': ['lanaim_cache:menu_items']
+            }))
+            assert 'lanaim_cache:menu_items' not in cache_mgr.l1_cache
+            assert 'lanaim_cache:delivery_zones' in cache_mgr.l1_cache
+            
+            cache_mgr._handle_invalidation(json.dumps({'origin': 'other-worker', 'tags': ['menu']}))
+            assert len(cache_mgr.l1_cache) == 0
+    
+    def test_set_publishes_invalidation(self, app):
+        """Test writes publish an L1 invalidation in the same pipeline"""
+        with app.app_context():
+            cache_mgr = self._tiered_cache(app)
+            pipe = cache_mgr.redis_client.pipeline.return_value
+            
+            cache_mgr.set('menu_items', ['new'], timeout=600, tags=['menu'])
+            
+            channel, payload = pipe.publish.call_args[0]
+            assert channel == 'lanaim_cache:invalidate'
+            assert json.loads(payload)['keys'] == ['lanaim_cache:menu_items']
+            assert cache_mgr.l1_cache.get('lanaim_cache:menu_items') == ['new']
+    
+    def test_single_flight_coalesces_concurrent_misses(self, app):
+        """Test concurrent misses on one key run the producer once"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            
+            call_count = 0
+            barrier = threading.Barrier(8)
+            results = []
+            
+            def slow_report():
+                nonlocal call_count
+                call_count += 1
+                time.sleep(0.2)
+                return {'revenue': 1200}
+            
+            def worker():
+                barrier.wait()
+                results.append(cache_mgr.get_or_set(
+                    'analytics:daily', slow_report, timeout=60, single_flight=True
+                ))
+            
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            assert call_count == 1
+            assert results == [{'revenue': 1200}] * 8
+            
+            single_flight = cache_mgr.get_stats()['single_flight']
+            assert single_flight['leaders'] == 1
+            assert single_flight['coalesced'] == 7
+            assert single_flight['max_lock_wait_seconds'] > 0
+    
+    def test_single_flight_waits_on_redis_lease(self, app):
+        """Test a worker that loses the Redis lease waits for the value"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            cache_mgr.redis_client = MagicMock()
+            cache_mgr.redis_client.set.return_value = None  # Lease held elsewhere
+            cache_mgr.redis_client.get.side_effect = [None, None, pickle.dumps('report')]
+            producer = MagicMock()
+            
+            value = cache_mgr.get_or_set('analytics:weekly', producer, single_flight=True)
+            
+            assert value == 'report'
+            producer.assert_not_called()
+            assert cache_mgr.get_stats()['single_flight']['lease_waits'] == 1
+    
+    def test_stale_while_revalidate(self, app):
+        """Test stale values are served while a background refresh runs"""
+        with app.app_context():
+            cache_manager.init_app(app)
+            versions = iter(['v1', 'v2'])
+            
+            @cached(key_func=lambda: 'dashboard:tiles', soft_ttl=0.1, hard_ttl=60)
+            def dashboard_tiles():
+                return next(versions)
+            
+            assert dashboard_tiles() == 'v1'
+            assert dashboard_tiles() == 'v1'
+            
+            time.sleep(0.15)
+            assert dashboard_tiles() == 'v1'  # Stale value returned immediately
+            
+            deadline = time.time() + 5
+            while cache_manager.refresher.get_stats()['completed'] < 1 and time.time() < deadline:
+                time.sleep(0.01)
+            
+            assert dashboard_tiles() == 'v2'
+            refresh_stats = cache_manager.get_stats()['background_refresh']
+            assert refresh_stats['completed'] == 1
+            assert refresh_stats['failures'] == 0
+            assert refresh_stats['max_duration'] >= 0
+    
+    def test_background_refresher_is_bounded(self, app):
+        """Test refreshes beyond the queue bound are dropped, failures counted"""
+        refresher = BackgroundRefresher(max_workers=1, max_pending=1)
+        release = threading.Event()
+        
+        assert refresher.schedule('slow', release.wait) is True
+        assert refresher.schedule('slow', release.wait) is False
+        assert refresher.schedule('other', release.wait) is False
+        release.set()
+        refresher.shutdown()
+        
+        def failing_refresh():
+            raise RuntimeError('database is locked')
+        
+        refresher.schedule('broken', failing_refresh)
+        refresher.shutdown()
+        
+        stats = refresher.get_stats()
+        assert stats['duplicates'] == 1
+        assert stats['dropped'] == 1
+        assert stats['completed'] == 1
+        assert stats['failures'] == 1
+        assert stats['last_error'] == 'database is locked'
+    
+    @pytest.mark.parametrize('codec', ['msgpack', 'json', 'pickle'])
+    def test_serializer_round_trip(self, codec):
+        """Test every codec round-trips plain menu payloads"""
+        if codec == 'msgpack':
+            pytest.importorskip('msgpack')
+        serializer = CacheSerializer(codec=codec, compression='zlib', compress_threshold=256)
+        menu = [
+            {'id': i, 'name': 'ผัดไทยกุ้ง', 'price': 120.0, 'is_active': True, 'image_url': None}
+            for i in range(50)
+        ]
+        
+        payload = serializer.dumps(menu)
+        
+        assert payload[0:1] == serializer.codec.tag
+        assert payload[1:2] == b'z'  # Large payload was compressed
+        assert serializer.loads(payload) == menu
+        assert serializer.get_stats()['encoded'] == {codec: 1}
+    
+    def test_serializer_falls_back_to_pickle(self):
+        """Test values outside the fast codec fall back to pickle"""
+        from decimal import Decimal
+        serializer = CacheSerializer(codec='json', compression='none')
+        report = {'total': Decimal('1520.50'), 'date': datetime(2025, 7, 11)}
+        
+        payload = serializer.dumps(report)
+        
+        assert payload[0:2] == b'p-'
+        assert serializer.loads(payload) == report
+        assert serializer.get_stats()['fallbacks'] == 1
+    
+    def test_serializer_reads_legacy_pickles(self):
+        """Test entries written before codec tags still decode"""
+        serializer = CacheSerializer()
+        assert serializer.loads(pickle.dumps({'menu': [1, 2]})) == {'menu': [1, 2]}
+    
+    def test_serializer_defaults_to_pickle(self, app):
+        """Test msgpack is only used when configured, even if installed"""
+        assert CacheSerializer().codec.name == 'pickle'
+        cache_mgr = CacheManager()
+        cache_mgr.init_app(app)
+        assert cache_mgr.serializer.codec.name == 'pickle'
+    
+    def test_msgpack_preserves_soft_entries(self):
+        """Test stale-while-revalidate envelopes survive the msgpack codec"""
+        pytest.importorskip('msgpack')
+        serializer = CacheSerializer(codec='msgpack')
+        
+        entry = serializer.loads(serializer.dumps(SoftEntry({1: 'a'}, 1234.5)))
+        
+        assert isinstance(entry, SoftEntry)
+        assert entry.value == {1: 'a'}
+        assert entry.fresh_until == 1234.5
+        assert serializer.get_stats()['fallbacks'] == 0
+
+    def test_msgpack_round_trips_like_pickle(self):
+        """Test msgpack returns tuples and builtin subclasses with the types pickle would"""
+        pytest.importorskip('msgpack')
+        from collections import OrderedDict
+        serializer = CacheSerializer(codec='msgpack', compression='none')
+        value = {
+            'peak_hour': (12, 'lunch'),
+            (7, 'days'): [(1, 2), {'nested': (3, (4,))}],
+            'ranked': OrderedDict([('pad thai', 3), ('tom yum', 2)])
+        }
+        
+        decoded = serializer.loads(serializer.dumps(value))
+        
+        assert decoded == pickle.loads(pickle.dumps(value))
+        assert type(decoded['peak_hour']) is tuple
+        assert type(decoded[(7, 'days')][1]['nested'][1]) is tuple
+        assert type(decoded['ranked']) is OrderedDict
+        assert serializer.loads(serializer.dumps([(1, 2)])) == [(1, 2)]
+    
+    def test_serializer_stats_are_thread_safe(self):
+        """Test codec counters add up when many threads encode at once"""
+        serializer = CacheSerializer(codec='json', compression='zlib', compress_threshold=1)
+        
+        def encode_many():
+            for n in range(500):
+                serializer.dumps({'n': n, 'name': 'ผัดไทย' * 20})
+        
+        workers = [threading.Thread(target=encode_many) for _ in range(8)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        
+        stats = serializer.get_stats()
+        assert stats['encoded'] == {'json': 4000}
+        assert stats['compressed'] == 4000
+    
+    def test_batch_operations(self, app):
+        """Test get_many/set_many/delete_many in memory mode"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+
+            assert cache_mgr.set_many({'menu_items': ['pad thai'], 'delivery_zones': ['A']}, tags=['menu']) is True
+
+            with patch.object(cache_mgr.memory_cache, 'get') as mock_get:
+                values = cache_mgr.get_many(['menu_items', 'delivery_zones', 'analytics:peak'])
+                mock_get.assert_not_called()
+
+            assert values == {'menu_items': ['pad thai'], 'delivery_zones': ['A']}
+            stats = cache_mgr.get_stats()
+            assert stats['hits'] == 2
+            assert stats['misses'] == 1
+            assert stats['sets'] == 2
+
+            assert cache_mgr.delete_many(['menu_items', 'analytics:peak']) == 1
+            assert cache_mgr.get_many(['menu_items', 'delivery_zones']) == {'delivery_zones': ['A']}
+            assert cache_mgr.invalidate_tag('menu') == 1
+
+    def test_redis_batch_operations_use_one_round_trip(self, app):
+        """Test Redis batches go out as a single MGET / pipeline"""
+        with app.app_context():
+            cache_mgr = self._tiered_cache(app)
+            pipe = cache_mgr.redis_client.pipeline.return_value
+            pipe.execute.return_value = [
+                [pickle.dumps(['pad thai']), None, pickle.dumps({'h': 12})],
+                30000
+            ]
+
+            values = cache_mgr.get_many(['menu_items', 'analytics:sales', 'analytics:peak'])
+
+            assert values == {'menu_items': ['pad thai'], 'analytics:peak': {'h': 12}}
+            pipe.mget.assert_called_once_with(
+                ['lanaim_cache:menu_items', 'lanaim_cache:analytics:sales', 'lanaim_cache:analytics:peak']
+            )
+            pipe.pttl.assert_called_once_with('lanaim_cache:menu_items')
+            cache_mgr.redis_client.get.assert_not_called()
+            assert cache_mgr.l1_cache.get('lanaim_cache:menu_items') == ['pad thai']
+
+            pipe.reset_mock()
+            cache_mgr.set_many({'analytics:a': 1, 'analytics:b': 2}, timeout=300, tags=['analytics'])
+
+            assert pipe.execute.call_count == 1
+            assert pipe.setex.call_count == 2
+            pipe.sadd.assert_any_call('lanaim_cache_tag:analytics', 'lanaim_cache:analytics:a', 'lanaim_cache:analytics:b')
+
+            pipe.reset_mock()
+            pipe.execute.return_value = [1, 0, 1]
+            assert cache_mgr.delete_many(['analytics:a', 'analytics:b']) == 1
+            assert pipe.execute.call_count == 1
+            assert pipe.delete.call_count == 2
+
+    def test_cache_prefetch(self, app):
+        """Test cache_prefetch serves several cached() calls from one batch"""
+        from caching import cache_prefetch
+
+        with app.app_context():
+            cache_manager.init_app(app)
+
+            @cached(key_func=lambda: 'dashboard:menu')
+            def menu():
+                return ['pad thai']
+
+            @cached(soft_ttl=30, hard_ttl=60)
+            def sales(days):
+                return {'days': days}
+
+            menu()
+            sales(7)
+
+            with patch.object(cache_manager, 'get_many', wraps=cache_manager.get_many) as mock_get_many, \
+                    patch.object(cache_manager, 'get_or_set') as mock_get_or_set:
+                with cache_prefetch(menu, (sales, (7,))):
+                    assert menu() == ['pad thai']
+                    assert sales(7) == {'days': 7}
+
+                mock_get_many.assert_called_once_with(['dashboard:menu', 'sales:7'])
+                mock_get_or_set.assert_not_called()
+
+            # Outside the block calls go back to the normal path
+            assert sales(14) == {'days': 14}
+    
+    def test_namespace_statistics(self, app):
+        """Test stats are broken down by the key part before the first colon"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            app.config['CACHE_MEMORY_MAX_ENTRIES'] = 2
+            try:
+                cache_mgr.init_app(app)
+            finally:
+                del app.config['CACHE_MEMORY_MAX_ENTRIES']
+            
+            cache_mgr.set('menu_items', ['pad thai'])
+            cache_mgr.get('menu_items')
+            cache_mgr.get('analytics:sales:7')
+            cache_mgr.set('analytics:sales:7', {'total': 1520})
+            cache_mgr.set('analytics:peak', {'h': 12})  # Evicts menu_items
+            cache_mgr.get_many(['analytics:sales:7', 'menu_items'])
+            
+            stats = cache_mgr.get_stats()
+            menu = stats['namespaces']['menu_items']
+            analytics = stats['namespaces']['analytics']
+            
+            assert (menu['hits'], menu['misses'], menu['sets'], menu['evictions']) == (1, 1, 1, 1)
+            assert (analytics['hits'], analytics['misses'], analytics['sets']) == (1, 1, 2)
+            assert analytics['bytes_written'] > 0
+            assert analytics['hit_rate'] == 50.0
+            assert analytics['latency_ms']['get']['count'] == 1
+            assert analytics['latency_ms']['set']['count'] == 2
+            assert sum(analytics['latency_ms']['get']['histogram'].values()) == 1
+            assert stats['hits'] == 2
+            assert stats['misses'] == 2
+            json.dumps(stats)  # Served as-is by /admin/system-status
+    
+    def test_statistics_are_not_lost_across_threads(self, app):
+        """Test concurrent increments from many threads all land"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            barrier = threading.Barrier(8)
+            
+            def worker():
+                barrier.wait()
+                for _ in range(2000):
+                    cache_mgr.stats.incr('menu_items', 'hits')
+                    cache_mgr.stats.observe('menu_items', 'get', 0.0001)
+            
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            stats = cache_mgr.get_stats()
+            assert stats['hits'] == 16000
+            assert stats['namespaces']['menu_items']['latency_ms']['get']['count'] == 16000
+            assert stats['namespaces']['menu_items']['latency_ms']['get']['p99'] == 0.5
+    
+    def test_short_lived_threads_do_not_grow_statistics(self, app):
+        """Test thousands of one-off threads leave the shard count fixed"""
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            shards = len(cache_mgr.stats._shards)
+            
+            def worker():
+                cache_mgr.stats.incr('menu_items', 'hits')
+                cache_mgr.stats.event('tag_invalidations')
+            
+            for _ in range(20):
+                threads = [threading.Thread(target=worker) for _ in range(100)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            
+            assert len(cache_mgr.stats._shards) == shards
+            stats = cache_mgr.stats.get_stats()
+            assert stats['totals']['hits'] == 2000
+            assert stats['events']['tag_invalidations'] == 2000
+    
+    def test_cache_warmer_respects_time_budget(self, app):
+        """Test warm-up runs producers concurrently and stops waiting at the budget"""
+        warmer = CacheWarmer()
+        app.config.update(CACHE_WARMUP_WORKERS=3, CACHE_WARMUP_BUDGET=0.2)
+        warmer.init_app(app)
+        release = threading.Event()
+        
+        @warmer.register('menu_catalog', tags=['menu'])
+        def warm_menu():
+            cache_manager.set('menu_items', ['pad thai'])
+        
+        @warmer.register('dashboard_tiles', tags=['analytics'])
+        def warm_tiles():
+            release.wait(5)
+        
+        @warmer.register('delivery_zones', tags=['menu'])
+        def warm_zones():
+            raise RuntimeError('database is locked')
+        
+        try:
+            started = time.monotonic()
+            finished = warmer.warm()
+            
+            assert time.monotonic() - started < 1
+            assert sorted(finished) == ['delivery_zones', 'menu_catalog']
+            status = warmer.get_status()
+            assert status['producers']['menu_catalog']['status'] == 'ok'
+            assert status['producers']['dashboard_tiles']['status'] == 'running'
+            assert status['producers']['delivery_zones'] == {
+                'status': 'failed', 'error': 'database is locked',
+                'duration': status['producers']['delivery_zones']['duration']
+            }
+            assert cache_manager.get('menu_items') == ['pad thai']
+        finally:
+            release.set()
+            warmer.shutdown()
+        
+        assert warmer.get_status()['producers']['dashboard_tiles']['status'] == 'ok'
+    
+    def test_cache_warmer_startup_and_tag_rewarm(self, app):
+        """Test startup readiness and re-warming only the invalidated tag"""
+        warmer = CacheWarmer()
+        warmer.init_app(app)
+        calls = []
+        warmer.register('menu_catalog', tags=['menu'])(lambda: calls.append('menu'))
+        warmer.register('dashboard_tiles', tags=['analytics'])(lambda: calls.append('tiles'))
+        
+        assert warmer.ready is False
+        warmer.warm_startup().join(5)
+        assert warmer.ready is True
+        assert sorted(calls) == ['menu', 'tiles']
+        
+        assert warmer.warm_tag('menu') == ['menu_catalog']
+        warmer.shutdown()
+        assert sorted(calls) == ['menu', 'menu', 'tiles']
+    
+    def test_catalog_commit_invalidates_menu_cache(self, app):
+        """Test committing a menu change invalidates the menu tag, rollbacks do not"""
+        from models import db, Menu, Order
+        
+        with app.app_context():
+            invalidate_on_commit({Menu: ['menu']})
+            menu = Menu.query.first()
+            
+            with patch('caching.invalidate_menu_cache') as mock_invalidate:
+                menu.price = 125
+                db.session.commit()
+                assert mock_invalidate.call_count == 1
+                
+                menu.price = 130
+                db.session.flush()
+                db.session.rollback()
+                Order.query.count()
+                db.session.commit()
+                assert mock_invalidate.call_count == 1
+    
+    def test_redis_outage_falls_back_to_memory(self, app):
+        """Test an open breaker serves from memory and corrects Redis on recovery"""
+        import redis
+        
+        with app.app_context():
+            cache_mgr = CacheManager()
+            cache_mgr.init_app(app)
+            cache_mgr.redis_client = MagicMock()
+            cache_mgr.breaker = CircuitBreaker('Redis', failure_threshold=2, reset_timeout=0.05)
+            cache_mgr.breaker.add_recovery_listener(cache_mgr._replay_outage_writes)
+            pipe = cache_mgr.redis_client.pipeline.return_value
+            cache_mgr.redis_client.get.side_effect = redis.ConnectionError('Connection refused')
+            
+            assert cache_mgr.get('analytics:sales') is None
+            assert cache_mgr.get('analytics:sales') is None
+            assert cache_mgr.breaker.state == CircuitBreaker.OPEN
+            
+            # While open, Redis is not touched at all
+            cache_mgr.set('menu_items', ['pad thai'], tags=['menu'])
+            assert cache_mgr.get('menu_items') == ['pad thai']
+            cache_mgr.invalidate_tag('menu')
+            assert cache_mgr.redis_client.get.call_count == 2
+            pipe.execute.assert_not_called()
+            assert cache_mgr.get_stats()['backend'] == 'Memory'
+            
+            time.sleep(0.06)
+            cache_mgr.redis_client.get.side_effect = None
+            cache_mgr.redis_client.get.return_value = None
+            pipe.execute.return_value = [set(), 1]
+            
+            assert cache_mgr.get('analytics:sales') is None
+            assert cache_mgr.breaker.state == CircuitBreaker.CLOSED
+            pipe.smembers.assert_called_once_with('lanaim_cache_tag:menu')
+            cache_mgr.redis_client.delete.assert_called_once_with('lanaim_cache:menu_items')
+            assert len(cache_mgr.memory_cache) == 0
+            assert cache_mgr.get_stats()['redis_breaker']['recoveries'] == 1
+
+
+class TestCircuitBreaker:
+    """Test the Redis circuit breaker and shared connection"""
+    
+    def test_breaker_opens_after_threshold_and_probes(self):
+        """Test failures open the breaker and a successful probe closes it"""
+        probe = MagicMock(side_effect=[ConnectionError('down'), True])
+        recovered = MagicMock()
+        breaker = CircuitBreaker('Redis', probe=probe, failure_threshold=3, failure_window=30, reset_timeout=0.05)
+        breaker.add_recovery_listener(recovered)
+        breaker.add_recovery_listener(recovered)
+        
+        breaker.record_failure(ConnectionError('timeout'))
+        breaker.record_failure(ConnectionError('timeout'))
+        assert breaker.allow_request() is True
+        breaker.record_failure(ConnectionError('timeout'))
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow_request() is False
+        
+        time.sleep(0.06)
+        assert breaker.allow_request() is False  # Probe failed, open again
+        assert breaker.state == CircuitBreaker.OPEN
+        
+        time.sleep(0.06)
+        assert breaker.allow_request() is True
+        assert breaker.state == CircuitBreaker.CLOSED
+        recovered.assert_called_once()
+        
+        stats = breaker.get_stats()
+        assert stats['trips'] == 1
+        assert stats['failed_probes'] == 1
+        assert stats['recoveries'] == 1
+        assert stats['rejected'] == 1
+    
+    def test_failures_outside_window_do_not_trip(self):
+        """Test only failures inside the window count towards the threshold"""
+        breaker = CircuitBreaker('Redis', failure_threshold=2, failure_window=0.05)
+        
+        breaker.record_failure(ConnectionError('timeout'))
+        time.sleep(0.06)
+        breaker.record_failure(ConnectionError('timeout'))
+        
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_connection_is_shared_per_url(self):
+        """Test caching and notifications get the same pooled client"""
+        pytest.importorskip('redis')
+        memory_app = MagicMock(config={'REDIS_URL': 'memory://'})
+        assert RedisConnection.from_app(memory_app) is None
+        
+        redis_app = MagicMock(config={'REDIS_URL': 'redis://127.0.0.1:1/0', 'REDIS_CONNECT_TIMEOUT': 0.1})
+        connection = RedisConnection.from_app(redis_app)
+        
+        try:
+            assert RedisConnection.from_app(redis_app) is connection
+            assert connection.pool.connection_kwargs['socket_timeout'] == 0.5
+            assert connection.check() is False
+            assert connection.breaker.state == CircuitBreaker.OPEN
+        finally:
+            RedisConnection._instances.pop('redis://127.0.0.1:1/0', None)
 
 
 class TestPerformanceMonitor:
@@ -252,8 +1000,8 @@ class TestPerformanceMonitor:
             client.get('/menu')
             
             # Check metrics
-            assert len(perf_monitor.metrics['request_times']) > 0
-            assert len(perf_monitor.metrics['endpoint_stats']) > 0
+            assert len(perf_monitor.metrics['latency']) > 0
+            assert ('menu', '2xx') in perf_monitor.metrics['latency']
     
     def test_performance_report(self, app):
         """Test performance report generation"""
@@ -262,8 +1010,8 @@ class TestPerformanceMonitor:
             perf_monitor.init_app(app)
             
             # Add some fake metrics
-            perf_monitor.metrics['request_times'].extend([0.1, 0.2, 0.3, 0.5, 1.0])
-            perf_monitor.metrics['endpoint_stats']['test_endpoint'] = {'count': 5, 'total_time': 2.1}
+            for request_time in [0.1, 0.2, 0.3, 0.5, 1.0]:
+                perf_monitor.record_request('test_endpoint', 200, request_time)
             
             report = perf_monitor.get_performance_report()
             
@@ -274,6 +1022,89 @@ class TestPerformanceMonitor:
             
             assert report['requests']['total_processed'] >= 0
             assert report['requests']['avg_response_time'] >= 0
+            assert report['latency']['test_endpoint']['2xx']['1m']['count'] == 5
+    
+    def test_health_reads_sampled_snapshot(self, app):
+        """Test health checks read the published snapshot instead of calling psutil"""
+        perf_monitor = PerformanceMonitor()
+        snapshot = perf_monitor.get_system_snapshot()
+        
+        assert snapshot['process']['pid'] == os.getpid()
+        assert snapshot['process']['rss_bytes'] > 0
+        assert snapshot['process']['threads'] >= 1
+        assert len(snapshot['gc']['collections']) == 3
+        with pytest.raises(TypeError):
+            snapshot['cpu_percent'] = 0
+        
+        with patch('monitoring.psutil') as mock_psutil:
+            health = perf_monitor.get_health_status()
+            report = perf_monitor.get_performance_report()
+            assert not mock_psutil.method_calls
+        
+        assert health['status'] != 'unknown'
+        assert health['memory_percent'] == snapshot['memory_percent']
+        assert health['process_rss_bytes'] == snapshot['process']['rss_bytes']
+        assert report['system']['process']['pid'] == os.getpid()
+    
+    def test_system_sampler_publishes_snapshots(self, app):
+        """Test the sampler thread replaces the snapshot at the configured interval"""
+        app.config['SYSTEM_SAMPLE_INTERVAL'] = 0.05
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        try:
+            deadline = time.time() + 5
+            while perf_monitor.system_snapshot is None and time.time() < deadline:
+                time.sleep(0.01)
+            first = perf_monitor.system_snapshot
+            while perf_monitor.system_snapshot is first and time.time() < deadline:
+                time.sleep(0.01)
+            assert perf_monitor.system_snapshot is not first
+            assert perf_monitor.system_snapshot['timestamp'] > first['timestamp']
+        finally:
+            perf_monitor.stop_monitoring()
+        assert not perf_monitor.monitoring_thread.is_alive()
+    
+    def test_latency_histogram_quantiles(self):
+        """Test histogram quantiles stay within bucket precision and merge exactly"""
+        first, second = LatencyHistogram(), LatencyHistogram()
+        values = [i / 10000 for i in range(1, 10001)]  # 0.1ms .. 1s
+        for value in values[::2]:
+            first.record(value)
+        for value in values[1::2]:
+            second.record(value)
+        
+        merged = LatencyHistogram().merge(first).merge(second)
+        assert merged.count == 10000
+        assert merged.min == 0.0001 and merged.max == 1.0
+        for q, expected in [(0.5, 0.5), (0.9, 0.9), (0.99, 0.99), (0.999, 0.999)]:
+            assert abs(merged.quantile(q) - expected) / expected < 0.04
+        
+        shipped = LatencyHistogram.from_dict(json.loads(json.dumps(merged.to_dict())))
+        assert shipped.summary() == merged.summary()
+        assert set(merged.summary()) == {'count', 'avg', 'max', 'p50', 'p90', 'p99', 'p999'}
+    
+    def test_latency_windows_per_status_class(self, app):
+        """Test sliding windows drop old slots and status classes are kept apart"""
+        perf_monitor = PerformanceMonitor()
+        now = 1_700_000_000
+        perf_monitor.record_request('api.place_order', 200, 2.0, now=now - 1800)
+        perf_monitor.record_request('api.place_order', 200, 0.05, now=now - 120)
+        perf_monitor.record_request('api.place_order', 200, 0.04, now=now - 5)
+        perf_monitor.record_request('api.place_order', 500, 0.9, now=now - 5)
+        
+        stats = perf_monitor.get_latency_stats(now=now)['api.place_order']
+        assert stats['2xx']['1m']['count'] == 1
+        assert stats['2xx']['5m']['count'] == 2
+        assert stats['2xx']['1h']['count'] == 3
+        assert stats['2xx']['1h']['p99'] == pytest.approx(2.0, rel=0.04)
+        assert stats['5xx']['1m']['count'] == 1
+        assert stats['5xx']['1m']['p50'] == pytest.approx(0.9, rel=0.04)
+        
+        window = WindowedHistogram(slot_seconds=10, retention=60)
+        for offset in range(0, 120, 10):
+            window.record(0.01, now=now - offset)
+        assert window.window(3600, now=now).count == 6  # Older slots were dropped
+        assert window.lifetime.count == 12
     
     def test_health_status(self, app):
         """Test health status check"""
@@ -288,6 +1119,600 @@ class TestPerformanceMonitor:
             assert health['status'] in ['excellent', 'good', 'fair', 'poor', 'critical', 'unknown']
             assert 0 <= health['score'] <= 100
 
+    
+    def test_sql_fingerprint(self):
+        """Test literals and IN lists are collapsed in statement fingerprints"""
+        assert sql_fingerprint(
+            "SELECT * FROM menus  WHERE id = 12 AND name = 'ผัดไทย' AND zone_id IN (?, ?, ?)"
+        ) == "SELECT * FROM menus WHERE id = ? AND name = ? AND zone_id IN (?)"
+    
+    def test_query_counts_and_n_plus_one(self, app):
+        """Test per-request query stats and repeated statement detection"""
+        from models import Menu
+        
+        perf_monitor = PerformanceMonitor()
+        app.config['SQL_REPEAT_THRESHOLD'] = 3
+        perf_monitor.init_app(app)
+        
+        with app.test_request_context('/menu'):
+            perf_monitor.before_request()
+            menu_ids = [menu.id for menu in Menu.query.all()]
+            for menu_id in menu_ids * 2:
+                Menu.query.filter_by(id=menu_id).first()
+            perf_monitor.after_request(app.response_class('ok'))
+        
+        with app.test_request_context('/menu'):
+            perf_monitor.before_request()
+            Menu.query.all()
+            perf_monitor.after_request(app.response_class('ok'))
+        
+        report = perf_monitor.get_performance_report()['database']
+        assert len(menu_ids) * 2 > 3
+        assert report['total_queries'] == 2 + len(menu_ids) * 2
+        assert report['endpoints'][0]['endpoint'] == 'menu'
+        assert report['endpoints'][0]['requests'] == 2
+        assert report['endpoints'][0]['max_queries'] == 1 + len(menu_ids) * 2
+        
+        offender = report['n_plus_one'][0]
+        assert offender['endpoint'] == 'menu'
+        assert offender['flagged_requests'] == 1
+        assert offender['max_repeats'] == len(menu_ids) * 2
+        assert 'WHERE menus.id = ?' in offender['fingerprint']
+    
+    def test_failed_statement_leaves_no_start_time(self, app):
+        """Test a statement that raises does not skew later timings on its connection"""
+        from sqlalchemy.exc import OperationalError
+        from models import db
+        
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        
+        with app.test_request_context('/menu'):
+            perf_monitor.before_request()
+            with db.engine.connect() as conn:
+                with pytest.raises(OperationalError):
+                    conn.exec_driver_sql('SELECT * FROM no_such_table')
+                time.sleep(0.05)
+                conn.exec_driver_sql('SELECT 1')
+                assert not conn.info.get('query_start_times')
+            perf_monitor.after_request(app.response_class('ok'))
+        
+        endpoint = perf_monitor.get_performance_report()['database']['endpoints'][0]
+        assert endpoint['max_queries'] == 1
+        assert endpoint['avg_db_time'] < 0.05
+    
+    def test_slow_request_breakdown(self, app):
+        """Test slow requests keep DB, template, cache and serialization time per endpoint"""
+        from flask import jsonify, render_template_string, request
+        from models import Menu
+        
+        app.config.update(SLOW_REQUEST_THRESHOLD=10, SLOW_REQUEST_THRESHOLDS={'menu': 0}, SLOW_REQUEST_RING_SIZE=2)
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        
+        for _ in range(3):
+            with app.test_request_context('/menu'):
+                perf_monitor.before_request()
+                menus = Menu.query.all()
+                cache_manager.get('menu_items:slow_request_test')
+                render_template_string('{% for m in menus %}{{ m.name }}{% endfor %}', menus=menus)
+                response = perf_monitor.after_request(jsonify([m.name for m in menus]))
+        
+        with app.test_request_context('/api/orders'):
+            perf_monitor.before_request()
+            perf_monitor.after_request(app.response_class('ok'))
+        
+        slow = perf_monitor.get_slow_requests()
+        assert len(slow) == 2  # Ring size per endpoint, /api/orders is under the default threshold
+        entry = slow[0]
+        assert entry['endpoint'] == 'menu' and entry['path'] == '/menu' and entry['status'] == 200
+        assert entry['threshold'] == 0
+        assert entry['queries'] == 1
+        assert 'FROM menus' in entry['top_sql'][0]['fingerprint']
+        breakdown = entry['breakdown']
+        for component in ['db', 'template', 'cache', 'serialization']:
+            assert breakdown[component] > 0, component
+        assert sum(breakdown.values()) == pytest.approx(entry['duration'], abs=1e-5)
+        assert perf_monitor.get_slow_requests('api_orders') == []
+    
+    def test_template_render_timing(self, app):
+        """Test render time is recorded per template, block, include and macro"""
+        from flask import render_template
+        from jinja2 import ChoiceLoader, DictLoader
+        
+        app.config.update(SLOW_REQUEST_THRESHOLDS={'menu': 0})
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        app.jinja_env.loader = ChoiceLoader([DictLoader({
+            'timing/base.html': '<main>{% block content %}{% endblock %}</main>',
+            'timing/macros.html': '{% macro row(item) %}<li>{{ item }}</li>{% endmacro %}',
+            'timing/footer.html': '<footer>{{ items|length }}</footer>',
+            'timing/list.html': (
+                '{% extends "timing/base.html" %}{% import "timing/macros.html" as m %}'
+                '{% block content %}{% for item in items %}{{ m.row(item) }}{% endfor %}'
+                '{% include "timing/footer.html" %}{% endblock %}'
+            )
+        }), app.jinja_env.loader])
+        
+        with app.test_request_context('/menu'):
+            perf_monitor.before_request()
+            html = render_template('timing/list.html', items=['ผัดไทย', 'ต้มยำ', 'ข้าวผัด'])
+            perf_monitor.after_request(app.response_class(html))
+        
+        assert html == '<main><li>ผัดไทย</li><li>ต้มยำ</li><li>ข้าวผัด</li><footer>3</footer></main>'
+        report = perf_monitor.get_performance_report()['templates']
+        parts = {(part['template'], part['part']): part for part in report['slowest_parts']}
+        assert parts[('timing/list.html', 'template')]['count'] == 1
+        assert parts[('timing/list.html', 'block:content')]['count'] == 1
+        assert parts[('timing/macros.html', 'macro:row')]['count'] == 3
+        assert ('timing/footer.html', 'template') in parts
+        assert report['endpoints'][0]['endpoint'] == 'menu'
+        
+        slow = perf_monitor.get_slow_requests('menu')[0]
+        assert slow['top_templates'][0] == {
+            'template': 'timing/list.html', 'part': 'template', 'count': 1,
+            'time': slow['top_templates'][0]['time']
+        }
+        assert slow['breakdown']['template'] >= slow['top_templates'][0]['time']
+    
+    def test_connection_pool_and_transaction_metrics(self, app):
+        """Test checkout wait, transaction and write-lock time, and lock errors by endpoint"""
+        from models import db, Menu
+        from sqlalchemy.exc import OperationalError
+        
+        app.config['SLOW_TRANSACTION_THRESHOLD'] = 0
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        
+        with app.test_request_context('/menu'):
+            menu = Menu.query.first()
+            menu.price = 99
+            time.sleep(0.02)
+            db.session.flush()
+            report = perf_monitor.get_performance_report()['connections']
+            assert report['open_transactions'][0]['endpoint'] == 'menu'
+            assert report['open_transactions'][0]['holding_write_lock'] is True
+            db.session.commit()
+        
+        # A second writer on a file database while the first holds the write lock
+        with tempfile.TemporaryDirectory() as db_dir:
+            from sqlalchemy import create_engine
+            engine = create_engine(f"sqlite:///{os.path.join(db_dir, 'lock.db')}", connect_args={'timeout': 0})
+            perf_monitor.connections.watch_engine(engine)
+            with engine.connect() as holder, engine.connect() as writer:
+                holder.exec_driver_sql('CREATE TABLE lock_probe (id INTEGER)')
+                holder.commit()
+                holder.exec_driver_sql('INSERT INTO lock_probe VALUES (1)')
+                with app.test_request_context('/menu'):
+                    with pytest.raises(OperationalError):
+                        writer.exec_driver_sql('INSERT INTO lock_probe VALUES (2)')
+                holder.rollback()
+            engine.dispose()
+        
+        report = perf_monitor.get_performance_report()['connections']
+        assert report['pool']['checkouts'] >= 2
+        assert report['pool']['in_use'] == 0
+        assert report['checkout_wait']['count'] >= 2
+        menu_transactions = next(t for t in report['transactions'] if t['endpoint'] == 'menu')
+        assert menu_transactions['max_time'] >= 0.02
+        assert 0 < menu_transactions['max_write_lock'] < menu_transactions['max_time']
+        assert report['slow_transactions'][0]['endpoint'] == 'menu'
+        assert report['open_transactions'] == []
+        assert report['lock_errors'] == {'menu': 1}
+        
+        perf_monitor.connections.record_lock_retry('api.place_order')
+        assert perf_monitor.connections.get_report()['lock_retries'] == {'api.place_order': 1}
+    
+    def test_pool_metrics_survive_dispose(self, app):
+        """Test checkout timing and timeouts are still recorded after engine.dispose()"""
+        from sqlalchemy import create_engine
+        from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+        
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        with tempfile.TemporaryDirectory() as db_dir:
+            engine = create_engine(f"sqlite:///{os.path.join(db_dir, 'pool.db')}",
+                                   pool_size=1, max_overflow=0, pool_timeout=0.05)
+            perf_monitor.connections.watch_engine(engine)
+            engine.dispose()
+            
+            with engine.connect():
+                with pytest.raises(PoolTimeoutError):
+                    engine.connect()
+            engine.dispose()
+        
+        report = perf_monitor.connections.get_report()
+        assert report['pool']['connects'] == 1
+        assert report['pool']['checkouts'] == 1
+        assert report['pool']['checkout_timeouts'] == 1
+        assert report['checkout_wait']['count'] == 2
+        assert report['pool']['pools'][-1]['capacity'] == 1
+    
+    def test_gc_pauses_charged_to_request(self, app):
+        """Test GC pauses are recorded per generation and for the running endpoint"""
+        app.config.update(SLOW_REQUEST_THRESHOLDS={'menu': 0}, GC_LONG_PAUSE_THRESHOLD=0)
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        
+        with app.test_request_context('/menu'):
+            perf_monitor.before_request()
+            gc.collect()
+            perf_monitor.after_request(app.response_class('ok'))
+        
+        report = perf_monitor.get_performance_report()['memory']
+        assert report['generations'][2]['collections'] >= 1
+        assert report['pauses']['count'] >= 1
+        assert report['endpoints']['menu']['collections'] >= 1
+        assert report['long_pauses'][0]['endpoint'] == 'menu'
+        slow = perf_monitor.get_slow_requests('menu')[0]
+        assert slow['gc_pause'] >= report['endpoints']['menu']['max_pause'] > 0
+    
+    def test_gc_during_locked_section_does_not_deadlock(self, app):
+        """Test a collection triggered while the monitor lock is held is recorded later"""
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        memory = perf_monitor.memory
+        
+        def collect_under_lock():
+            with memory._lock:
+                gc.collect()
+        
+        worker = threading.Thread(target=collect_under_lock, daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+        assert memory.get_report()['generations'][2]['collections'] >= 1
+    
+    def test_tracemalloc_sampling(self, app):
+        """Test sampled requests trace allocations and stop tracing afterwards"""
+        import tracemalloc
+        
+        app.config['TRACEMALLOC_SAMPLE_RATE'] = 1.0
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        
+        with app.test_request_context('/menu'):
+            perf_monitor.before_request()
+            assert tracemalloc.is_tracing()
+            report_rows = [{'order_number': f"LA{i:06d}", 'total': i * 1.5} for i in range(20000)]
+            del report_rows
+            perf_monitor.after_request(app.response_class('ok'))
+        
+        assert not tracemalloc.is_tracing()
+        allocations = perf_monitor.get_performance_report()['memory']['allocations']['menu']
+        assert allocations['samples'] == 1
+        assert allocations['max_peak_bytes'] > 1024 * 1024
+        assert allocations['avg_net_bytes'] < allocations['max_peak_bytes']
+    
+    def test_request_profiling_with_token(self, app):
+        """Test a signed token profiles one request into a bounded ring of files"""
+        def busy_handler():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+        
+        with tempfile.TemporaryDirectory() as profile_dir:
+            app.config.update(PROFILE_DIR=profile_dir, PROFILE_MAX_FILES=2, PROFILE_INTERVAL=0.001)
+            perf_monitor = PerformanceMonitor()
+            perf_monitor.init_app(app)
+            token = perf_monitor.profiler.make_token()
+            
+            profiles = []
+            for _ in range(3):
+                with app.test_request_context('/menu', headers={'X-Profile-Token': token}):
+                    perf_monitor.before_request()
+                    busy_handler()
+                    response = perf_monitor.after_request(app.response_class('ok'))
+                    profiles.append(response.headers['X-Profile-Id'])
+            
+            saved = [profile['filename'] for profile in perf_monitor.profiler.list_profiles()]
+            assert saved == profiles[:0:-1]  # Oldest one trimmed
+            with open(os.path.join(profile_dir, saved[0])) as f:
+                stack, count = f.readline().rsplit(' ', 1)
+            assert 'busy_handler' in stack and int(count) > 0
+            
+            with app.test_request_context('/menu', headers={'X-Profile-Token': token[:-1] + 'x'}):
+                perf_monitor.before_request()
+                response = perf_monitor.after_request(app.response_class('ok'))
+                assert 'X-Profile-Id' not in response.headers
+            assert perf_monitor.profiler.stats['token_rejected'] == 1
+            assert not perf_monitor.profiler.verify_token(f"{int(time.time()) - 1}.{token.split('.')[1]}")
+    
+    def test_malformed_profile_token_is_rejected(self, app):
+        """Test non-ASCII or garbled tokens are rejected instead of failing the request"""
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        profiler = perf_monitor.profiler
+        
+        for token in ('9999999999.ลายเซ็น', '9999999999.caf\u00e9', 'abc', '.', '١٢٣٤٥٦٧٨٩٠.x'):
+            assert profiler.verify_token(token) is False
+        
+        with app.test_request_context('/menu?_profile=9999999999.ทดสอบ'):
+            perf_monitor.before_request()
+            response = perf_monitor.after_request(app.response_class('ok'))
+            assert 'X-Profile-Id' not in response.headers
+        assert profiler.stats['token_rejected'] == 1
+    
+    def test_profiling_refused_under_green_threads(self, app):
+        """Test eventlet monkey patching turns profiling off instead of mixing requests"""
+        perf_monitor = PerformanceMonitor()
+        perf_monitor.init_app(app)
+        token = perf_monitor.profiler.make_token()
+        
+        from flask import request
+        with app.test_request_context('/menu', headers={'X-Profile-Token': token}):
+            with patch('profiler.green_threads_active', return_value=True):
+                assert perf_monitor.profiler.start(request) is None
+        assert perf_monitor.profiler.stats['unsupported'] == 1
+    
+    def test_request_profiling_sample_rate(self, app):
+        """Test endpoint sample rates select requests without a token"""
+        with tempfile.TemporaryDirectory() as profile_dir:
+            app.config.update(PROFILE_DIR=profile_dir, PROFILE_INTERVAL=0.001)
+            perf_monitor = PerformanceMonitor()
+            perf_monitor.init_app(app)
+            
+            from flask import request
+            with app.test_request_context('/menu'):
+                assert perf_monitor.profiler.start(request) is None
+                perf_monitor.profiler.set_sample_rate('menu', 1.0)
+                sampler = perf_monitor.profiler.start(request)
+                assert sampler is not None
+                time.sleep(0.02)
+                assert perf_monitor.profiler.finish(sampler, 'menu', 0.02).endswith('_menu_20ms.folded')
+            
+            perf_monitor.profiler.set_sample_rate('menu', 0)
+            assert perf_monitor.profiler.get_status()['sample_rates'] == {}
+    
+    def test_shared_metrics_merge_workers(self, app):
+        """Test workers publish into the shared file and reports merge live workers"""
+        with tempfile.TemporaryDirectory() as shared_dir:
+            app.config.update(METRICS_SHARED_PATH=os.path.join(shared_dir, 'metrics'), METRICS_SHARED_SLOTS=4,
+                              METRICS_SHARED_KEYS=8, METRICS_SHARED_INTERVAL=60)
+            ready_read, ready_write = os.pipe()
+            
+            child = os.fork()
+            if child == 0:
+                try:
+                    worker_monitor = PerformanceMonitor()
+                    worker_shared = SharedMetrics()
+                    worker_shared.init_app(app, worker_monitor)
+                    for request_time in [0.01, 0.02, 0.2]:
+                        worker_monitor.record_request('api.place_order', 200, request_time)
+                    worker_monitor.metrics['error_counts']['OperationalError'] = 1
+                    worker_shared.ensure_worker()
+                    worker_shared.flush()
+                    os.write(ready_write, b'1')
+                    time.sleep(30)
+                finally:
+                    os._exit(0)
+            
+            try:
+                assert os.read(ready_read, 1) == b'1'
+                monitor = PerformanceMonitor()
+                shared = SharedMetrics()
+                shared.init_app(app, monitor)
+                monitor.record_request('api.place_order', 200, 0.04)
+                monitor.record_request('menu', 500, 0.5)
+                
+                report = shared.get_node_report()
+                assert sorted(worker['pid'] for worker in report['workers']) == sorted([os.getpid(), child])
+                assert report['total_requests'] == 5
+                orders = report['endpoints']['api.place_order']['2xx']
+                assert orders['count'] == 4
+                assert orders['max'] == pytest.approx(0.2)
+                assert orders['p50'] == pytest.approx(0.02, rel=0.04)
+                assert report['endpoints']['menu']['5xx']['count'] == 1
+                assert report['errors'] == {'OperationalError': 1}
+            finally:
+                os.kill(child, 9)
+                os.waitpid(child, 0)
+                os.close(ready_read)
+                os.close(ready_write)
+            
+            report = shared.get_node_report()
+            assert [worker['pid'] for worker in report['workers']] == [os.getpid()]
+            assert report['total_requests'] == 2
+    
+    def test_shared_metrics_layout_change_keeps_old_file(self, app):
+        """Test a worker with another layout maps its own file instead of resizing the live one"""
+        with tempfile.TemporaryDirectory() as shared_dir:
+            app.config.update(METRICS_SHARED_PATH=os.path.join(shared_dir, 'metrics'), METRICS_SHARED_SLOTS=2,
+                              METRICS_SHARED_KEYS=4, METRICS_SHARED_INTERVAL=60)
+            old_monitor = PerformanceMonitor()
+            old_shared = SharedMetrics()
+            old_shared.init_app(app, old_monitor)
+            old_monitor.record_request('menu', 200, 0.01)
+            old_shared.ensure_worker()
+            old_size = os.path.getsize(old_shared.layout_path)
+            
+            app.config['METRICS_SHARED_KEYS'] = 8
+            new_shared = SharedMetrics()
+            new_shared.init_app(app, PerformanceMonitor())
+            new_shared.ensure_worker()
+            
+            assert new_shared.layout_path != old_shared.layout_path
+            assert os.path.getsize(old_shared.layout_path) == old_size
+            assert old_shared.get_node_report()['total_requests'] == 1
+            
+            with open(new_shared.layout_path, 'r+b') as f:
+                f.truncate(new_shared.file_size - 1)
+            broken = SharedMetrics()
+            broken.init_app(app, PerformanceMonitor())
+            broken.ensure_worker()
+            assert broken.read_workers() == []
+            assert os.path.getsize(new_shared.layout_path) == new_shared.file_size - 1
+    
+    def test_metrics_exposition(self, app):
+        """Test /metrics text covers requests, cache, sockets, backups and the DB pool"""
+        exporter = MetricsExporter()
+        exporter.init_app(app)
+        monitor = PerformanceMonitor()
+        for request_time in [0.004, 0.02, 0.3]:
+            monitor.record_request('api.place_order', 200, request_time)
+        monitor.record_request('api.place_order', 500, 1.2)
+        monitor.metrics['error_counts']['OperationalError'] = 2
+        
+        with app.app_context(), patch('monitoring.performance_monitor', monitor):
+            cache_manager.set('menu_items', ['pad thai'])
+            cache_manager.get('menu_items')
+            text = exporter.render()
+        
+        samples = {}
+        for line in text.splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        
+        labels = 'endpoint="api.place_order",status="2xx"'
+        assert '# TYPE lanaim_http_request_duration_seconds histogram' in text
+        assert samples[f'lanaim_http_request_duration_seconds_bucket{{{labels},le="0.005"}}'] == 1
+        assert samples[f'lanaim_http_request_duration_seconds_bucket{{{labels},le="0.5"}}'] == 3
+        assert samples[f'lanaim_http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 3
+        assert samples[f'lanaim_http_request_duration_seconds_sum{{{labels}}}'] == pytest.approx(0.324)
+        assert samples['lanaim_http_requests_total{endpoint="api.place_order",status="5xx"}'] == 1
+        assert samples['lanaim_http_errors_total{type="OperationalError"}'] == 2
+        assert samples['lanaim_cache_hits_total{namespace="menu_items"}'] >= 1
+        assert samples['lanaim_socket_connections{role="all"}'] >= 0
+        assert 'lanaim_backup_count' in samples
+        assert any(name.startswith('lanaim_db_pool_info') for name in samples)
+        assert samples['lanaim_metrics_collector_errors_total'] == 0
+    
+    def test_metrics_token(self, app):
+        """Test /metrics requires the bearer token once one is configured"""
+        exporter = MetricsExporter()
+        app.config['METRICS_AUTH_TOKEN'] = 'scrape-secret'
+        exporter.init_app(app)
+        
+        with app.test_request_context(headers={'Authorization': 'Bearer scrape-secret'}):
+            from flask import request
+            assert exporter.is_authorized(request)
+        with app.test_request_context():
+            assert not exporter.is_authorized(request)
+    
+    def test_metrics_loopback_only_without_token(self, app):
+        """Test /metrics without a token only answers direct local requests"""
+        from flask import request
+        exporter = MetricsExporter()
+        app.config['METRICS_AUTH_TOKEN'] = None
+        exporter.init_app(app)
+        
+        with app.test_request_context(environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+            assert exporter.is_authorized(request)
+        with app.test_request_context(environ_base={'REMOTE_ADDR': '127.0.0.1'},
+                                      headers={'X-Forwarded-For': '203.0.113.7'}):
+            assert not exporter.is_authorized(request)
+        with app.test_request_context(environ_base={'REMOTE_ADDR': '203.0.113.7'}):
+            assert not exporter.is_authorized(request)
+    
+    def test_failing_collector_leaves_no_partial_family(self, app):
+        """Test a collector that raises midway contributes nothing to the scrape"""
+        exporter = MetricsExporter()
+        exporter.init_app(app)
+        
+        def broken_collector(writer, source):
+            writer.family('lanaim_cache_hits_total', 'counter', 'Cache hits')
+            writer.sample('lanaim_cache_hits_total', 1, namespace='menu_items')
+            raise RuntimeError('stats unavailable')
+        
+        with app.app_context(), patch.object(exporter, '_collect_cache', broken_collector):
+            text = exporter.render()
+        
+        assert 'lanaim_cache_hits_total' not in text
+        assert 'lanaim_http_requests_total' in text
+        assert 'lanaim_metrics_collector_errors_total 1' in text
+
+
+class TestSQLiteProfile:
+    """Test SQLite pragmas and locked-write retries"""
+    
+    def test_pragmas_applied_to_new_connections(self):
+        """Test every pooled connection to a file database gets the pragmas"""
+        from flask import Flask
+        from models import db
+        
+        with tempfile.TemporaryDirectory() as db_dir:
+            app = Flask(__name__)
+            app.config.update(
+                SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(db_dir, 'profile.db')}",
+                SQLALCHEMY_ENGINE_OPTIONS=sqlite_engine_options(pool_size=2),
+                SQLITE_PRAGMAS={'cache_size': -1000}
+            )
+            db.init_app(app)
+            profile = SQLiteProfile()
+            profile.init_app(app, db)
+            
+            with app.app_context():
+                assert db.engine.pool.size() == 2
+                with db.engine.connect() as first, db.engine.connect() as second:
+                    for conn in (first, second):
+                        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+                        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1  # NORMAL
+                        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+                        assert conn.exec_driver_sql('PRAGMA temp_store').scalar() == 2  # MEMORY
+                        assert conn.exec_driver_sql('PRAGMA cache_size').scalar() == -1000
+                db.engine.dispose()
+            
+            assert profile.enabled
+            assert profile.stats['connections'] == 2
+            assert profile.stats['pragma_errors'] == 0
+    
+    @patch('sqlite_profile.time.sleep')
+    def test_retry_on_locked(self, mock_sleep, app):
+        """Test locked writes are retried with backoff, other errors are not"""
+        import sqlite3
+        from sqlalchemy.exc import OperationalError
+        
+        def error(message):
+            return OperationalError('INSERT INTO orders', {}, sqlite3.OperationalError(message))
+        
+        profile = SQLiteProfile()
+        attempts = []
+        
+        @profile.retry_on_locked
+        def place_order():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise error('database is locked')
+            return 'placed'
+        
+        with app.test_request_context('/menu'):
+            before = performance_monitor.connections.lock_retries['menu']
+            assert place_order() == 'placed'
+            assert performance_monitor.connections.lock_retries['menu'] == before + 2
+        assert len(attempts) == 3
+        assert profile.stats['retries'] == 2
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        assert 0.025 <= delays[0] <= 0.05 and 0.05 <= delays[1] <= 0.1
+        
+        @profile.retry_on_locked
+        def no_such_table():
+            raise error('no such table: orders')
+        
+        with pytest.raises(OperationalError):
+            no_such_table()
+        assert profile.stats['retries'] == 2
+        
+        profile.max_retries = 1
+        
+        @profile.retry_on_locked
+        def always_locked():
+            raise error('database is locked')
+        
+        with pytest.raises(OperationalError):
+            always_locked()
+        assert profile.stats['gave_up'] == 1
+    
+    def test_production_engine_options_for_sqlite(self):
+        """Test the SQLite default drops the server-style pool options"""
+        from config_production import ProductionConfig
+        
+        if ProductionConfig.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+            options = ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS
+            assert options['pool_size'] <= 5
+            assert 'pool_pre_ping' not in options
+            assert options['connect_args']['check_same_thread'] is False
+
 
 class TestBackupManager:
     """Test backup manager functionality"""
@@ -5,7 +5,7 @@ Unit tests for Flask routes and view functions
 
 import pytest
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from io import BytesIO
 
 from models import User, Menu, Order, OrderItem, DeliveryZone, db
@@ -329,6 +329,149 @@ class TestAPIRoutes:
             assert data['order_id'] == order.id
 
 
+class TestOrderPlacement:
+    """Test the order endpoints write the order, items and options"""
+    
+    @pytest.fixture
+    def spice_options(self, app):
+        """Two option items on the first active menu"""
+        from models import MenuOptionGroup, MenuOptionItem
+        
+        with app.app_context():
+            menu = Menu.query.filter_by(is_active=True).first()
+            group = MenuOptionGroup(menu_id=menu.id, name='ระดับความเผ็ด')
+            db.session.add(group)
+            db.session.flush()
+            option_items = [
+                MenuOptionItem(group_id=group.id, name='เผ็ดน้อย', additional_price=0),
+                MenuOptionItem(group_id=group.id, name='ไข่ดาว', additional_price=10)
+            ]
+            db.session.add_all(option_items)
+            db.session.commit()
+            return menu.id, [option_item.id for option_item in option_items]
+    
+    def test_customer_place_order(self, app, client, spice_options):
+        """Test /api/place-order saves the basket with an order number"""
+        from models import OrderItemOption
+        from routes.customer import customer_bp
+        
+        app.register_blueprint(customer_bp, url_prefix='/shop')
+        menu_id, option_ids = spice_options
+        with client.session_transaction() as sess:
+            sess['cart'] = [
+                {'menu_id': menu_id, 'quantity': 2, 'options': [{'id': option_id} for option_id in option_ids]},
+                {'menu_id': menu_id, 'quantity': 1, 'options': [], 'special_requests': 'ไม่ใส่ผัก'}
+            ]
+        
+        response = client.post('/shop/api/place-order', json={
+            'customer_name': 'ลูกค้าทดสอบ',
+            'customer_phone': '0812345678',
+            'delivery_address': '123 ถนนทดสอบ',
+            'special_instructions': 'โทรก่อนส่ง',
+            'payment_method': 'TOD'
+        })
+        data = assert_valid_json_response(response)
+        assert data['success'] is True, data
+        
+        with app.app_context():
+            order = db.session.get(Order, data['order_id'])
+            assert order.order_number.startswith('LA')
+            assert order.payment_method == 'TOD'
+            assert 'โทรก่อนส่ง' in order.delivery_address_details
+            assert sorted(item.quantity for item in order.items) == [1, 2]
+            assert OrderItemOption.query.join(OrderItem).filter(OrderItem.order_id == order.id).count() == 2
+            assert float(order.total_price) == data['total_price']
+    
+    def test_order_system_place_order(self, app, client, spice_options):
+        """Test /api/order/place saves the basket with an order number"""
+        from models import OrderItemOption
+        from order_system import order_bp
+        
+        app.register_blueprint(order_bp)
+        menu_id, option_ids = spice_options
+        with app.app_context():
+            zone_id = DeliveryZone.query.filter_by(is_active=True).first().id
+        with client.session_transaction() as sess:
+            sess['cart'] = {
+                'items': [{
+                    'menu_id': menu_id,
+                    'menu_name': 'ผัดไทยกุ้ง',
+                    'menu_price': 120.0,
+                    'quantity': 1,
+                    'options': [{'id': option_ids[1], 'name': 'ไข่ดาว', 'price': 10.0}],
+                    'total_price': 130.0,
+                    'special_instructions': 'ไม่ใส่ถั่ว'
+                }],
+                'zone_id': zone_id
+            }
+        
+        response = client.post('/api/order/place', json={
+            'customer': {'name': 'ลูกค้าทดสอบ', 'phone': '0812345678', 'address': '123 ถนนทดสอบ'},
+            'payment': {'method': 'cod'}
+        })
+        data = assert_valid_json_response(response, 201)
+        
+        with app.app_context():
+            order = Order.query.filter_by(order_number=data['order']['order_number']).one()
+            assert order.order_number.startswith('LA')
+            assert order.payment_method == 'COD'
+            assert order.delivery_zone_id == zone_id
+            assert [item.special_requests for item in order.items] == ['ไม่ใส่ถั่ว']
+            assert [option.option_name for option in OrderItemOption.query.join(OrderItem).filter(OrderItem.order_id == order.id)] == ['ไข่ดาว']
+            assert float(order.total_price) == data['order']['total_amount']
+
+
+class TestDeliveryDashboard:
+    """Test the delivery dashboard statistics"""
+    
+    def test_delivered_today_uses_thai_day_in_sql(self, app, client):
+        """Test delivered-today count and total come from one aggregate over the Thai day"""
+        from types import SimpleNamespace
+        from unittest.mock import patch
+        from flask import jsonify
+        from sqlalchemy import event
+        from routes.staff import staff_bp
+        from time_windows import TimeWindow
+        
+        app.config['LOGIN_DISABLED'] = True
+        app.register_blueprint(staff_bp, url_prefix='/staff')
+        with app.app_context():
+            today = TimeWindow.today()
+            for n, (status, updated) in enumerate([
+                ('delivered', today.start),
+                ('delivered', today.end - timedelta(microseconds=1)),
+                ('delivered', today.start - timedelta(seconds=1)),
+                ('ready', today.start)
+            ]):
+                db.session.add(Order(
+                    order_number=f"DLV-{n}", customer_name='Delivery Test', customer_phone='0811111111',
+                    delivery_address_details='Test', total_price=100 + n, payment_method='COD',
+                    status=status, last_updated_at=updated
+                ))
+            db.session.commit()
+        
+        statements = []
+        count = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            with patch('routes.staff.current_user', SimpleNamespace(role='admin')), \
+                 patch('routes.staff.render_template', side_effect=lambda template, **context: jsonify(context['stats'])):
+                response = client.get('/staff/delivery')
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', count)
+        
+        stats = assert_valid_json_response(response)
+        assert stats['delivered_today'] == 2
+        assert stats['total_today'] == 201
+        # Delivered orders are aggregated in SQL on a range of last_updated_at, never loaded
+        delivered = [statement for statement, parameters in statements if 'delivered' in parameters]
+        assert len(delivered) == 1
+        assert 'count(' in delivered[0] and 'sum(' in delivered[0]
+        assert 'orders.last_updated_at >= ?' in delivered[0]
+
+
 class TestFileUpload:
     """Test file upload functionality"""
     
@@ -0,0 +1,99 @@
+"""
+Time Window Queries
+Half-open [start, end) datetime bounds in restaurant local time for date filters
+
+Filtering with func.date(Order.created_at) == today wraps the column in a
+function, so SQLite scans every order instead of using the created_at
+indexes. A TimeWindow compares the bare column against two datetimes:
+
+    Order.query.filter(TimeWindow.today().filter(Order.created_at))
+"""
+
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import and_
+
+from models import THAI_TZ, get_thai_now
+
+def local_date(value=None):
+    """Restaurant-local date of a date, a datetime, or now"""
+    if value is None:
+        return get_thai_now().date()
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(THAI_TZ)
+        return value.date()
+    return value
+
+def local_midnight(day):
+    """Start of a restaurant-local day"""
+    return datetime.combine(local_date(day), time.min, tzinfo=THAI_TZ)
+
+class TimeWindow:
+    """A [start, end) span of restaurant-local time"""
+    
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+    
+    @classmethod
+    def for_day(cls, day=None):
+        """One local day, today by default"""
+        start = local_midnight(day)
+        return cls(start, start + timedelta(days=1))
+    
+    @classmethod
+    def today(cls):
+        return cls.for_day()
+    
+    @classmethod
+    def for_dates(cls, first_day, last_day):
+        """From the start of first_day to the end of last_day, both included"""
+        return cls(local_midnight(first_day), local_midnight(last_day) + timedelta(days=1))
+    
+    @classmethod
+    def last_days(cls, days, until=None):
+        """The last `days` local days ending with until (today by default)"""
+        last_day = local_date(until)
+        return cls.for_dates(last_day - timedelta(days=days - 1), last_day)
+    
+    @classmethod
+    def for_week(cls, day=None):
+        """Monday to Sunday week containing day"""
+        day = local_date(day)
+        start = local_midnight(day - timedelta(days=day.weekday()))
+        return cls(start, start + timedelta(days=7))
+    
+    @classmethod
+    def for_month(cls, day=None):
+        """Calendar month containing day"""
+        day = local_date(day)
+        first = day.replace(day=1)
+        following = (first + timedelta(days=32)).replace(day=1)
+        return cls(local_midnight(first), local_midnight(following))
+    
+    def previous(self):
+        """Window of the same length ending where this one starts"""
+        return TimeWindow(self.start - (self.end - self.start), self.start)
+    
+    def filter(self, column):
+        """SQL condition column >= start AND column < end"""
+        return and_(column >= self.start, column < self.end)
+    
+    def contains(self, value):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=THAI_TZ)
+        return self.start <= value < self.end
+    
+    def dates(self):
+        """Local dates covered by the window"""
+        day = self.start.date()
+        while local_midnight(day) < self.end:
+            yield day
+            day += timedelta(days=1)
+    
+    def __eq__(self, other):
+        return isinstance(other, TimeWindow) and (self.start, self.end) == (other.start, other.end)
+    
+    def __repr__(self):
+        return f'<TimeWindow {self.start.isoformat()} - {self.end.isoformat()}>'